@@ -0,0 +1,309 @@
+""" Benchmarks for the twiddler RPC interface and the STDIN result handler.
+
+Usage: python -m supervisor_twiddler.benchmark [options]
+
+By default the interface is called directly, in this process, with a real
+Supervisor instance that is never run.  With --serverurl, the methods are
+called over XML-RPC on a running supervisord instead, such as one listening
+on unix:///tmp/supervisor.sock.  The programs added by the benchmark have
+autostart turned off and no log files so that nothing is started or written
+to disk.
+
+For each group size, the benchmark adds that many programs to a new group,
+then lists the groups, then removes all of the processes, and reports the
+latency percentiles and throughput of each operation.  Latencies of adds
+and removes show how the cost of each call grows with the size of the group.
+
+For each group size, it also compares the cost of encoding and decoding a
+call to addProgramsToGroup() with that many programs, and a result of
+getProcessInventory() with that many processes, as XML-RPC and as JSON in
+one XML-RPC string for twiddler.callJSON().  Both the client and the server
+side are included, using the same functions as supervisord.
+"""
+
+import json
+import os
+import platform
+import sys
+import time
+
+timer = getattr(time, 'perf_counter', time.time)
+
+DEFAULT_SIZES = (10, 100, 1000, 10000)
+MAX_SIZE = 50000
+GROUP_NAME = 'twiddler_benchmark'
+PROGRAM_OPTIONS = {'command': '/bin/cat',
+                   'autostart': 'false',
+                   'autorestart': 'false',
+                   'stdout_logfile': 'NONE',
+                   'stderr_logfile': 'NONE'}
+
+class LocalTarget:
+    """ Calls the twiddler interface directly on a Supervisor instance
+    in this process. """
+    name = 'local'
+
+    def __init__(self):
+        from supervisor.loggers import getLogger, LevelsByName
+        from supervisor.options import ServerOptions
+        from supervisor.supervisord import Supervisor
+        from supervisor_twiddler.rpcinterface import TwiddlerNamespaceRPCInterface
+        options = ServerOptions()
+        options.logger = getLogger(LevelsByName.CRIT)
+        self.supervisord = Supervisor(options)
+        self.twiddler = TwiddlerNamespaceRPCInterface(self.supervisord)
+
+class RemoteTarget:
+    """ Calls the twiddler interface on a running supervisord over
+    XML-RPC. """
+    name = 'remote'
+
+    def __init__(self, serverurl, username=None, password=None):
+        from supervisor.compat import xmlrpclib
+        from supervisor.xmlrpc import SupervisorTransport
+        transport = SupervisorTransport(username, password, serverurl)
+        # the url is ignored by the transport for unix sockets
+        if serverurl.startswith('unix://'):
+            serverurl = 'http://127.0.0.1'
+        proxy = xmlrpclib.ServerProxy(serverurl, transport)
+        self.twiddler = proxy.twiddler
+
+def percentile(sorted_values, fraction):
+    """ Return the value at fraction (0.0 to 1.0) of a sorted list using
+    the nearest rank method. """
+    if not sorted_values:
+        return 0.0
+    rank = int(round(fraction * (len(sorted_values) - 1)))
+    return sorted_values[rank]
+
+def summarize(operation, size, latencies, units=None):
+    """ Return a dict with the statistics of one operation.  latencies
+    is a list of seconds.  units is the number of units processed, such
+    as bytes, if throughput should be reported in those units instead
+    of operations. """
+    latencies = sorted(latencies)
+    total = sum(latencies)
+    count = len(latencies)
+    result = {'operation': operation,
+              'size': size,
+              'count': count,
+              'total_seconds': total,
+              'mean_ms': (total / count * 1000.0) if count else 0.0,
+              'p50_ms': percentile(latencies, 0.50) * 1000.0,
+              'p90_ms': percentile(latencies, 0.90) * 1000.0,
+              'p99_ms': percentile(latencies, 0.99) * 1000.0,
+              'max_ms': (latencies[-1] * 1000.0) if count else 0.0,
+              'ops_per_second': (count / total) if total else 0.0}
+    if units is not None:
+        result['units_per_second'] = (units / total) if total else 0.0
+    return result
+
+def bench_rpc(target, size, repeat=10):
+    """ Benchmark the RPC methods for a group of size processes.  Returns
+    a list of results. """
+    twiddler = target.twiddler
+    twiddler.addGroup(GROUP_NAME, 999)
+    try:
+        names = ['bench_%d' % i for i in range(size)]
+
+        latencies = []
+        for name in names:
+            start = timer()
+            twiddler.addProgramToGroup(GROUP_NAME, name, PROGRAM_OPTIONS)
+            latencies.append(timer() - start)
+        results = [summarize('addProgramToGroup', size, latencies)]
+
+        latencies = []
+        for i in range(repeat):
+            start = timer()
+            twiddler.getGroupNames()
+            latencies.append(timer() - start)
+        results.append(summarize('getGroupNames', size, latencies))
+
+        latencies = []
+        for name in reversed(names):
+            start = timer()
+            twiddler.removeProcessFromGroup(GROUP_NAME, name)
+            latencies.append(timer() - start)
+        results.append(summarize('removeProcessFromGroup', size, latencies))
+    finally:
+        twiddler.removeGroup(GROUP_NAME)
+    return results
+
+def bench_stdin(size, payload_size=1024):
+    """ Benchmark the STDIN result handler writing size payloads to a
+    process.  Returns a list of results. """
+    from supervisor_twiddler.resulthandler import make_stdin_write_handler
+    handler = make_stdin_write_handler()
+    process = _BenchProcess()
+    event = _BenchEvent(process)
+    response = b'STDIN:' + (b'x' * payload_size)
+
+    latencies = []
+    for i in range(size):
+        start = timer()
+        handler(event, response)
+        latencies.append(timer() - start)
+        process.dispatcher.input_buffer = b'' # as if written to the pipe
+    units = size * payload_size
+    return [summarize('stdin_write_handler', size, latencies, units)]
+
+def bench_encoding(size, repeat=10):
+    """ Benchmark encoding and decoding a request with size programs and a
+    response with size processes as XML-RPC and as JSON.  Returns a list of
+    results with the number of bytes sent as the units. """
+    from supervisor.compat import xmlrpclib
+    from supervisor.xmlrpc import supervisor_xmlrpc_handler, xmlrpc_marshal
+    handler = supervisor_xmlrpc_handler(None, [])
+
+    programs = [{'program_name': 'bench_%d' % i,
+                 'program_options': PROGRAM_OPTIONS} for i in range(size)]
+    params = (GROUP_NAME, programs)
+    inventory = {'total': size,
+                 'processes': [{'group': GROUP_NAME,
+                                'name': 'bench_%d' % i,
+                                'program': 'bench_%d' % i,
+                                'autostart': False,
+                                'command': PROGRAM_OPTIONS['command'],
+                                'pid': 0,
+                                'priority': 999,
+                                'spawnerr': '',
+                                'state': 0,
+                                'statename': 'STOPPED'} for i in range(size)]}
+
+    def xmlrpc_request():
+        data = xmlrpclib.dumps(params, 'twiddler.addProgramsToGroup')
+        handler.loads(data)
+        return len(data)
+
+    def json_request():
+        request = json.dumps({'jsonrpc': '2.0', 'id': 1, 'params': params,
+                              'method': 'addProgramsToGroup'},
+                             separators=(',', ':'))
+        data = xmlrpclib.dumps((request,), 'twiddler.callJSON')
+        json.loads(handler.loads(data)[0][0])
+        return len(data)
+
+    def xmlrpc_response():
+        data = xmlrpc_marshal(inventory)
+        xmlrpclib.loads(data)
+        return len(data)
+
+    def json_response():
+        response = json.dumps({'jsonrpc': '2.0', 'id': 1,
+                               'result': inventory}, separators=(',', ':'))
+        data = xmlrpc_marshal(response)
+        json.loads(xmlrpclib.loads(data)[0][0])
+        return len(data)
+
+    results = []
+    for operation, func in (('xmlrpc_request', xmlrpc_request),
+                            ('json_request', json_request),
+                            ('xmlrpc_response', xmlrpc_response),
+                            ('json_response', json_response)):
+        latencies = []
+        units = 0
+        for i in range(repeat):
+            start = timer()
+            units += func()
+            latencies.append(timer() - start)
+        results.append(summarize(operation, size, latencies, units))
+    return results
+
+def run(target, sizes=DEFAULT_SIZES, repeat=10, stdin=True, encoding=True):
+    """ Run the benchmarks and return a dict with the results. """
+    results = []
+    for size in sizes:
+        results.extend(bench_rpc(target, size, repeat))
+        if stdin:
+            results.extend(bench_stdin(size))
+        if encoding:
+            results.extend(bench_encoding(size, repeat))
+
+    from supervisor.options import VERSION
+    return {'target': target.name,
+            'python': platform.python_version(),
+            'supervisor': VERSION,
+            'platform': platform.platform(),
+            'results': results}
+
+def format_text(report):
+    """ Format a report from run() as a table """
+    lines = ['target: %(target)s  python: %(python)s  '
+             'supervisor: %(supervisor)s' % report,
+             '%-24s %7s %7s %10s %10s %10s %10s %12s' % (
+             'operation', 'size', 'count', 'p50 ms', 'p90 ms', 'p99 ms',
+             'max ms', 'ops/sec')]
+    for r in report['results']:
+        lines.append('%-24s %7d %7d %10.3f %10.3f %10.3f %10.3f %12.1f' % (
+            r['operation'], r['size'], r['count'], r['p50_ms'],
+            r['p90_ms'], r['p99_ms'], r['max_ms'], r['ops_per_second']))
+    return '\n'.join(lines)
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(
+        prog='python -m supervisor_twiddler.benchmark',
+        description='Benchmark supervisor_twiddler operations.')
+    parser.add_argument('--sizes', default=','.join(map(str, DEFAULT_SIZES)),
+        help='comma-separated group sizes (default: %(default)s)')
+    parser.add_argument('--repeat', type=int, default=10,
+        help='times to repeat getGroupNames() and encoding '
+             '(default: %(default)s)')
+    parser.add_argument('--serverurl',
+        help='benchmark a running supervisord at this url, '
+             'e.g. unix:///tmp/supervisor.sock')
+    parser.add_argument('--username', help='username for --serverurl')
+    parser.add_argument('--password', help='password for --serverurl')
+    parser.add_argument('--json', action='store_true',
+        help='write the results as JSON')
+    args = parser.parse_args(argv)
+
+    try:
+        sizes = [int(s) for s in args.sizes.split(',') if s.strip()]
+    except ValueError:
+        parser.error('sizes must be integers')
+    for size in sizes:
+        if not 0 < size <= MAX_SIZE:
+            parser.error('sizes must be from 1 to %d' % MAX_SIZE)
+
+    if args.serverurl:
+        target = RemoteTarget(args.serverurl, args.username, args.password)
+        stdin = False # the result handler runs inside supervisord
+    else:
+        target = LocalTarget()
+        stdin = True
+
+    report = run(target, sizes, args.repeat, stdin)
+    if args.json:
+        sys.stdout.write(json.dumps(report, indent=2, sort_keys=True))
+    else:
+        sys.stdout.write(format_text(report))
+    sys.stdout.write('\n')
+    return 0
+
+class _BenchProcess:
+    """ A process that is running and buffers what is written to STDIN """
+    def __init__(self):
+        self.config = _BenchConfig()
+        self.pid = os.getpid()
+        self.killing = False
+        self.dispatcher = _BenchDispatcher()
+        self.pipes = {'stdin': 0}
+        self.dispatchers = {0: self.dispatcher}
+
+    def write(self, chars):
+        self.dispatcher.input_buffer += chars
+
+class _BenchConfig:
+    name = 'bench'
+
+class _BenchDispatcher:
+    input_buffer = b''
+
+class _BenchEvent:
+    def __init__(self, process):
+        self.process = process
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,90 @@
+""" Helpers for the AUTO log files of processes added by twiddler.
+
+Supervisor's ProcessConfig.create_autochildlogs() creates an empty temporary
+file for each AUTO log when a process is added, whether or not the process
+is ever started, and nothing deletes the files when the process is removed.
+With many short-lived programs, that is two files created for every add and
+left behind after every remove.
+"""
+
+import binascii
+import errno
+import os
+import tempfile
+
+from supervisor.datatypes import Automatic
+
+from supervisor_twiddler.compat import basestring
+
+# log file options that may be AUTO, and their channels
+AUTO_LOG_CHANNELS = {
+    'stdout_logfile': 'stdout',
+    'stderr_logfile': 'stderr',
+    }
+
+def name_autochildlogs(config):
+    """ Give a process config names for its AUTO log files without creating
+    them.  The files are created by the process' loggers when it is spawned.
+    The names are like those of create_autochildlogs(), so supervisord
+    still deletes leftover files when it starts. """
+    for name, channel in AUTO_LOG_CHANNELS.items():
+        if getattr(config, name) is Automatic:
+            setattr(config, name, _make_name(config, channel))
+
+def inherit_autochildlogs(old_config, new_config):
+    """ Give a config that replaces another the names of the old config's
+    AUTO log files, so a process keeps its log files when its config is
+    replaced instead of getting new ones. """
+    for name, channel in AUTO_LOG_CHANNELS.items():
+        old_value = getattr(old_config, name)
+        if (getattr(new_config, name) is Automatic and
+                old_value is not Automatic and
+                is_autochildlog(old_config, channel, old_value)):
+            setattr(new_config, name, old_value)
+
+def remove_autochildlogs(process):
+    """ Close the log files of a stopped process and delete its AUTO log
+    files, including rotated backups.  Log files that were not AUTO are
+    left alone.  Returns the number of files deleted. """
+    for dispatcher in process.dispatchers.values():
+        for attr in ('normallog', 'capturelog', 'childlog'):
+            log = getattr(dispatcher, attr, None)
+            if log is not None:
+                for handler in log.handlers:
+                    handler.close()
+
+    config = process.config
+    removed = 0
+    for name, channel in AUTO_LOG_CHANNELS.items():
+        value = getattr(config, name)
+        if value is Automatic or not is_autochildlog(config, channel, value):
+            continue
+        backups = getattr(config, '%s_logfile_backups' % channel) or 0
+        filenames = [value] + ['%s.%d' % (value, i)
+                               for i in range(1, backups + 1)]
+        for filename in filenames:
+            try:
+                os.remove(filename)
+                removed += 1
+            except OSError as e:
+                if e.errno != errno.ENOENT:
+                    config.options.logger.warn(
+                        'twiddler: could not remove log %s: %s' % (filename, e))
+    return removed
+
+def is_autochildlog(config, channel, value):
+    """ Return True if value is AUTO or the name of an AUTO log file made
+    for config by create_autochildlogs() or name_autochildlogs() """
+    if value is Automatic:
+        return True
+    if not isinstance(value, basestring):
+        return False
+    prefix = '%s-%s---%s-' % (config.name, channel, config.options.identifier)
+    return os.path.basename(value).startswith(prefix)
+
+def _make_name(config, channel):
+    options = config.options
+    prefix = '%s-%s---%s-' % (config.name, channel, options.identifier)
+    directory = options.childlogdir or tempfile.gettempdir()
+    suffix = binascii.hexlify(os.urandom(6)).decode('ascii')
+    return os.path.join(directory, '%s%s.log' % (prefix, suffix))
@@ -0,0 +1,178 @@
+""" A client that calls twiddler methods on many supervisord instances.
+
+    from supervisor_twiddler.client import FleetClient
+    client = FleetClient(['unix:///tmp/supervisor.sock',
+                          'http://host2:9001'], concurrency=32)
+    for result in client.addProgramToGroup('group', 'foo', {'command': 'ls'}):
+        if not result.ok:
+            print(result.serverurl, result.fault_code, result.error)
+    client.close()
+
+Each supervisord is called with its own persistent connection.  Calls to
+different instances are made at the same time by up to concurrency threads.
+"""
+
+import socket
+import threading
+import time
+
+from supervisor.compat import httplib
+from supervisor.compat import xmlrpclib
+from supervisor.xmlrpc import SupervisorTransport
+
+from supervisor_twiddler.rpcinterface import Faults
+from supervisor_twiddler.rpcinterface import TwiddlerNamespaceRPCInterface
+
+# names of the twiddler methods, which are also methods of FleetClient
+METHOD_NAMES = frozenset([
+    name for name in dir(TwiddlerNamespaceRPCInterface)
+    if not name.startswith('_') and
+    callable(getattr(TwiddlerNamespaceRPCInterface, name))])
+
+# faults that mean the call was not made and can be tried again later
+RETRY_FAULTS = (Faults.RATE_LIMITED,)
+
+# errors that mean the connection failed and can be tried again
+CONNECTION_ERRORS = (socket.error, IOError, OSError, httplib.HTTPException,
+                     xmlrpclib.ProtocolError)
+
+class HostResult:
+    """ The result of calling a method on one supervisord """
+    def __init__(self, serverurl):
+        self.serverurl = serverurl
+        self.value = None
+        self.fault_code = 0
+        self.fault_string = ''
+        self.error = ''
+        self.attempts = 0
+
+    @property
+    def ok(self):
+        return not (self.fault_code or self.error)
+
+    def __repr__(self):
+        if self.ok:
+            status = 'value=%r' % (self.value,)
+        elif self.fault_code:
+            status = 'fault=%d %s' % (self.fault_code, self.fault_string)
+        else:
+            status = 'error=%s' % self.error
+        return '<HostResult %s %s>' % (self.serverurl, status)
+
+class FleetClient:
+    """ Calls twiddler methods on many supervisord instances at once.
+    Every twiddler method is also a method of the client that calls it on
+    all of the instances and returns a list of HostResult objects in the
+    same order as serverurls.
+
+    Calls that fail because a connection could not be made or was lost,
+    or because they were rate limited, are tried again up to retries times
+    after waiting retry_delay seconds, doubled for each attempt.  A call
+    that changes things could have been made before its connection was
+    lost, so it is best to set coalesce_window on the servers.
+    """
+    def __init__(self, serverurls, username=None, password=None,
+                 concurrency=16, retries=2, retry_delay=0.5):
+        if concurrency < 1:
+            raise ValueError('concurrency must be at least 1')
+        self.serverurls = list(serverurls)
+        self.concurrency = concurrency
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self._hosts = {}
+        for serverurl in self.serverurls:
+            if serverurl not in self._hosts:
+                self._hosts[serverurl] = _Host(serverurl, username, password)
+
+    def __getattr__(self, name):
+        if name not in METHOD_NAMES:
+            raise AttributeError(name)
+        def call(*args):
+            return self.call(name, *args)
+        call.__name__ = name
+        return call
+
+    def call(self, method, *args):
+        """ Call a twiddler method with the same args on every instance """
+        return self.map(method, [args] * len(self.serverurls))
+
+    def map(self, method, args_list):
+        """ Call a twiddler method on every instance, with the args at the
+        same index in args_list for each one. """
+        if len(args_list) != len(self.serverurls):
+            raise ValueError('args_list must have args for each serverurl')
+        if method not in METHOD_NAMES:
+            raise ValueError('not a twiddler method: %s' % method)
+
+        results = [HostResult(serverurl) for serverurl in self.serverurls]
+        tasks = iter(list(zip(results, args_list)))
+        lock = threading.Lock()
+
+        def work():
+            while True:
+                with lock:
+                    try:
+                        result, args = next(tasks)
+                    except StopIteration:
+                        return
+                self._callHost(result, method, args)
+
+        num_threads = min(self.concurrency, len(results))
+        if num_threads == 1:
+            work()
+        else:
+            threads = [threading.Thread(target=work)
+                       for i in range(num_threads)]
+            for thread in threads:
+                thread.daemon = True
+                thread.start()
+            for thread in threads:
+                thread.join()
+        return results
+
+    def close(self):
+        """ Close all of the connections """
+        for host in self._hosts.values():
+            host.close()
+
+    def _callHost(self, result, method, args):
+        host = self._hosts[result.serverurl]
+        while True:
+            result.attempts += 1
+            retry = False
+            try:
+                result.value = host.call(method, args)
+                result.fault_code, result.fault_string, result.error = 0, '', ''
+            except xmlrpclib.Fault as e:
+                result.fault_code = e.faultCode
+                result.fault_string = e.faultString
+                retry = e.faultCode in RETRY_FAULTS
+            except CONNECTION_ERRORS as e:
+                host.close()
+                result.error = '%s: %s' % (e.__class__.__name__, e)
+                retry = True
+
+            if not retry or result.attempts > self.retries:
+                return
+            time.sleep(self.retry_delay * (2 ** (result.attempts - 1)))
+
+class _Host:
+    """ A persistent connection to one supervisord.  Calls are made one at
+    a time because the connection can only be used by one thread. """
+    def __init__(self, serverurl, username=None, password=None):
+        self.serverurl = serverurl
+        self.transport = SupervisorTransport(username, password, serverurl)
+        # the url is ignored by the transport for unix sockets
+        url = serverurl
+        if url.startswith('unix://'):
+            url = 'http://127.0.0.1'
+        self.proxy = xmlrpclib.ServerProxy(url, self.transport)
+        self.lock = threading.Lock()
+
+    def call(self, method, args):
+        with self.lock:
+            return getattr(self.proxy.twiddler, method)(*args)
+
+    def close(self):
+        with self.lock:
+            self.transport.close()
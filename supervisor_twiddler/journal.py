@@ -0,0 +1,82 @@
+import json
+import os
+
+class Journal:
+    """ An append-only journal of twiddler method calls.  Each call is
+    written as a line of JSON with a sequence number.  The journal can be
+    compacted into a snapshot, which is a list of calls that recreate the
+    current state, after which the journal starts over empty.
+
+    The snapshot records the sequence number of the last call it includes
+    so that calls left in the journal by an interrupted compaction are
+    not applied twice.
+    """
+    def __init__(self, path, compact_after=1000):
+        self.path = path
+        self.snapshot_path = path + '.snapshot'
+        self.compact_after = compact_after
+        self.sequence = 0
+        self.entries_since_compact = 0
+        self._file = None
+
+    def load(self):
+        """ Return a list of (method, args) tuples from the snapshot and
+        then the journal, in the order they should be replayed. """
+        calls = []
+        snapshot_sequence = 0
+
+        if os.path.exists(self.snapshot_path):
+            with open(self.snapshot_path, 'r') as f:
+                snapshot = json.load(f)
+            snapshot_sequence = snapshot['sequence']
+            for method, args in snapshot['calls']:
+                calls.append((method, args))
+        self.sequence = snapshot_sequence
+
+        if os.path.exists(self.path):
+            with open(self.path, 'r') as f:
+                for line in f:
+                    try:
+                        sequence, method, args = json.loads(line)
+                    except ValueError:
+                        # a partial line written when supervisord died
+                        break
+                    if sequence <= snapshot_sequence:
+                        continue
+                    calls.append((method, args))
+                    self.sequence = sequence
+                    self.entries_since_compact += 1
+        return calls
+
+    def append(self, method, args):
+        """ Append a call to the journal.  Returns True if the journal
+        is due to be compacted. """
+        if self._file is None:
+            self._file = open(self.path, 'a')
+        self.sequence += 1
+        self._file.write(json.dumps([self.sequence, method, list(args)]))
+        self._file.write('\n')
+        self._file.flush()
+        self.entries_since_compact += 1
+        return self.entries_since_compact >= self.compact_after
+
+    def compact(self, calls):
+        """ Replace the snapshot with a list of (method, args) calls that
+        recreate the current state and empty the journal. """
+        snapshot = {'sequence': self.sequence,
+                    'calls': [[method, list(args)] for method, args in calls]}
+        tmp_path = self.snapshot_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(snapshot, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.rename(tmp_path, self.snapshot_path)
+
+        self.close()
+        self._file = open(self.path, 'w')
+        self.entries_since_compact = 0
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
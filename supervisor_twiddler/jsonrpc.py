@@ -0,0 +1,161 @@
+""" JSON-RPC 2.0 requests for the twiddler methods, carried in one XML-RPC
+string by twiddler.callJSON().
+
+Supervisor's HTTP server has no way for an RPC interface to add a handler
+for another URL, so the JSON is sent as the only parameter of an XML-RPC
+call.  Marshalling one string is much cheaper than marshalling the nested
+structs and arrays of a large call, because XML-RPC only has to escape it.
+
+A request is an object or an array of objects (a batch) like:
+
+    {"jsonrpc": "2.0", "method": "addProgramToGroup",
+     "params": ["group", "foo", {"command": "ls"}], "id": 1}
+
+The params may be an array or an object of keyword arguments.  The
+response is an object, or an array with one for each request in a batch,
+with the result or an error whose code is the fault code the method would
+have returned over XML-RPC:
+
+    {"jsonrpc": "2.0", "result": true, "id": 1}
+    {"jsonrpc": "2.0", "error": {"code": 10, "message": "BAD_NAME: group"},
+     "id": 1}
+
+The calls in a batch are made in order, like system.multicall().  A
+request without an id is a notification: the call is made but it gets no
+response, and if every request is a notification the response is an empty
+string.
+"""
+
+import inspect
+import json
+import sys
+
+from supervisor.http import NOT_DONE_YET
+from supervisor.xmlrpc import Faults as SupervisorFaults
+from supervisor.xmlrpc import RPCError
+
+from supervisor_twiddler.compat import basestring
+
+def loads(data):
+    """ Parse a request.  Returns a list of requests and True if they were
+    sent as a batch.  Raises RPCError if the data is not a request. """
+    try:
+        request = json.loads(data)
+    except (TypeError, ValueError) as e:
+        raise RPCError(SupervisorFaults.INCORRECT_PARAMETERS,
+                       'invalid JSON: %s' % e)
+    if isinstance(request, list):
+        if not request:
+            raise RPCError(SupervisorFaults.INCORRECT_PARAMETERS,
+                           'empty batch')
+        return request, True
+    return [request], False
+
+def dumps(responses, batch):
+    """ Make a response from a list of response objects, or an empty
+    string if there are none because every request was a notification """
+    if not responses:
+        return ''
+    if batch:
+        return json.dumps(responses, separators=(',', ':'))
+    return json.dumps(responses[0], separators=(',', ':'))
+
+def make_call(interface, method_names, data):
+    """ Call the methods of interface in a request.  Returns the response,
+    or a deferred callback that returns NOT_DONE_YET until a method that
+    returned a deferred callback is done, like system.multicall(). """
+    requests, batch = loads(data)
+    remaining = list(requests)
+    callbacks = [] # (request, callback) for the call being waited on
+    responses = []
+
+    def call():
+        # if waiting on a callback, call it, then remove it if it's done
+        if callbacks:
+            request, callback = callbacks[0]
+            try:
+                value = callback()
+            except RPCError as e:
+                value = e
+            except:
+                value = _failed()
+            if value is not NOT_DONE_YET:
+                del callbacks[:]
+                _respond(responses, request, value)
+
+        # make calls in order until one returns a callback
+        while not callbacks and remaining:
+            request = remaining.pop(0)
+            try:
+                if not isinstance(request, dict):
+                    raise RPCError(SupervisorFaults.INCORRECT_PARAMETERS,
+                                   'request must be an object')
+                value = _call(interface, method_names, request)
+            except RPCError as e:
+                value = e
+            except:
+                value = _failed()
+
+            if callable(value):
+                callbacks.append((request, value))
+            else:
+                _respond(responses, request, value)
+
+        if callbacks or remaining:
+            return NOT_DONE_YET
+        return dumps(responses, batch)
+
+    value = call()
+    if value is not NOT_DONE_YET:
+        return value
+
+    call.delay = 0.05
+    call.rpcinterface = interface
+    return call # deferred
+
+def _call(interface, method_names, request):
+    name = request.get('method')
+    if not isinstance(name, basestring):
+        raise RPCError(SupervisorFaults.INCORRECT_PARAMETERS, 'no method')
+    if name not in method_names:
+        raise RPCError(SupervisorFaults.UNKNOWN_METHOD, name)
+    if name == 'callJSON':
+        raise RPCError(SupervisorFaults.INCORRECT_PARAMETERS,
+                       'recursive callJSON forbidden')
+
+    params = request.get('params', [])
+    if isinstance(params, list):
+        args, kwargs = params, {}
+    elif isinstance(params, dict):
+        args, kwargs = [], dict([(str(k), v) for k, v in params.items()])
+    else:
+        raise RPCError(SupervisorFaults.INCORRECT_PARAMETERS,
+                       'params must be an array or an object')
+
+    # check the params against the method's signature before calling it,
+    # so a TypeError raised inside the method is not mistaken for them
+    try:
+        inspect.getcallargs(getattr(interface.__class__, str(name)),
+                            interface, *args, **kwargs)
+    except TypeError:
+        raise RPCError(SupervisorFaults.INCORRECT_PARAMETERS)
+    return getattr(interface, str(name))(*args, **kwargs)
+
+def _failed():
+    info = sys.exc_info()
+    return RPCError(SupervisorFaults.FAILED, '%s:%s' % (info[0], info[1]))
+
+def _respond(responses, request, value):
+    """ Add the response to a request unless it is a notification.  A
+    request that is not an object can not be a notification. """
+    if not isinstance(request, dict):
+        responses.append(_response(None, value))
+    elif 'id' in request:
+        responses.append(_response(request['id'], value))
+
+def _response(request_id, value):
+    if isinstance(value, RPCError):
+        return {'jsonrpc': '2.0',
+                'error': {'code': value.code, 'message': value.text},
+                'id': request_id}
+    return {'jsonrpc': '2.0', 'result': value, 'id': request_id}
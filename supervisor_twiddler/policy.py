@@ -0,0 +1,117 @@
+import fnmatch
+import re
+import time
+
+from supervisor_twiddler.scheduler import TokenBucket
+
+# methods that do not change anything and are allowed in read-only mode
+READ_METHODS = frozenset([
+    'getAPIVersion',
+    'getGroupNames',
+    'getProcessInventory',
+    'getChangesSince',
+    'waitForProcessStates',
+    'getProgramTemplateNames',
+    'getMemoryReport',
+    'getStats',
+    'getPrometheusStats',
+    'validatePrograms',
+    ])
+
+# methods that only call other methods, which are checked themselves
+DISPATCH_METHODS = frozenset([
+    'callJSON',
+    ])
+
+def is_mutation(name):
+    """ Return True if a method changes the configuration """
+    return (name not in READ_METHODS and name not in DISPATCH_METHODS and
+            name != 'log')
+
+class Policy:
+    """ Decides which twiddler methods may be called and on which groups.
+    The rules are compiled once into a table with an entry for each method,
+    so checking a call is a dict lookup and at most two token buckets and
+    one regular expression match.  A method can have its own rate limit and
+    all of the methods that change things can share another.
+
+    check() and check_group() return None if a call is allowed or a tuple
+    of (fault_name, detail) if it is not, where fault_name is the name of
+    a fault in rpcinterface.Faults.
+    """
+    def __init__(self, method_names, whitelist=(), read_only=False,
+                 group_patterns=(), rate_limits=None, mutation_rate=0,
+                 mutation_burst=None, clock=time.time):
+        rate_limits = rate_limits or {}
+        for name in rate_limits:
+            if name not in method_names:
+                raise ValueError('rate limit for unknown method: %s' % name)
+
+        # one bucket shared by all of the methods that change things
+        mutation_bucket = None
+        if mutation_rate:
+            mutation_bucket = TokenBucket(mutation_rate, mutation_burst, clock)
+
+        # {method_name: (fault_name or None, [buckets])}
+        self.table = {}
+        for name in method_names:
+            if whitelist and name not in whitelist:
+                fault = 'NOT_IN_WHITELIST'
+            elif (read_only and name not in READ_METHODS and
+                    name not in DISPATCH_METHODS):
+                fault = 'READ_ONLY'
+            else:
+                fault = None
+            buckets = []
+            if mutation_bucket is not None and is_mutation(name):
+                buckets.append(mutation_bucket)
+            if name in rate_limits:
+                rate, burst = rate_limits[name]
+                buckets.append(TokenBucket(rate, burst, clock))
+            self.table[name] = (fault, buckets)
+
+        self.group_re = None
+        if group_patterns:
+            pattern = '|'.join(['(?:%s)' % fnmatch.translate(p)
+                                for p in group_patterns])
+            self.group_re = re.compile(pattern)
+
+    def check(self, func_name):
+        """ Check a call to a method """
+        fault, buckets = self.table.get(func_name, ('NOT_IN_WHITELIST', ()))
+        if fault is not None:
+            return (fault, func_name)
+        for bucket in buckets:
+            if not bucket.take():
+                return ('RATE_LIMITED', func_name)
+        return None
+
+    def check_group(self, group_name):
+        """ Check that a group may be used """
+        if self.group_re is not None and not self.group_re.match(group_name):
+            return ('GROUP_NOT_PERMITTED', 'group: %s' % group_name)
+        return None
+
+def parse_rate_limits(value):
+    """ Parse a string like 'addProgramToGroup:10,removeGroup:0.5:5' into
+    a dict of {method_name: (rate, burst)}.  The rate is calls per second
+    and the burst, which is optional, is how many calls may be made at once
+    (default: the rate, or 1 if the rate is less than 1). """
+    limits = {}
+    for item in value.split(','):
+        item = item.strip()
+        if not item:
+            continue
+        parts = item.split(':')
+        if len(parts) not in (2, 3):
+            raise ValueError('bad rate limit: %r' % item)
+        rate = float(parts[1])
+        if rate <= 0:
+            raise ValueError('bad rate limit: %r' % item)
+        burst = None
+        if len(parts) == 3:
+            burst = float(parts[2])
+            if burst < 1:
+                raise ValueError('bad rate limit: %r' % item)
+        limits[parts[0].strip()] = (rate, burst)
+    return limits
@@ -1,31 +1,296 @@
+import weakref
+
 from supervisor.dispatchers import RejectEvent
-from supervisor_twiddler.compat import unicode, basestring
+from supervisor_twiddler.compat import basestring, PY3
+from supervisor_twiddler.stats import Stats, timer, _escape
+
+DROP = 'drop'
+BLOCK = 'block'
+
+# timings of the results handled by all handlers, by the kind of result;
+# enabled by the twiddler interface when its stats option is on
+timings = Stats(enabled=False)
+
+# every handler that has been made, so the twiddler interface can report
+# and forget the bytes they have counted
+_handlers = weakref.WeakSet()
+
+# byte counters kept for each process; all but pending_bytes only grow
+BYTE_COUNTERS = ('queued_bytes', 'written_bytes', 'dropped_bytes',
+                 'blocked_bytes', 'pending_bytes')
 
-def stdin_write_handler(event, response):
+class StdinWriteHandler:
     """ A supervisor eventlistener result handler that accepts a
     special 'STDIN:' result and writes what follows to the STDIN
-    of the process associated with the event. """
-    if response.startswith("STDIN:"):
-        _stdin_write(event.process, response[6:])
-    elif response != 'OK':
-        raise RejectEvent(response)
+    of the process associated with the event.  The result may be bytes,
+    as it is from Supervisor 4, or text, which is encoded as UTF-8.
+    Payloads are written as raw bytes and are never decoded.
 
-def _stdin_write(process, chars):
-    """ Write chars to the stdin of process.  If the process is
-    not running or another error occurs, there is not anything we
-    can do so just return False. """
-    if isinstance(chars, unicode):
-        chars = chars.encode('utf-8')
+    The bytes are added to the process' STDIN buffer, which supervisord
+    drains as the pipe becomes writable.  If high_water is not zero and
+    the buffer would grow beyond high_water bytes, the policy decides
+    what happens: DROP discards the bytes and BLOCK rejects the event
+    so that supervisord buffers it and sends it to the listener again.
+    A payload is always accepted when the buffer is empty, so one that is
+    larger than high_water can still be written.
+
+    A 'STDINS:' result carries many payloads in frames.  Each frame is a
+    header line with a target and a length in bytes, followed by exactly
+    that many bytes of payload:
+
+      STDINS:- 6\nfoobarworker_2 3\nbaz
+
+    The target '-' is the process associated with the event; any other
+    target is the name of a process in the same group.  Payloads for the
+    same target are joined so each process is written to only once.
+    """
+    def __init__(self, high_water=0, policy=DROP):
+        if policy not in (DROP, BLOCK):
+            raise ValueError('policy must be %r or %r' % (DROP, BLOCK))
+        self.high_water = high_water
+        self.policy = policy
+
+        # counters by process name: {name: {counter_name: int}}
+        self.stats = {}
+        _handlers.add(self)
+
+    def __call__(self, event, response):
+        if not isinstance(response, bytes):
+            response = response.encode('utf-8')
+        if not timings.enabled:
+            return self._handle(event, response)
+
+        if response.startswith(b'STDINS:'):
+            kind = 'STDINS'
+        elif response.startswith(b'STDIN:'):
+            kind = 'STDIN'
+        elif response == b'OK':
+            kind = 'OK'
+        else:
+            kind = 'other'
+        start = timer()
+        try:
+            self._handle(event, response)
+        except RejectEvent:
+            timings.record(kind, timer() - start, 'rejected')
+            raise
+        timings.record(kind, timer() - start)
+
+    def _handle(self, event, response):
+        if response.startswith(b'STDINS:'):
+            self.write_frames(event.process, response, 7)
+        elif response.startswith(b'STDIN:'):
+            self.write(event.process, _view(response, 6))
+        elif response != b'OK':
+            raise RejectEvent(response)
+
+    def write(self, process, chars):
+        """ Write chars to the stdin of process.  If the process is
+        not running or another error occurs, there is not anything we
+        can do so just return False. """
+        if not isinstance(chars, (bytes, memoryview)):
+            if not isinstance(chars, basestring):
+                return False
+            chars = chars.encode('utf-8')
+
+        stats = self._get_stats(process)
+        self._count_written(process, stats)
+
+        if not process.pid or process.killing:
+            stats['dropped_bytes'] += len(chars)
+            return False
+
+        if self.high_water:
+            if _over_high_water(stats, chars, self.high_water):
+                if self.policy == BLOCK:
+                    stats['blocked_bytes'] += len(chars)
+                    raise RejectEvent(chars)
+                stats['dropped_bytes'] += len(chars)
+                return False
+
+        try:
+            process.write(chars)
+        except OSError:
+            stats['dropped_bytes'] += len(chars)
+            return False
 
-    if not isinstance(chars, basestring):
-        return False
+        stats['queued_bytes'] += len(chars)
+        stats['pending_bytes'] += len(chars)
+        self._count_written(process, stats)
+        return True
 
-    if not process.pid or process.killing:
-        return False
+    def write_frames(self, process, response, start=0):
+        """ Write the payloads in the frames of response, beginning at
+        start, to the stdin of process and the other processes in its
+        group.  Raises RejectEvent if the frames are malformed, or if the
+        policy is BLOCK and any of the targets is over the high water mark,
+        in which case nothing is written. """
+        if not isinstance(response, bytes):
+            response = response.encode('utf-8')
+        try:
+            parsed = _parse_frames(response, start)
+        except ValueError:
+            raise RejectEvent(response)
 
-    try:
-        process.write(chars)
-    except OSError:
-        return False
+        targets = []
+        payloads = {}
+        for target_name, payload in parsed:
+            target = _find_target(process, target_name)
+            if target is None:
+                continue # process may have been removed
+            if target_name not in payloads:
+                targets.append((target_name, target))
+                payloads[target_name] = []
+            payloads[target_name].append(payload)
 
-    return True
+        writes = []
+        for name, target in targets:
+            chars = payloads[name]
+            if len(chars) == 1:
+                chars = chars[0]
+            else:
+                chars = b''.join(chars)
+            writes.append((target, chars))
+
+        if self.high_water and self.policy == BLOCK:
+            for target, chars in writes:
+                stats = self._get_stats(target)
+                self._count_written(target, stats)
+                if _over_high_water(stats, chars, self.high_water):
+                    stats['blocked_bytes'] += len(chars)
+                    raise RejectEvent(response)
+
+        for target, chars in writes:
+            self.write(target, chars)
+
+    def _get_stats(self, process):
+        name = process.config.name
+        stats = self.stats.get(name)
+        if stats is None:
+            stats = dict([(counter, 0) for counter in BYTE_COUNTERS])
+            self.stats[name] = stats
+        return stats
+
+    def _count_written(self, process, stats):
+        """ Count the bytes that have left the STDIN buffer since it
+        was last looked at. """
+        pending = _pending_stdin_bytes(process)
+        if pending < stats['pending_bytes']:
+            stats['written_bytes'] += stats['pending_bytes'] - pending
+        stats['pending_bytes'] = pending
+
+def _parse_frames(data, pos=0):
+    """ Parse the frames of a 'STDINS:' result, beginning at pos, into a
+    list of (target_name, payload) tuples.  The payloads are views of data
+    where possible.  Raises ValueError if the frames are malformed. """
+    frames = []
+    while pos < len(data):
+        eol = data.find(b'\n', pos)
+        if eol == -1:
+            raise ValueError('frame header has no newline')
+        header = data[pos:eol].split()
+        if len(header) != 2:
+            raise ValueError('frame header must be target and length')
+        target_name = header[0].decode('utf-8')
+        length = int(header[1])
+        start = eol + 1
+        end = start + length
+        if length < 0 or end > len(data):
+            raise ValueError('frame length is out of range')
+        frames.append((target_name, _view(data, start, end)))
+        pos = end
+    return frames
+
+def _view(data, start, end=None):
+    """ Return the bytes of data from start to end.  On Python 3 this is a
+    memoryview so that large payloads are not copied before they are added
+    to the STDIN buffer.  Python 2 can not add a memoryview to a str, so
+    it gets a slice. """
+    if end is None:
+        end = len(data)
+    if PY3:
+        return memoryview(data)[start:end]
+    return data[start:end]
+
+def _find_target(process, target_name):
+    """ Return the process that a frame targets or None if there is
+    no such process in the group of process. """
+    if target_name == '-':
+        return process
+    group = getattr(process, 'group', None)
+    if group is None:
+        return None
+    return group.processes.get(target_name)
+
+def _pending_stdin_bytes(process):
+    """ Return the number of bytes in the STDIN buffer of process
+    that have not yet been written to its pipe. """
+    pipes = process.pipes or {}
+    dispatchers = process.dispatchers or {}
+    dispatcher = dispatchers.get(pipes.get('stdin'))
+    if dispatcher is None:
+        return 0
+    return len(getattr(dispatcher, 'input_buffer', ''))
+
+def byte_stats():
+    """ Return the byte counters of all handlers by process name,
+    added together for processes written to by more than one handler """
+    totals = {}
+    for handler in list(_handlers):
+        for name, stats in list(handler.stats.items()):
+            total = totals.get(name)
+            if total is None:
+                totals[name] = dict(stats)
+            else:
+                for counter in BYTE_COUNTERS:
+                    total[counter] += stats[counter]
+    return totals
+
+def byte_stats_prometheus(prefix):
+    """ Return the counters of byte_stats() in the Prometheus text
+    format.  Metric names start with prefix.  Returns an empty string if
+    nothing has been counted. """
+    totals = byte_stats()
+    if not totals:
+        return ''
+    names = sorted(totals.keys())
+    lines = ['# TYPE %s_bytes_total counter' % prefix]
+    for name in names:
+        for counter in BYTE_COUNTERS[:-1]:
+            lines.append('%s_bytes_total{process="%s",result="%s"} %d' % (
+                prefix, _escape(name), counter[:-len('_bytes')],
+                totals[name][counter]))
+    lines.append('# TYPE %s_pending_bytes gauge' % prefix)
+    for name in names:
+        lines.append('%s_pending_bytes{process="%s"} %d' % (
+            prefix, _escape(name), totals[name]['pending_bytes']))
+    return '\n'.join(lines) + '\n'
+
+def forget_byte_stats(process_names):
+    """ Drop the byte counters of processes that no longer exist """
+    for handler in list(_handlers):
+        for name in process_names:
+            handler.stats.pop(name, None)
+
+def _over_high_water(stats, chars, high_water):
+    """ Return True if writing chars would take a STDIN buffer that is
+    not empty beyond high_water bytes """
+    pending = stats['pending_bytes']
+    return pending > 0 and pending + len(chars) > high_water
+
+def make_stdin_write_handler(high_water=0, policy=DROP):
+    """ Make a result handler like stdin_write_handler with a limit
+    on the bytes waiting to be written to the STDIN of each process. """
+    return StdinWriteHandler(high_water, policy)
+
+# writes are never limited, like earlier versions
+stdin_write_handler = StdinWriteHandler()
+
+# at most 1 MB may be waiting for each process; beyond that, data is
+# dropped or events are rejected and sent to the listener again later
+bounded_stdin_write_handler = StdinWriteHandler(1024 * 1024, DROP)
+blocking_stdin_write_handler = StdinWriteHandler(1024 * 1024, BLOCK)
+
+def _stdin_write(process, chars):
+    """ Write chars to the stdin of process using the default handler """
+    return stdin_write_handler.write(process, chars)
@@ -1,35 +1,407 @@
+import binascii
+import collections
+import copy
+import fnmatch
+import functools
+import itertools
+import json
+import os
+import platform
+import resource
+import sys
+import time
+
 from supervisor.options import UnhosedConfigParser
+from supervisor.options import ProcessConfig
+from supervisor.options import ProcessGroupConfig
+from supervisor.options import expand
+from supervisor.options import split_namespec
+from supervisor.datatypes import boolean
 from supervisor.datatypes import list_of_strings
+from supervisor.datatypes import integer
+from supervisor.datatypes import process_or_group_name
+from supervisor.datatypes import Automatic
+from supervisor.datatypes import RestartUnconditionally
+from supervisor.datatypes import RestartWhenExitUnexpected
 from supervisor.states import SupervisorStates
+from supervisor.states import ProcessStates
+from supervisor.states import getProcessStateDescription
 from supervisor.states import STOPPED_STATES
+from supervisor.states import RUNNING_STATES
 from supervisor.xmlrpc import Faults as SupervisorFaults
 from supervisor.xmlrpc import RPCError
+from supervisor.http import NOT_DONE_YET
+from supervisor import events
 import supervisor.loggers
 
+from supervisor_twiddler import childlogs
+from supervisor_twiddler.compat import basestring
+from supervisor_twiddler.journal import Journal
+from supervisor_twiddler.policy import Policy, parse_rate_limits, is_mutation
+from supervisor_twiddler.scheduler import SpawnScheduler
+from supervisor_twiddler.sharing import SharedValues
+from supervisor_twiddler.stats import Stats, BUCKET_BOUNDS
+from supervisor_twiddler import jsonrpc
+from supervisor_twiddler import resulthandler
+
 API_VERSION = '1.0'
 
 class Faults:
     NOT_IN_WHITELIST = 230
+    READ_ONLY = 231
+    GROUP_NOT_PERMITTED = 232
+    RATE_LIMITED = 233
+
+# fields that can be returned by getProcessInventory()
+INVENTORY_FIELDS = {
+    'state': lambda p: p.get_state(),
+    'statename': lambda p: getProcessStateDescription(p.get_state()),
+    'pid': lambda p: p.pid or 0,
+    'spawnerr': lambda p: p.spawnerr or '',
+    'command': lambda p: p.config.command,
+    'priority': lambda p: p.config.priority,
+    'autostart': lambda p: bool(p.config.autostart),
+    }
+
+# option values that are classes, as names that can be sent over XML-RPC
+OPTION_CLASS_NAMES = {
+    Automatic: 'AUTO',
+    RestartUnconditionally: 'true',
+    RestartWhenExitUnexpected: 'unexpected',
+    }
 
 class TwiddlerNamespaceRPCInterface:
     """ A supervisor rpc interface that facilitates manipulation of
     supervisor's configuration and state in ways that are not
     normally accessible at runtime.
     """
-    def __init__(self, supervisord, whitelist=[]):
+    def __init__(self, supervisord, whitelist=[], journal=None,
+                 journal_compact_after=1000, changes_buffer_size=1000,
+                 spawn_concurrency=0, spawn_group_concurrency=0,
+                 spawn_rate=0, stats=False, read_only=False,
+                 group_patterns='', rate_limits='', mutation_rate=0,
+                 mutation_burst=0, coalesce_window=0,
+                 lazy_autochildlogs=False, remove_autochildlogs=False):
         self.supervisord = supervisord
-        self._whitelist = list_of_strings(whitelist)
+
+        # which methods may be called, on which groups, and how often
+        method_names = [name for name in dir(self.__class__)
+                        if not name.startswith('_') and
+                        callable(getattr(self.__class__, name))]
+        self._method_names = frozenset(method_names)
+        self._policy = Policy(method_names,
+                              whitelist=list_of_strings(whitelist),
+                              read_only=boolean(read_only),
+                              group_patterns=list_of_strings(group_patterns),
+                              rate_limits=parse_rate_limits(rate_limits),
+                              mutation_rate=float(mutation_rate),
+                              mutation_burst=float(mutation_burst) or None)
+
+        # programs added by twiddler: {group_name: {program_name: info}}
+        # where info is a dict with the program options and the names of
+        # its processes that are still in the group
+        self._programs = {}
+
+        # program templates: {template_name: info} where info is a dict
+        # with the template options and the process config they parsed to
+        self._templates = {}
+
+        # changes to the configuration that are not programs added by
+        # twiddler, kept so they can be written to a journal snapshot
+        self._added_groups = {} # {group_name: priority}
+        self._removed_groups = set()
+        self._removed_processes = {} # {group_name: set(process_names)}
+
+        # option values shared by the process configs added by twiddler
+        self._shared = SharedValues()
+
+        # AUTO log files can be created when processes are spawned instead
+        # of when they are added, and deleted when they are removed
+        self._lazy_autochildlogs = boolean(lazy_autochildlogs)
+        self._remove_autochildlogs = boolean(remove_autochildlogs)
+
+        # limits on how quickly added processes with autostart are started
+        self._scheduler = None
+        spawn_concurrency = integer(spawn_concurrency)
+        spawn_group_concurrency = integer(spawn_group_concurrency)
+        spawn_rate = float(spawn_rate)
+        if spawn_concurrency or spawn_group_concurrency or spawn_rate:
+            self._scheduler = SpawnScheduler(supervisord, spawn_concurrency,
+                                             spawn_group_concurrency,
+                                             spawn_rate)
+
+        # work started by a deferred call that must finish even if the
+        # client stops waiting for it: functions that are called on process
+        # state changes, ticks, and polls of any deferred until they are done
+        self._watchers = []
+        self._notifying = False
+        self._subscribed = False
+
+        # generation is incremented by every call that changes something
+        # and the most recent changes are kept for getChangesSince()
+        self._instance = binascii.hexlify(os.urandom(8)).decode('ascii')
+        self._generation = 0
+        self._changes = collections.deque(maxlen=integer(changes_buffer_size))
+        self._delta = None
+
+        self._replaying = False
+        self._journal = None
+        if journal:
+            self._journal = Journal(journal, integer(journal_compact_after))
+            self._replayJournal()
+
+        # a call that changes things is not made again if it is the same as
+        # the last change and was made within the window.  methods are
+        # wrapped after the journal is replayed so replayed calls are not.
+        self._coalesce_window = float(coalesce_window)
+        self._last_change = None # (key, generation, time, result)
+        self._coalesced = 0
+        if self._coalesce_window:
+            for name in dir(self):
+                method = getattr(self, name)
+                if (not name.startswith('_') and callable(method) and
+                        is_mutation(name)):
+                    setattr(self, name, self._coalesceCalls(name, method))
+
+        # calls are only counted and timed when stats are on
+        self._stats = None
+        if boolean(stats):
+            self._stats = Stats()
+            for name in dir(self):
+                method = getattr(self, name)
+                if not name.startswith('_') and callable(method):
+                    setattr(self, name, self._stats.wrap(name, method))
+            resulthandler.timings.enabled = True
+
+    def _coalesceCalls(self, func_name, method):
+        """ Return a function that calls method, unless the call is the
+        same as the last change made and nothing has changed since, in which
+        case the result of that call is returned again.  This makes retries
+        of a call that succeeded harmless and cheap. """
+        def wrapper(*args, **kw):
+            try:
+                key = (func_name, json.dumps([args, kw], sort_keys=True))
+            except (TypeError, ValueError):
+                return method(*args, **kw)
+
+            now = time.time()
+            last = self._last_change
+            if (last is not None and last[0] == key and
+                    last[1] == self._generation and
+                    0 <= now - last[2] <= self._coalesce_window):
+                # a coalesced call is still refused in SHUTDOWN or by policy
+                self._update(func_name)
+                self._coalesced += 1
+                return last[3]
+
+            generation = self._generation
+            result = method(*args, **kw)
+            if self._generation != generation and not callable(result):
+                self._last_change = (key, self._generation, now, result)
+            return result
+        return functools.wraps(method)(wrapper)
 
     def _update(self, func_name):
         self.update_text = func_name
+        self._delta = {'added': [], 'changed': [], 'removed': []}
+
+        # calls replayed from the journal were allowed when first made
+        if self._replaying:
+            return
 
         state = self.supervisord.get_state()
         if state == SupervisorStates.SHUTDOWN:
             raise RPCError(SupervisorFaults.SHUTDOWN_STATE)
 
-        if len(self._whitelist):
-            if func_name not in self._whitelist:
-                raise RPCError(Faults.NOT_IN_WHITELIST, func_name)
+        denied = self._policy.check(func_name)
+        if denied is not None:
+            fault_name, detail = denied
+            raise RPCError(getattr(Faults, fault_name), detail)
+
+    def _checkGroupPermitted(self, group_name):
+        """ Raise GROUP_NOT_PERMITTED if the policy does not allow the
+        group to be used. """
+        if self._replaying:
+            return
+        denied = self._policy.check_group(group_name)
+        if denied is not None:
+            fault_name, detail = denied
+            raise RPCError(getattr(Faults, fault_name), detail)
+
+    def _record(self, func_name, *args):
+        """ Record a successful call to a method that changes the
+        configuration. """
+        if self._replaying:
+            return
+
+        self._addChange(func_name)
+
+        if self._journal is None:
+            return
+
+        try:
+            if self._journal.append(func_name, args):
+                self._journal.compact(self._makeSnapshot())
+        except (IOError, OSError) as e:
+            self.supervisord.options.logger.error(
+                'twiddler: could not write journal %s: %s' % (
+                self._journal.path, e))
+
+    def _addChange(self, func_name):
+        """ Increment the generation and remember what the call changed """
+        self._generation += 1
+        change = {'generation': self._generation, 'method': func_name}
+        change.update(self._delta)
+        self._changes.append(change)
+
+    def _replayJournal(self):
+        """ Replay the calls in the journal to restore the configuration
+        from before supervisord was restarted, then compact it. """
+        logger = self.supervisord.options.logger
+        try:
+            calls = self._journal.load()
+        except (IOError, OSError, ValueError, KeyError) as e:
+            logger.error('twiddler: could not read journal %s: %s' % (
+                self._journal.path, e))
+            return
+
+        self._replaying = True
+        try:
+            for func_name, args in calls:
+                try:
+                    getattr(self, func_name)(*args)
+                except (RPCError, AttributeError, TypeError) as e:
+                    # replay the programs of a batch one at a time so that
+                    # one that can't be added does not lose the others
+                    try:
+                        split = BATCH_REPLAY_CALLS[func_name](*args)
+                    except (KeyError, TypeError, AttributeError):
+                        logger.warn('twiddler: could not replay %s%r: %s' % (
+                            func_name, tuple(args), e))
+                        continue
+                    for call in split:
+                        self._replayCall(call[0], call[1:])
+        finally:
+            self._replaying = False
+
+        logger.info('twiddler: replayed %d calls from journal %s' % (
+            len(calls), self._journal.path))
+
+        try:
+            self._journal.compact(self._makeSnapshot())
+        except (IOError, OSError) as e:
+            logger.error('twiddler: could not write journal %s: %s' % (
+                self._journal.path, e))
+
+    def _replayCall(self, func_name, args):
+        """ Replay one call, logging it if it fails """
+        try:
+            getattr(self, func_name)(*args)
+        except (RPCError, AttributeError, TypeError) as e:
+            self.supervisord.options.logger.warn(
+                'twiddler: could not replay %s%r: %s' % (
+                    func_name, tuple(args), e))
+
+    def _makeSnapshot(self):
+        """ Return a list of (method, args) calls that would recreate
+        the current twiddled configuration from supervisord.conf. """
+        self._pruneRemoved()
+        calls = []
+        if self._removed_groups:
+            calls.append(('removeGroups', [sorted(self._removed_groups)]))
+        if self._added_groups:
+            groups = [{'group_name': name, 'priority': priority}
+                      for name, priority in sorted(self._added_groups.items())]
+            calls.append(('addGroups', [groups]))
+        for group_name, names in sorted(self._removed_processes.items()):
+            calls.append(('removeProcessesFromGroup',
+                          [group_name, sorted(names)]))
+        for template_name, template in sorted(self._templates.items()):
+            calls.append(('addProgramTemplate',
+                          [template_name, template['program_options']]))
+
+        # programs from templates that have since been removed or replaced
+        # are added from copies of the old templates, removed afterwards
+        old_templates = {} # {(template_name, options): snapshot name}
+        names = set(self._templates.keys())
+        for group_name, programs in sorted(self._programs.items()):
+            for program_name, info in sorted(programs.items()):
+                template_name = info['template_name']
+                if template_name is None:
+                    continue
+                template = self._templates.get(template_name)
+                if (template is not None and
+                        template['program_options'] == info['program_options']):
+                    continue
+                key = _templateKey(info)
+                if key in old_templates:
+                    continue
+                name = template_name
+                while name in names:
+                    name = '%s~%d' % (template_name, len(names))
+                names.add(name)
+                old_templates[key] = name
+                calls.append(('addProgramTemplate',
+                              [name, info['program_options']]))
+
+        for group_name, programs in sorted(self._programs.items()):
+            calls.extend(self._makeProgramsSnapshot(group_name, programs,
+                                                    old_templates))
+        for name in sorted(old_templates.values()):
+            calls.append(('removeProgramTemplate', [name]))
+        return calls
+
+    def _makeProgramsSnapshot(self, group_name, programs, old_templates):
+        """ Return a list of (method, args) calls that would add the
+        programs of a group, using one call for the programs added with
+        options and one for each template.  The programs are not parsed;
+        the process names they made when they were added are remembered. """
+        removed = [] # processes of the programs that have been removed
+        for program_name, info in sorted(programs.items()):
+            kept = set(info['process_names'])
+            removed.extend([n for n in info['all_process_names']
+                            if n not in kept])
+
+        # a program that has a process removed from another program must
+        # be added after the process is removed
+        removed_names = set(removed)
+        first, later = [], []
+        for program_name, info in sorted(programs.items()):
+            if removed_names.intersection(info['process_names']):
+                later.append((program_name, info))
+            else:
+                first.append((program_name, info))
+
+        calls = self._makeAddProgramsCalls(group_name, first, old_templates)
+        if removed:
+            calls.append(('removeProcessesFromGroup', [group_name, removed]))
+        calls.extend(self._makeAddProgramsCalls(group_name, later,
+                                                old_templates))
+        return calls
+
+    def _makeAddProgramsCalls(self, group_name, programs, old_templates):
+        """ Return calls that add a list of (program_name, info) """
+        calls = []
+        added = []
+        from_templates = {}
+        for program_name, info in programs:
+            template_name = info['template_name']
+            if template_name is not None:
+                template_name = old_templates.get(_templateKey(info),
+                                                  template_name)
+            if template_name is None:
+                added.append({'program_name': program_name,
+                              'program_options': info['program_options']})
+            else:
+                from_templates.setdefault(template_name, []).append(
+                    {'program_name': program_name,
+                     'overrides': info['overrides'] or {}})
+        if added:
+            calls.append(('addProgramsToGroup', [group_name, added]))
+        for template_name, added in sorted(from_templates.items()):
+            calls.append(('addProgramsFromTemplate',
+                          [group_name, template_name, added]))
+        return calls
 
     # RPC API methods
 
@@ -42,12 +414,342 @@ class TwiddlerNamespaceRPCInterface:
         return API_VERSION
 
     def getGroupNames(self):
-        """ Return an array with the names of the process groups.
+        """ Return an array with the names of the process groups that
+            may be used.
 
         @return array                Process group names
         """
         self._update('getGroupNames')
-        return list(self.supervisord.process_groups.keys())
+        return [name for name in self.supervisord.process_groups.keys()
+                if self._policy.check_group(name) is None]
+
+    def getProcessInventory(self, group_pattern='*', process_pattern='*',
+                            offset=0, limit=0, fields=[]):
+        """ Return a page of the processes in the process groups, sorted by
+            group name and then process name.  This is much smaller than
+            supervisor.getAllProcessInfo() when there are many processes.
+            Groups that the group_patterns option does not allow are left
+            out.
+
+        @param string  group_pattern    Only include groups whose names match
+                                        this glob pattern (default: *)
+        @param string  process_pattern  Only include processes whose names
+                                        match this glob pattern (default: *)
+        @param int     offset           Number of matching processes to skip
+        @param int     limit            Maximum processes to return (0=all)
+        @param array   fields           Names of the fields to return for each
+                                        process in addition to group, name,
+                                        and program (default: all fields)
+        @return struct                  Struct with keys total (the number of
+                                        matching processes) and processes (an
+                                        array of structs for this page)
+        """
+        self._update('getProcessInventory')
+
+        try:
+            offset = integer(offset)
+            limit = integer(limit)
+            if offset < 0 or limit < 0:
+                raise ValueError
+            if not fields:
+                fields = sorted(INVENTORY_FIELDS.keys())
+            getters = [(f, INVENTORY_FIELDS[f]) for f in fields]
+        except (ValueError, TypeError, KeyError):
+            raise RPCError(SupervisorFaults.INCORRECT_PARAMETERS)
+        if self._scheduler is not None:
+            # queued processes have autostart turned off until released
+            getters = [(f, self._scheduler.autostart if f == 'autostart' else g)
+                       for f, g in getters]
+
+        # find the names of all matching processes
+        matches = []
+        for group_name in sorted(self.supervisord.process_groups.keys()):
+            if not fnmatch.fnmatchcase(group_name, group_pattern):
+                continue
+            if self._policy.check_group(group_name) is not None:
+                continue
+            group = self.supervisord.process_groups[group_name]
+            for process_name in sorted(group.processes.keys()):
+                if fnmatch.fnmatchcase(process_name, process_pattern):
+                    matches.append((group_name, process_name))
+
+        if limit:
+            page = matches[offset:offset + limit]
+        else:
+            page = matches[offset:]
+
+        # make structs only for the processes on this page
+        process_programs = {}
+        processes = []
+        for group_name, process_name in page:
+            if group_name not in process_programs:
+                process_programs[group_name] = self._getProcessPrograms(group_name)
+            process = self.supervisord.process_groups[group_name].processes[process_name]
+            info = {'group': group_name,
+                    'name': process_name,
+                    'program': process_programs[group_name].get(process_name, '')}
+            for field, getter in getters:
+                info[field] = getter(process)
+            processes.append(info)
+
+        return {'total': len(matches), 'processes': processes}
+
+    def getChangesSince(self, generation, instance=''):
+        """ Return the changes made through the twiddler interface after
+            a generation.  Each call that changes something increments the
+            generation.  Only the most recent changes are kept; if any
+            changes after the generation have been discarded, or supervisord
+            has restarted, resync will be true and the caller should read the
+            full state again.
+
+        @param int generation  Generation returned by a previous call (or 0)
+        @param string instance Instance returned by a previous call (or '')
+        @return struct         Struct with keys instance, generation (the
+                               current generation), resync (boolean), and
+                               changes (array of structs with keys generation,
+                               method, added, changed, and removed)
+        """
+        self._update('getChangesSince')
+
+        if not isinstance(generation, int) or generation < 0:
+            raise RPCError(SupervisorFaults.INCORRECT_PARAMETERS)
+        if not isinstance(instance, basestring):
+            raise RPCError(SupervisorFaults.INCORRECT_PARAMETERS)
+
+        if self._changes:
+            oldest = self._changes[0]['generation']
+        else:
+            oldest = self._generation + 1
+
+        result = {'instance': self._instance,
+                  'generation': self._generation,
+                  'resync': False,
+                  'changes': []}
+
+        if instance and instance != self._instance:
+            result['resync'] = True
+        elif generation > self._generation or generation < oldest - 1:
+            result['resync'] = True
+        else:
+            skip = len(self._changes) - (self._generation - generation)
+            result['changes'] = list(
+                itertools.islice(self._changes, skip, None))
+        return result
+
+    def waitForProcessStates(self, names, state_names, timeout=60):
+        """ Wait until each process has been seen in one of the states, or
+            until the timeout.  This does not return until all of the
+            processes have reached the states or the timeout has passed,
+            so there is no need to poll supervisor.getProcessInfo().
+
+        @param array   names        Process names ('group:name' or 'group:*')
+        @param array   state_names  Names of the states to wait for ('RUNNING')
+        @param int     timeout      Seconds to wait before giving up
+        @return array               Array of structs with keys name, state,
+                                    statename, and reached (true if the
+                                    process was seen in one of the states)
+        """
+        self._update('waitForProcessStates')
+
+        if not isinstance(names, (list, tuple)):
+            raise RPCError(SupervisorFaults.INCORRECT_PARAMETERS)
+        try:
+            states = set([getattr(ProcessStates, n) for n in state_names])
+            timeout = integer(timeout)
+            if timeout < 0:
+                raise ValueError
+        except (AttributeError, TypeError, ValueError):
+            raise RPCError(SupervisorFaults.INCORRECT_PARAMETERS)
+
+        # find all of the processes before waiting for any of them
+        processes = []
+        for name in names:
+            group_name, process_name = split_namespec(name)
+            group = self._getProcessGroup(group_name)
+            if process_name is None:
+                for process_name in sorted(group.processes.keys()):
+                    namespec = '%s:%s' % (group_name, process_name)
+                    processes.append((namespec, group.processes[process_name]))
+            else:
+                process = group.processes.get(process_name)
+                if process is None:
+                    raise RPCError(SupervisorFaults.BAD_NAME, name)
+                processes.append(('%s:%s' % (group_name, process_name), process))
+
+        reached = set()
+        pending = list(processes)
+        deadline = time.time() + timeout
+
+        def results():
+            infos = []
+            for namespec, process in processes:
+                state = process.get_state()
+                infos.append({'name': namespec,
+                              'state': state,
+                              'statename': getProcessStateDescription(state),
+                              'reached': namespec in reached})
+            return infos
+
+        def onwait():
+            # only the processes not yet seen in the states are checked
+            still_pending = []
+            for namespec, process in pending:
+                if process.get_state() in states:
+                    reached.add(namespec)
+                else:
+                    still_pending.append((namespec, process))
+            pending[:] = still_pending
+            if pending and time.time() < deadline:
+                return NOT_DONE_YET
+            return results()
+
+        value = onwait()
+        if value is not NOT_DONE_YET:
+            return value
+
+        onwait.delay = 0.05
+        onwait.rpcinterface = self
+        return onwait # deferred
+
+    def getMemoryReport(self):
+        """ Return a report of the memory used for the configuration added
+            through the twiddler interface.  Option values such as commands
+            and environments that are the same for many processes are shared
+            by their configs instead of being copied for each one.
+
+        @return struct  Struct with keys programs, templates, process_configs
+                        (the number of configs added by twiddler),
+                        shared_values (the number of distinct values they
+                        share), shared_references (the number of uses of
+                        those values), shared_saved_kb (an estimate of the
+                        memory saved by sharing, less the memory used to
+                        track the shared values), and peak_rss_kb (the peak
+                        resident set size of supervisord)
+        """
+        self._update('getMemoryReport')
+
+        self._pruneRemoved()
+        shared = self._shared.report()
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        if sys.platform == 'darwin':
+            peak_rss_kb = usage.ru_maxrss // 1024 # bytes on macOS
+        else:
+            peak_rss_kb = usage.ru_maxrss
+
+        return {'programs': sum([len(p) for p in self._programs.values()]),
+                'templates': len(self._templates),
+                'process_configs': shared['configs'],
+                'shared_values': shared['values'],
+                'shared_references': shared['references'],
+                'shared_saved_kb': shared['saved_bytes'] // 1024,
+                'peak_rss_kb': peak_rss_kb}
+
+    def getStats(self):
+        """ Return the number of calls to each twiddler method, the errors
+            they returned by fault code, and a histogram of their latencies,
+            along with the same for the results handled by the STDIN result
+            handler.  Stats are only kept if the stats option is on.
+
+        @return struct  Struct with keys enabled (boolean), bucket_bounds_ms
+                        (the upper bounds of the histogram buckets), methods,
+                        handler_results, coalesced (the number of calls
+                        that were coalesced), and stdin_bytes.  methods and
+                        handler_results have a struct for each method or kind
+                        of result with keys calls, errors, faults (a struct of
+                        error counts), total_ms, max_ms, and histogram (an
+                        array of cumulative counts for each bucket and then
+                        all calls).  stdin_bytes has a struct for each process
+                        written to by the STDIN result handler with keys
+                        queued_bytes, written_bytes, dropped_bytes,
+                        blocked_bytes, and pending_bytes; it is kept even if
+                        the stats option is off
+        """
+        self._update('getStats')
+        self._pruneStdinStats()
+
+        if self._stats is None:
+            methods = {}
+            handler_results = {}
+        else:
+            methods = self._stats.report()
+            handler_results = resulthandler.timings.report()
+
+        return {'enabled': self._stats is not None,
+                'bucket_bounds_ms': [b * 1000.0 for b in BUCKET_BOUNDS],
+                'methods': methods,
+                'handler_results': handler_results,
+                'coalesced': self._coalesced,
+                'stdin_bytes': resulthandler.byte_stats()}
+
+    def getPrometheusStats(self):
+        """ Return the stats from getStats() in the Prometheus text format
+
+        @return string  Prometheus text format
+        """
+        self._update('getPrometheusStats')
+        self._pruneStdinStats()
+
+        stdin_bytes = resulthandler.byte_stats_prometheus('twiddler_stdin')
+        if self._stats is None:
+            return stdin_bytes
+        return (self._stats.prometheus('twiddler_method', 'method') +
+                resulthandler.timings.prometheus('twiddler_handler_result',
+                                                 'result') +
+                stdin_bytes)
+
+    def _pruneStdinStats(self):
+        """ Drop the STDIN handler's byte counters for processes that no
+        longer exist, such as those removed by supervisorctl update """
+        names = set()
+        for group in self.supervisord.process_groups.values():
+            names.update(group.processes.keys())
+        resulthandler.forget_byte_stats(
+            [n for n in resulthandler.byte_stats() if n not in names])
+
+    def _pruneRemoved(self):
+        """ Forget the groups and programs added by twiddler, and release
+        the shared values of their configs, when they have been removed
+        without twiddler, such as by removeProcessGroup() or supervisorctl
+        update """
+        groups = self.supervisord.process_groups
+        configs = {} # {group_name: {process_name: config}}
+        for group_name, group in groups.items():
+            configs[group_name] = dict([(c.name, c) for c in
+                                        group.config.process_configs])
+        self._shared.prune(itertools.chain(
+            *[c.values() for c in configs.values()]))
+
+        for group_name, programs in list(self._programs.items()):
+            group_configs = configs.get(group_name, {})
+            for program_name, info in list(programs.items()):
+                info['process_names'] = [
+                    n for n in info['process_names']
+                    if group_configs.get(n) in self._shared]
+                if not info['process_names']:
+                    del programs[program_name]
+            if not programs:
+                del self._programs[group_name]
+
+        for group_name in list(self._added_groups.keys()):
+            if group_name not in groups:
+                del self._added_groups[group_name]
+
+    def callJSON(self, request):
+        """ Call twiddler methods with a JSON-RPC 2.0 request or batch of
+            requests and return the JSON response.  The methods and their
+            fault codes are the same, but large arguments and results such
+            as lists of programs or processes are much cheaper to encode and
+            decode as JSON in one XML-RPC string.  The calls in a batch are
+            made in order and each is checked like any other call.
+
+        @param string  request  JSON-RPC request object or array of them
+        @return string          JSON-RPC response object or array of them,
+                                with fault codes as the error codes, or an
+                                empty string if all were notifications
+        """
+        self._update('callJSON')
+
+        return jsonrpc.make_call(self, self._method_names, request)
 
     def log(self, message, level=supervisor.loggers.LevelsByName.INFO):
         """ Write an arbitrary message to the main supervisord log.  This is
@@ -67,6 +769,82 @@ class TwiddlerNamespaceRPCInterface:
             raise RPCError(SupervisorFaults.INCORRECT_PARAMETERS)
 
         self.supervisord.options.logger.log(level, message)
+        self._addChange('log')
+        return True
+
+    def addGroup(self, group_name, priority=999):
+        """ Add a new, empty process group.  Programs can then be added to
+            it with addProgramToGroup().
+
+        @param string  group_name  Name of the new process group
+        @param int     priority    Priority of the group, same as in supervisord.conf
+        @return boolean            Always True unless error
+        """
+        self._update('addGroup')
+
+        config = self._makeGroupConfig(group_name, priority)
+        self._addGroupConfigs([config])
+        self._record('addGroup', group_name, priority)
+        return True
+
+    def addGroups(self, groups):
+        """ Add many new, empty process groups in one call.  Either all of
+            the groups are added or none of them are.
+
+        @param array  groups  Array of structs with keys group_name and
+                              priority (optional), as in addGroup
+        @return boolean       Always True unless error
+        """
+        self._update('addGroups')
+
+        if not isinstance(groups, (list, tuple)):
+            raise RPCError(SupervisorFaults.INCORRECT_PARAMETERS)
+
+        configs = []
+        names = set()
+        for group in groups:
+            try:
+                group_name = group['group_name']
+                priority = group.get('priority', 999)
+            except (KeyError, TypeError, AttributeError):
+                raise RPCError(SupervisorFaults.INCORRECT_PARAMETERS)
+            if group_name in names:
+                raise RPCError(SupervisorFaults.BAD_NAME, 'group: %s' % group_name)
+            names.add(group_name)
+            configs.append(self._makeGroupConfig(group_name, priority))
+
+        self._addGroupConfigs(configs)
+        self._record('addGroups', groups)
+        return True
+
+    def removeGroup(self, group_name):
+        """ Remove a process group and all of its processes.  None of its
+            processes may be running.
+
+        @param string  group_name  Name of an existing process group
+        @return boolean            Always True unless error
+        """
+        self._update('removeGroup')
+
+        self._removeGroups([group_name])
+        self._record('removeGroup', group_name)
+        return True
+
+    def removeGroups(self, group_names):
+        """ Remove many process groups and all of their processes in one call.
+            None of their processes may be running.  Either all of the groups
+            are removed or none of them are.
+
+        @param array  group_names  Names of existing process groups
+        @return boolean            Always True unless error
+        """
+        self._update('removeGroups')
+
+        if not isinstance(group_names, (list, tuple)):
+            raise RPCError(SupervisorFaults.INCORRECT_PARAMETERS)
+
+        self._removeGroups(group_names)
+        self._record('removeGroups', group_names)
         return True
 
     def addProgramToGroup(self, group_name, program_name, program_options):
@@ -83,35 +861,121 @@ class TwiddlerNamespaceRPCInterface:
 
         group = self._getProcessGroup(group_name)
 
-        # make configparser instance for program options
-        section_name = 'program:%s' % program_name
-        parser = self._makeConfigParser(section_name, program_options)
+        new_configs = self._makeProcessConfigs(group_name, program_name,
+                                               program_options)
 
-        # make process configs from parser instance
-        options = self.supervisord.options
-        try:
-            new_configs = options.processes_from_section(parser, section_name, group_name)
-        except ValueError as e:
-            raise RPCError(SupervisorFaults.INCORRECT_PARAMETERS, e)
+        self._checkNewProgramNames(group_name, [program_name])
+        self._checkNewProcessNames(group, new_configs)
+        self._addProcessConfigs(group_name, group, new_configs)
+        self._rememberProgram(group_name, program_name, program_options,
+                              new_configs)
+        self._record('addProgramToGroup', group_name, program_name,
+                     program_options)
+        return True
 
-        # check new process names don't already exist in the config
-        for new_config in new_configs:
-            for existing_config in group.config.process_configs:
-                if new_config.name == existing_config.name:
-                    raise RPCError(SupervisorFaults.BAD_NAME, new_config.name)
+    def addProgramsToGroup(self, group_name, programs):
+        """ Add many new programs to an existing process group in one call.
+            Each program is validated before any of them are added, so either
+            all of the programs are added or none of them are.
 
-        # add process configs to group
-        group.config.process_configs.extend(new_configs)
+        @param string  group_name  Name of an existing process group
+        @param array   programs    Array of structs with keys program_name
+                                   and program_options, as in addProgramToGroup
+        @return array              Array of structs with keys program_name and
+                                   process_names for each program added
+        """
+        self._update('addProgramsToGroup')
 
-        for new_config in new_configs:
-            # the process group config already exists and its after_setuid hook
-            # will not be called again to make the auto child logs for this process.
-            new_config.create_autochildlogs()
+        group = self._getProcessGroup(group_name)
 
-            # add process instance
-            group.processes[new_config.name] = new_config.make_process(group)
+        if not isinstance(programs, (list, tuple)):
+            raise RPCError(SupervisorFaults.INCORRECT_PARAMETERS)
 
-        return True
+        # make process configs for every program before changing anything
+        batch = []
+        for program in programs:
+            try:
+                program_name = program['program_name']
+                program_options = program['program_options']
+            except (KeyError, TypeError):
+                raise RPCError(SupervisorFaults.INCORRECT_PARAMETERS)
+            new_configs = self._makeProcessConfigs(group_name, program_name,
+                                                   program_options)
+            batch.append((program_name, program_options, new_configs))
+
+        all_new_configs = []
+        for program_name, program_options, new_configs in batch:
+            all_new_configs.extend(new_configs)
+        self._checkNewProgramNames(group_name, [b[0] for b in batch])
+        self._checkNewProcessNames(group, all_new_configs)
+
+        results = []
+        for program_name, program_options, new_configs in batch:
+            self._addProcessConfigs(group_name, group, new_configs)
+            self._rememberProgram(group_name, program_name, program_options,
+                                  new_configs)
+            results.append({'program_name': program_name,
+                            'process_names': [c.name for c in new_configs]})
+        self._record('addProgramsToGroup', group_name, programs)
+        return results
+
+    def validatePrograms(self, programs, group_name=''):
+        """ Check the options of many programs without adding them.  Each
+            program is parsed the same way as by addProgramToGroup() and the
+            processes it would make are returned with their options as
+            Supervisor understood them.  Nothing is changed.
+
+        @param array   programs    Array of structs with keys program_name
+                                   and program_options, as in addProgramToGroup
+        @param string  group_name  Name of an existing process group that the
+                                   programs would be added to (optional).  If
+                                   given, process names that are already in
+                                   the group are errors.
+        @return array              Array of structs with keys program_name,
+                                   valid (boolean), error (a string, empty if
+                                   valid), and processes (an array of structs
+                                   of process options, including name)
+        """
+        self._update('validatePrograms')
+
+        if not isinstance(programs, (list, tuple)):
+            raise RPCError(SupervisorFaults.INCORRECT_PARAMETERS)
+
+        names = set()
+        if group_name:
+            group = self._getProcessGroup(group_name)
+            names.update([c.name for c in group.config.process_configs])
+
+        results = []
+        for program in programs:
+            result = {'program_name': '',
+                      'valid': False,
+                      'error': '',
+                      'processes': []}
+            results.append(result)
+            try:
+                program_name = program['program_name']
+                program_options = program['program_options']
+                result['program_name'] = program_name
+                configs = self._makeProcessConfigs(group_name or program_name,
+                                                   program_name,
+                                                   program_options)
+            except (KeyError, TypeError, AttributeError):
+                result['error'] = 'INCORRECT_PARAMETERS'
+                continue
+            except RPCError as e:
+                result['error'] = e.text
+                continue
+
+            for config in configs:
+                if config.name in names:
+                    result['error'] = 'BAD_NAME: %s' % config.name
+                    break
+            else:
+                names.update([c.name for c in configs])
+                result['valid'] = True
+            result['processes'] = [self._normalizeConfig(c) for c in configs]
+        return results
 
     def removeProcessFromGroup(self, group_name, process_name):
         """ Remove a process from a process group.  When a program is added with
@@ -126,31 +990,939 @@ class TwiddlerNamespaceRPCInterface:
         self._update('removeProcessFromGroup')
 
         group = self._getProcessGroup(group_name)
+        self._removeProcesses(group_name, group, [process_name])
+        self._record('removeProcessFromGroup', group_name, process_name)
+        return True
 
-        # check process exists and is running
-        process = group.processes.get(process_name)
-        if process is None:
-            raise RPCError(SupervisorFaults.BAD_NAME, process_name)
-        if process.pid or process.state not in STOPPED_STATES:
-            raise RPCError(SupervisorFaults.STILL_RUNNING, process_name)
+    def removeProcessesFromGroup(self, group_name, process_names):
+        """ Remove many processes from a process group in one call.  All of
+            the processes must exist and be stopped, otherwise an error is
+            returned and none of them are removed.
 
-        group.transition()
+        @param string group_name     Name of an existing process group
+        @param array  process_names  Names of the processes to remove from group
+        @return boolean              Always return True unless error
+        """
+        self._update('removeProcessesFromGroup')
 
-        # del process config from group, then del process
-        for index, config in enumerate(group.config.process_configs):
-            if config.name == process_name:
-                del group.config.process_configs[index]
+        group = self._getProcessGroup(group_name)
 
-        del group.processes[process_name]
+        if not isinstance(process_names, (list, tuple)):
+            raise RPCError(SupervisorFaults.INCORRECT_PARAMETERS)
+
+        self._removeProcesses(group_name, group, process_names)
+        self._record('removeProcessesFromGroup', group_name, process_names)
         return True
 
+    def removeProgramFromGroup(self, group_name, program_name):
+        """ Remove all of the processes of a program that was added with
+            addProgramToGroup() or addProgramsToGroup().  All of its
+            processes must be stopped, otherwise an error is returned and
+            none of them are removed.
+
+        @param string group_name    Name of an existing process group
+        @param string program_name  Name of the program to remove from group
+        @return boolean             Always return True unless error
+        """
+        self._update('removeProgramFromGroup')
+
+        group = self._getProcessGroup(group_name)
+
+        info = self._programs.get(group_name, {}).get(program_name)
+        if info is None:
+            raise RPCError(SupervisorFaults.BAD_NAME, program_name)
+
+        self._removeProcesses(group_name, group, info['process_names'])
+        self._record('removeProgramFromGroup', group_name, program_name)
+        return True
+
+    def replaceProgramInGroup(self, group_name, program_name, program_options,
+                              restart_batch_size=0):
+        """ Replace the options of a program that was added with
+            addProgramToGroup() or addProgramsToGroup().  Processes that
+            still exist under the new options have their configs replaced
+            in place and keep running with the old options until they are
+            restarted.  Processes that no longer exist under the new options
+            are removed and must be stopped.  New processes are added.
+
+            If restart_batch_size is greater than zero, the running processes
+            of the program are then restarted that many at a time, waiting
+            for each batch to start before the next one is stopped.
+
+        @param string  group_name          Name of an existing process group
+        @param string  program_name        Name of the program to replace
+        @param struct  program_options     New program options
+        @param int     restart_batch_size  Processes to restart at a time (0=none)
+        @return boolean                    Always True unless error
+        """
+        self._update('replaceProgramInGroup')
+
+        group = self._getProcessGroup(group_name)
+
+        info = self._programs.get(group_name, {}).get(program_name)
+        if info is None:
+            raise RPCError(SupervisorFaults.BAD_NAME, program_name)
+
+        if not isinstance(restart_batch_size, int) or restart_batch_size < 0:
+            raise RPCError(SupervisorFaults.INCORRECT_PARAMETERS)
+
+        new_configs = self._makeProcessConfigs(group_name, program_name,
+                                               program_options)
+
+        old_names = set(info['process_names'])
+        new_names = set([c.name for c in new_configs])
+
+        # processes that will no longer exist must be stopped
+        removed_names = [n for n in info['process_names'] if n not in new_names]
+        for process_name in removed_names:
+            process = group.processes[process_name]
+            if process.pid or process.state not in STOPPED_STATES:
+                raise RPCError(SupervisorFaults.STILL_RUNNING, process_name)
+
+        # processes that will be added must not collide with others
+        added_configs = [c for c in new_configs if c.name not in old_names]
+        self._checkNewProcessNames(group, added_configs)
+
+        # swap the configs of processes that are kept
+        replaced = {}
+        for new_config in new_configs:
+            if new_config.name in old_names:
+                replaced[new_config.name] = new_config
+        process_configs = group.config.process_configs
+        for index, config in enumerate(process_configs):
+            if config.name in replaced:
+                self._replaceAutoChildLogs(config, replaced[config.name])
+                process_configs[index] = replaced[config.name]
+                self._shared.release(config)
+                self._shared.share(replaced[config.name])
+        for process_name, new_config in replaced.items():
+            self._replaceProcessConfig(group_name, group.processes[process_name],
+                                       new_config)
+            self._delta['changed'].append('%s:%s' % (group_name, process_name))
+        if replaced and self._scheduler is not None:
+            self._scheduler.pump()
+
+        if removed_names:
+            self._removeProcesses(group_name, group, removed_names)
+        self._addProcessConfigs(group_name, group, added_configs)
+        self._rememberProgram(group_name, program_name, program_options,
+                              new_configs)
+        self._record('replaceProgramInGroup', group_name, program_name,
+                     program_options)
+
+        if restart_batch_size:
+            processes = [group.processes[n] for n in sorted(replaced)]
+            return self._makeRollingRestart(processes, restart_batch_size)
+        return True
+
+    def reconcileGroup(self, group_name, desired_programs):
+        """ Make the processes in a group match a list of programs.  Missing
+            processes are added, processes whose options are different have
+            their configs replaced, and stopped processes that are not in
+            any of the programs are removed.  Running processes are never
+            stopped or restarted; they are returned so the caller can stop
+            or restart them and then call this again.  Programs whose
+            options are the same as when they were last added by twiddler
+            are not parsed again.
+
+        @param string  group_name        Name of an existing process group
+        @param array   desired_programs  Array of structs with keys
+                                         program_name and program_options,
+                                         as in addProgramsToGroup
+        @return struct                   Struct with keys added, changed,
+                                         and removed (arrays of process
+                                         names), unchanged (the number of
+                                         processes left as they were),
+                                         restart_needed (running processes
+                                         whose configs were changed), and
+                                         stop_needed (running processes
+                                         that are not wanted)
+        """
+        self._update('reconcileGroup')
+
+        group = self._getProcessGroup(group_name)
+
+        if not isinstance(desired_programs, (list, tuple)):
+            raise RPCError(SupervisorFaults.INCORRECT_PARAMETERS)
+
+        # make process configs for the programs that may have changed
+        # before changing anything
+        programs = self._programs.get(group_name, {})
+        batch = [] # (program_name, program_options, new_configs or None)
+        program_names = set()
+        for program in desired_programs:
+            try:
+                program_name = program['program_name']
+                program_options = dict(program['program_options'])
+            except (KeyError, TypeError, ValueError):
+                raise RPCError(SupervisorFaults.INCORRECT_PARAMETERS)
+            if program_name in program_names:
+                raise RPCError(SupervisorFaults.BAD_NAME, program_name)
+            program_names.add(program_name)
+
+            info = programs.get(program_name)
+            if (info is not None and info['template_name'] is None and
+                    info['program_options'] == program_options and
+                    len(info['process_names']) == info['num_processes']):
+                batch.append((program_name, program_options, None))
+            else:
+                new_configs = self._makeProcessConfigs(
+                    group_name, program_name, program_options)
+                batch.append((program_name, program_options, new_configs))
+
+        # compare the wanted processes to those in the group
+        wanted = set()
+        added_configs = []
+        changed_configs = {}
+        restart_needed = []
+        unchanged = 0
+        for program_name, program_options, new_configs in batch:
+            if new_configs is None:
+                names = programs[program_name]['process_names']
+                for process_name in names:
+                    if process_name in wanted:
+                        raise RPCError(SupervisorFaults.BAD_NAME,
+                                       process_name)
+                    wanted.add(process_name)
+                unchanged += len(names)
+                continue
+            for new_config in new_configs:
+                if new_config.name in wanted:
+                    raise RPCError(SupervisorFaults.BAD_NAME, new_config.name)
+                wanted.add(new_config.name)
+                process = group.processes.get(new_config.name)
+                if process is None:
+                    added_configs.append(new_config)
+                elif _sameConfig(process.config, new_config,
+                                 self._requestedAutostart(process)):
+                    unchanged += 1
+                else:
+                    changed_configs[new_config.name] = new_config
+                    if process.pid or process.state not in STOPPED_STATES:
+                        restart_needed.append(new_config.name)
+
+        removed_names = []
+        stop_needed = []
+        for process_name in sorted(group.processes.keys()):
+            if process_name not in wanted:
+                process = group.processes[process_name]
+                if process.pid or process.state not in STOPPED_STATES:
+                    stop_needed.append(process_name)
+                else:
+                    removed_names.append(process_name)
+
+        # swap the configs of processes that are kept
+        if changed_configs:
+            process_configs = group.config.process_configs
+            for index, config in enumerate(process_configs):
+                new_config = changed_configs.get(config.name)
+                if new_config is not None:
+                    self._replaceAutoChildLogs(config, new_config)
+                    process_configs[index] = new_config
+                    self._shared.release(config)
+                    self._shared.share(new_config)
+                    self._replaceProcessConfig(group_name,
+                                               group.processes[config.name],
+                                               new_config)
+                    self._delta['changed'].append('%s:%s' % (group_name,
+                                                             config.name))
+            if self._scheduler is not None:
+                self._scheduler.pump()
+
+        if removed_names:
+            self._removeProcesses(group_name, group, removed_names)
+        self._addProcessConfigs(group_name, group, added_configs)
+
+        # the wanted processes now belong only to the programs that want them
+        programs = self._programs.setdefault(group_name, {})
+        for program_name, info in list(programs.items()):
+            if program_name not in program_names:
+                info['process_names'] = [n for n in info['process_names']
+                                         if n not in wanted]
+                if not info['process_names']:
+                    del programs[program_name]
+        for program_name, program_options, new_configs in batch:
+            if new_configs is not None:
+                self._rememberProgram(group_name, program_name,
+                                      program_options, new_configs)
+
+        if added_configs or changed_configs or removed_names:
+            self._record('reconcileGroup', group_name, desired_programs)
+
+        return {'added': [c.name for c in added_configs],
+                'changed': sorted(changed_configs.keys()),
+                'removed': removed_names,
+                'unchanged': unchanged,
+                'restart_needed': sorted(restart_needed),
+                'stop_needed': stop_needed}
+
+    def scaleProgram(self, group_name, program_name, numprocs):
+        """ Change the number of processes of a program that was added with
+            addProgramToGroup() or addProgramsToGroup(), as if its numprocs
+            option had been changed.  Only the processes that are added or
+            removed are parsed or touched, so the cost does not depend on
+            the number of processes that are kept.
+
+            When scaling up, processes are added for the new process numbers.
+            When scaling down, the processes with the highest numbers are
+            removed.  Any of them that are running are stopped first, and
+            the method does not return until they have stopped and have been
+            removed.  They are removed even if the client stops waiting.  Programs whose options use %(numprocs)s can not be
+            scaled because all of their processes would change; use
+            replaceProgramInGroup() for those.
+
+        @param string  group_name    Name of an existing process group
+        @param string  program_name  Name of the program to scale
+        @param int     numprocs      New number of processes (at least 1)
+        @return struct               Struct with keys added and removed,
+                                     arrays of process names
+        """
+        self._update('scaleProgram')
+
+        group = self._getProcessGroup(group_name)
+
+        info = self._programs.get(group_name, {}).get(program_name)
+        if info is None:
+            raise RPCError(SupervisorFaults.BAD_NAME, program_name)
+        if info['template_name'] is not None:
+            raise RPCError(SupervisorFaults.INCORRECT_PARAMETERS,
+                           'programs added from templates can not be scaled')
+
+        program_options = info['program_options']
+        try:
+            numprocs = integer(numprocs)
+            if numprocs < 1:
+                raise ValueError('numprocs must be at least 1')
+            old_numprocs = integer(program_options.get('numprocs', 1))
+            numprocs_start = integer(program_options.get('numprocs_start', 0))
+            process_name = program_options.get('process_name',
+                                               '%(program_name)s')
+            for value in program_options.values():
+                if '%(numprocs)' in str(value):
+                    raise ValueError('options use %(numprocs)s')
+            if numprocs > 1 and '%(process_num)' not in process_name:
+                raise ValueError('%(process_num) must be present within '
+                                 'process_name when numprocs > 1')
+        except (TypeError, ValueError) as e:
+            raise RPCError(SupervisorFaults.INCORRECT_PARAMETERS, e)
+
+        # make configs for only the new process numbers
+        added_configs = []
+        added_names = set()
+        for process_num in range(numprocs_start + old_numprocs,
+                                 numprocs_start + numprocs):
+            options = dict(program_options)
+            options['numprocs'] = '1'
+            options['numprocs_start'] = str(process_num)
+            for new_config in self._makeProcessConfigs(group_name,
+                                                       program_name, options):
+                # group.processes has the same names as the group's configs
+                if (new_config.name in group.processes or
+                        new_config.name in added_names):
+                    raise RPCError(SupervisorFaults.BAD_NAME, new_config.name)
+                added_names.add(new_config.name)
+                added_configs.append(new_config)
+
+        # find the processes of the process numbers that are no longer wanted
+        removed = []
+        for process_num in range(numprocs_start + numprocs,
+                                 numprocs_start + old_numprocs):
+            try:
+                name = self._expandProcessName(group_name, program_name,
+                                               process_name, process_num,
+                                               old_numprocs)
+            except ValueError as e:
+                raise RPCError(SupervisorFaults.INCORRECT_PARAMETERS, e)
+            process = group.processes.get(name)
+            if process is not None:
+                removed.append((name, process))
+
+        if not added_configs and not removed and numprocs == old_numprocs:
+            return {'added': [], 'removed': []}
+
+        self._addProcessConfigs(group_name, group, added_configs)
+        info['program_options'] = dict(program_options,
+                                       numprocs=str(numprocs))
+        info['process_names'].extend([c.name for c in added_configs])
+        info['all_process_names'] = (
+            info['all_process_names'][:min(numprocs, old_numprocs)] +
+            [c.name for c in added_configs])
+        info['num_processes'] = numprocs
+        result = {'added': [c.name for c in added_configs],
+                  'removed': [name for name, process in removed]}
+
+        running = [p for name, p in removed if p.pid or
+                   p.get_state() not in STOPPED_STATES]
+        if not running:
+            if removed:
+                self._removeProcesses(group_name, group, result['removed'])
+            self._record('scaleProgram', group_name, program_name, numprocs)
+            return result
+
+        # stop the running processes, then remove each one once it stops
+        self._record('scaleProgram', group_name, program_name, numprocs)
+        for process in running:
+            if process.get_state() in RUNNING_STATES:
+                process.stop()
+
+        finished = []
+
+        def remove(event):
+            # processes can't be removed while their group may be
+            # iterating over them to send a state change
+            if isinstance(event, events.ProcessStateEvent):
+                return False
+            if self.supervisord.process_groups.get(group_name) is not group:
+                finished.append(True)
+                return True # the group was removed
+            still_here = [(name, p) for name, p in removed
+                          if group.processes.get(name) is p]
+            stopped = [name for name, p in still_here
+                       if not p.pid and p.get_state() in STOPPED_STATES]
+            if stopped:
+                self._delta = {'added': [], 'changed': [], 'removed': []}
+                self._removeProcesses(group_name, group, stopped)
+                self._addChange('scaleProgram')
+            if len(stopped) < len(still_here):
+                return False
+            finished.append(True)
+            return True
+
+        self._watch(remove)
+
+        def onwait():
+            self._notifyWatchers()
+            if finished:
+                return result
+            return NOT_DONE_YET
+
+        onwait.delay = 0.05
+        onwait.rpcinterface = self
+        return onwait # deferred
+
+    def addProgramTemplate(self, template_name, program_options):
+        """ Add a program template.  The options are parsed and validated
+            once, and the template can then be used to add many programs
+            with addProgramFromTemplate() without parsing them again.
+
+        @param string  template_name    Name of the new template
+        @param struct  program_options  Program options, same as in supervisord.conf
+        @return boolean                 Always True unless error
+        """
+        self._update('addProgramTemplate')
+
+        if template_name in self._templates:
+            raise RPCError(SupervisorFaults.BAD_NAME, template_name)
+
+        # a template makes exactly one process for each program added from it
+        configs = self._makeProcessConfigs('', template_name, program_options)
+        if len(configs) != 1:
+            raise RPCError(SupervisorFaults.INCORRECT_PARAMETERS,
+                           'numprocs must be 1 for a template')
+
+        # only process_name is expanded again for each program, so other
+        # options would silently get the template's values for these
+        for name, value in program_options.items():
+            if name != 'process_name' and _usesProgramExpansion(value):
+                raise RPCError(SupervisorFaults.INCORRECT_PARAMETERS,
+                    '%s can not use %%(program_name)s, %%(group_name)s or '
+                    '%%(process_num)s in a template' % name)
+
+        options = dict(program_options)
+        template = {
+            'program_options': options,
+            'process_name': options.get('process_name', '%(program_name)s'),
+            'process_num': integer(options.get('numprocs_start', 0)),
+            'config': configs[0],
+            }
+
+        # check the process name can be expanded for a program
+        self._makeConfigFromTemplate(template, '', template_name, {})
+
+        self._templates[template_name] = template
+        self._record('addProgramTemplate', template_name, program_options)
+        return True
+
+    def removeProgramTemplate(self, template_name):
+        """ Remove a program template.  Programs that were added from the
+            template are not affected.
+
+        @param string  template_name    Name of the template to remove
+        @return boolean                 Always True unless error
+        """
+        self._update('removeProgramTemplate')
+
+        if template_name not in self._templates:
+            raise RPCError(SupervisorFaults.BAD_NAME, template_name)
+
+        del self._templates[template_name]
+        self._record('removeProgramTemplate', template_name)
+        return True
+
+    def getProgramTemplateNames(self):
+        """ Return an array with the names of the program templates.
+
+        @return array                Program template names
+        """
+        self._update('getProgramTemplateNames')
+        return list(self._templates.keys())
+
+    def addProgramFromTemplate(self, group_name, template_name, program_name,
+                               overrides={}):
+        """ Add a new program to an existing process group from a template
+            added with addProgramTemplate().  The program will have one process.
+
+        @param string  group_name     Name of an existing process group
+        @param string  template_name  Name of an existing program template
+        @param string  program_name   Name of the new program
+        @param struct  overrides      Options to override (only "environment",
+                                      a struct of variables to add or replace)
+        @return boolean               Always True unless error
+        """
+        self._update('addProgramFromTemplate')
+
+        group = self._getProcessGroup(group_name)
+        template = self._getProgramTemplate(template_name)
+
+        new_config = self._makeConfigFromTemplate(template, group_name,
+                                                  program_name, overrides)
+        self._checkNewProgramNames(group_name, [program_name])
+        self._checkNewProcessNames(group, [new_config])
+        self._addProcessConfigs(group_name, group, [new_config])
+        self._rememberProgram(group_name, program_name,
+                              template['program_options'], [new_config],
+                              template_name, overrides)
+        self._record('addProgramFromTemplate', group_name, template_name,
+                     program_name, overrides)
+        return True
+
+    def addProgramsFromTemplate(self, group_name, template_name, programs):
+        """ Add many new programs to an existing process group from a template
+            in one call.  Either all of the programs are added or none of them
+            are.
+
+        @param string  group_name     Name of an existing process group
+        @param string  template_name  Name of an existing program template
+        @param array   programs       Array of structs with keys program_name
+                                      and overrides (optional), as in
+                                      addProgramFromTemplate
+        @return array                 Array of structs with keys program_name
+                                      and process_names for each program added
+        """
+        self._update('addProgramsFromTemplate')
+
+        group = self._getProcessGroup(group_name)
+        template = self._getProgramTemplate(template_name)
+
+        if not isinstance(programs, (list, tuple)):
+            raise RPCError(SupervisorFaults.INCORRECT_PARAMETERS)
+
+        batch = []
+        for program in programs:
+            try:
+                program_name = program['program_name']
+                overrides = program.get('overrides', {})
+            except (KeyError, TypeError, AttributeError):
+                raise RPCError(SupervisorFaults.INCORRECT_PARAMETERS)
+            new_config = self._makeConfigFromTemplate(template, group_name,
+                                                      program_name, overrides)
+            batch.append((program_name, overrides, new_config))
+
+        self._checkNewProgramNames(group_name, [b[0] for b in batch])
+        self._checkNewProcessNames(group, [b[2] for b in batch])
+
+        results = []
+        for program_name, overrides, new_config in batch:
+            self._addProcessConfigs(group_name, group, [new_config])
+            self._rememberProgram(group_name, program_name,
+                                  template['program_options'], [new_config],
+                                  template_name, overrides)
+            results.append({'program_name': program_name,
+                            'process_names': [new_config.name]})
+        self._record('addProgramsFromTemplate', group_name, template_name,
+                     programs)
+        return results
+
     def _getProcessGroup(self, name):
         """ Find a process group by its name """
+        self._checkGroupPermitted(name)
         group = self.supervisord.process_groups.get(name)
         if group is None:
             raise RPCError(SupervisorFaults.BAD_NAME, 'group: %s' % name)
         return group
 
+    def _makeGroupConfig(self, group_name, priority):
+        """ Make the config for a new, empty process group """
+        try:
+            group_name = process_or_group_name(group_name)
+            priority = integer(priority)
+        except ValueError as e:
+            raise RPCError(SupervisorFaults.INCORRECT_PARAMETERS, e)
+
+        self._checkGroupPermitted(group_name)
+        if not group_name or group_name in self.supervisord.process_groups:
+            raise RPCError(SupervisorFaults.BAD_NAME, 'group: %s' % group_name)
+
+        options = self.supervisord.options
+        return ProcessGroupConfig(options, group_name, priority, [])
+
+    def _addGroupConfigs(self, configs):
+        """ Add process groups to supervisord.  The configs must already
+        have been checked for name collisions. """
+        for config in configs:
+            self.supervisord.add_process_group(config)
+            self._added_groups[config.name] = config.priority
+            self._delta['added'].append('%s:*' % config.name)
+
+    def _removeGroups(self, group_names):
+        """ Remove process groups from supervisord.  Nothing is removed
+        unless every group exists and has no running processes. """
+        for group_name in group_names:
+            group = self._getProcessGroup(group_name)
+            if group.get_unstopped_processes():
+                raise RPCError(SupervisorFaults.STILL_RUNNING,
+                               'group: %s' % group_name)
+
+        for group_name in set(group_names):
+            group = self.supervisord.process_groups[group_name]
+            for config in group.config.process_configs:
+                self._shared.release(config)
+            if self._remove_autochildlogs:
+                for process in group.processes.values():
+                    childlogs.remove_autochildlogs(process)
+            self.supervisord.remove_process_group(group_name)
+            self._forgetStdinStats(list(group.processes.keys()))
+            self._programs.pop(group_name, None)
+            self._delta['removed'].append('%s:*' % group_name)
+            self._removed_processes.pop(group_name, None)
+            if group_name in self._added_groups:
+                del self._added_groups[group_name]
+            else:
+                self._removed_groups.add(group_name)
+
+    def _forgetStdinStats(self, process_names):
+        """ Drop the STDIN handler's byte counters for processes that
+        were removed, unless a process in another group has the same name """
+        groups = list(self.supervisord.process_groups.values())
+        resulthandler.forget_byte_stats(
+            [n for n in process_names
+             if not any(n in g.processes for g in groups)])
+
+    def _getProcessPrograms(self, group_name):
+        """ Return a dict that maps the names of processes in a group to
+        the names of the programs added by twiddler that they belong to. """
+        process_programs = {}
+        for program_name, info in self._programs.get(group_name, {}).items():
+            for process_name in info['process_names']:
+                process_programs[process_name] = program_name
+        return process_programs
+
+    def _getProgramTemplate(self, name):
+        """ Find a program template by its name """
+        template = self._templates.get(name)
+        if template is None:
+            raise RPCError(SupervisorFaults.BAD_NAME, 'template: %s' % name)
+        return template
+
+    def _makeConfigFromTemplate(self, template, group_name, program_name,
+                                overrides):
+        """ Make a process config for a program by copying the config
+        parsed for a template.  Only the process name is expanded again;
+        all other options are used as they were parsed for the template.
+        """
+        try:
+            overrides = dict(overrides)
+            environment = overrides.pop('environment', None)
+            if overrides:
+                raise ValueError('unknown overrides: %s' %
+                                 ', '.join(sorted(overrides.keys())))
+            if environment is not None:
+                environment = dict(environment)
+                for k, v in environment.items():
+                    if not (isinstance(k, basestring) and
+                            isinstance(v, basestring)):
+                        raise ValueError('environment must contain strings')
+
+            name = self._expandProcessName(group_name, program_name,
+                                           template['process_name'],
+                                           template['process_num'], 1)
+        except (TypeError, ValueError) as e:
+            raise RPCError(SupervisorFaults.INCORRECT_PARAMETERS, e)
+
+        new_config = copy.copy(template['config'])
+        new_config.name = name
+        if environment:
+            merged = dict(new_config.environment or {})
+            merged.update(environment)
+            new_config.environment = merged
+        return new_config
+
+    def _expandProcessName(self, group_name, program_name, process_name,
+                           process_num, numprocs):
+        """ Expand a process_name option the way Supervisor does when it
+        parses a [program:x] section.  Raises ValueError if it is bad. """
+        options = self.supervisord.options
+        expansions = dict(getattr(options, 'environ_expansions', {}))
+        expansions.update({'program_name': process_or_group_name(program_name),
+                           'group_name': group_name,
+                           'host_node_name': platform.node(),
+                           'here': getattr(options, 'here', None),
+                           'process_num': process_num,
+                           'numprocs': numprocs})
+        return process_or_group_name(
+            expand(process_name, expansions, 'process_name'))
+
+    def _makeProcessConfigs(self, group_name, program_name, program_options):
+        """ Make the process configs that would result from a
+        [program:x] section with the given options.
+        """
+        # make configparser instance for program options
+        section_name = 'program:%s' % program_name
+        parser = self._makeConfigParser(section_name, program_options)
+
+        # make process configs from parser instance
+        options = self.supervisord.options
+        try:
+            return options.processes_from_section(parser, section_name, group_name)
+        except ValueError as e:
+            raise RPCError(SupervisorFaults.INCORRECT_PARAMETERS, e)
+
+    def _normalizeConfig(self, config):
+        """ Return a dict of the options of a process config with values
+        that can be sent over XML-RPC. """
+        param_names = (ProcessConfig.req_param_names +
+                       ProcessConfig.optional_param_names)
+        return dict([(name, _normalizeOption(getattr(config, name, None)))
+                     for name in param_names])
+
+    def _checkNewProgramNames(self, group_name, program_names):
+        """ Raise BAD_NAME if any new program has the same name as a
+        program already added to the group by twiddler or another new one.
+        """
+        programs = self._programs.get(group_name, {})
+        names = set()
+        for program_name in program_names:
+            if program_name in programs or program_name in names:
+                raise RPCError(SupervisorFaults.BAD_NAME, program_name)
+            names.add(program_name)
+
+    def _checkNewProcessNames(self, group, new_configs):
+        """ Raise BAD_NAME if any new process config has the same name
+        as an existing process config in the group or another new one.
+        """
+        names = set([c.name for c in group.config.process_configs])
+        for new_config in new_configs:
+            if new_config.name in names:
+                raise RPCError(SupervisorFaults.BAD_NAME, new_config.name)
+            names.add(new_config.name)
+
+    def _addProcessConfigs(self, group_name, group, new_configs):
+        """ Add process configs and their processes to a group.  The
+        configs must already have been checked for name collisions.
+        """
+        # add process configs to group
+        group.config.process_configs.extend(new_configs)
+
+        for new_config in new_configs:
+            self._shared.share(new_config)
+
+            # the process group config already exists and its after_setuid hook
+            # will not be called again to make the auto child logs for this process.
+            self._createAutoChildLogs(new_config)
+
+            # add process instance
+            group.processes[new_config.name] = new_config.make_process(group)
+            self._delta['added'].append('%s:%s' % (group_name,
+                                                   new_config.name))
+
+        if self._scheduler is not None:
+            self._scheduler.add(group_name,
+                [group.processes[c.name] for c in new_configs])
+
+    def _replaceProcessConfig(self, group_name, process, new_config):
+        """ Give a process a new config, keeping it queued by the spawn
+        scheduler if it is waiting to be started """
+        if self._scheduler is not None:
+            self._scheduler.replace(group_name, process, new_config)
+        process.config = new_config
+
+    def _requestedAutostart(self, process):
+        """ Return the autostart option of a process as it was given,
+        even if the spawn scheduler has turned it off while it is queued """
+        if self._scheduler is not None:
+            return self._scheduler.autostart(process)
+        return bool(process.config.autostart)
+
+    def _createAutoChildLogs(self, config):
+        """ Create the AUTO log files of a new process config, or only
+        name them if they are created lazily. """
+        if self._lazy_autochildlogs:
+            childlogs.name_autochildlogs(config)
+        else:
+            config.create_autochildlogs()
+
+    def _replaceAutoChildLogs(self, old_config, new_config):
+        """ Give a config that replaces another the old config's AUTO log
+        files, so that replacing a config does not leave the old files
+        behind.  Only AUTO logs that the old config did not have are
+        created. """
+        childlogs.inherit_autochildlogs(old_config, new_config)
+        self._createAutoChildLogs(new_config)
+
+    def _rememberProgram(self, group_name, program_name, program_options,
+                         new_configs, template_name=None, overrides=None):
+        """ Record a program added to a group so that it can be found
+        again by its name. """
+        programs = self._programs.setdefault(group_name, {})
+        programs[program_name] = {
+            'program_options': dict(program_options),
+            'template_name': template_name,
+            'overrides': overrides,
+            'process_names': [c.name for c in new_configs],
+            'all_process_names': [c.name for c in new_configs],
+            'num_processes': len(new_configs),
+            }
+
+    def _removeProcesses(self, group_name, group, process_names):
+        """ Remove processes and their configs from a group.  Nothing is
+        removed unless every process exists and is stopped. """
+        names = set(process_names)
+
+        # check processes exist and are not running
+        for process_name in process_names:
+            process = group.processes.get(process_name)
+            if process is None:
+                raise RPCError(SupervisorFaults.BAD_NAME, process_name)
+            if process.pid or process.state not in STOPPED_STATES:
+                raise RPCError(SupervisorFaults.STILL_RUNNING, process_name)
+
+        group.transition()
+
+        # del process configs from group, then del processes
+        kept_configs = []
+        for config in group.config.process_configs:
+            if config.name in names:
+                self._shared.release(config)
+            else:
+                kept_configs.append(config)
+        group.config.process_configs[:] = kept_configs
+
+        for process_name in names:
+            process = group.processes.pop(process_name)
+            if self._remove_autochildlogs:
+                childlogs.remove_autochildlogs(process)
+            self._delta['removed'].append('%s:%s' % (group_name, process_name))
+        self._forgetStdinStats(names)
+
+        # forget the processes of any programs they belonged to
+        foreign_names = set(names)
+        programs = self._programs.get(group_name, {})
+        for program_name, info in list(programs.items()):
+            foreign_names.difference_update(info['process_names'])
+            info['process_names'] = [
+                n for n in info['process_names'] if n not in names]
+            if not info['process_names']:
+                del programs[program_name]
+
+        # remember processes that were not added by twiddler
+        if foreign_names:
+            removed = self._removed_processes.setdefault(group_name, set())
+            removed.update(foreign_names)
+
+    def _watch(self, watcher):
+        """ Call watcher(event) on every process state change and tick
+        until it returns True.  The event is None when it is called from the
+        poll of a deferred.  Only then and on ticks may it add or remove
+        processes, since a process state change may be sent while a group
+        is iterating over its processes.  Supervisor only sends tick events
+        every 5 seconds, so work that has no client waiting for it may take
+        that long to finish. """
+        self._watchers.append(watcher)
+        # subscriptions can not be safely removed from inside a callback,
+        # so the interface stays subscribed once it has been used
+        if not self._subscribed:
+            events.subscribe(events.ProcessStateEvent, self._notifyWatchers)
+            events.subscribe(events.TickEvent, self._notifyWatchers)
+            self._subscribed = True
+
+    def _notifyWatchers(self, event=None):
+        """ Call the watchers and forget the ones that are done """
+        # watchers change process states, which sends events to this method
+        if self._notifying:
+            return
+        self._notifying = True
+        try:
+            for watcher in list(self._watchers):
+                if watcher(event):
+                    self._watchers.remove(watcher)
+        finally:
+            self._notifying = False
+
+    def _makeRollingRestart(self, processes, batch_size):
+        """ Make a deferred callback that restarts the running processes
+        batch_size at a time.  Each batch is stopped, then started, and
+        the next batch is not stopped until the previous one has left the
+        STARTING and BACKOFF states.  If any process in a batch is not
+        RUNNING then, the rest are not restarted and SPAWN_ERROR is raised
+        with the names of the processes that failed.  The restart is
+        driven by a watcher, so a batch that was stopped is started again
+        even if the client stops waiting; the callback only reports it. """
+        pending = [p for p in processes if p.get_state() in RUNNING_STATES]
+        batch = []
+        stopping = []
+        failed = []
+        finished = []
+
+        def advance(event):
+            if stopping:
+                for process in stopping:
+                    # a stopped process has not been reaped until its pid
+                    # is cleared, which is after its state change is sent
+                    if (process.get_state() == ProcessStates.STOPPING or
+                            (process.pid and
+                             process.get_state() in STOPPED_STATES)):
+                        return False
+                stopped = [p for p in stopping
+                           if p.get_state() in STOPPED_STATES]
+                del stopping[:]
+                for process in stopped:
+                    process.spawn()
+                return False
+
+            for process in batch:
+                if process.get_state() in (ProcessStates.STARTING,
+                                           ProcessStates.BACKOFF):
+                    return False
+            failed.extend([p.config.name for p in batch
+                           if p.get_state() != ProcessStates.RUNNING])
+            del batch[:]
+            if failed or not pending:
+                del pending[:]
+                finished.append(True)
+                return True
+
+            batch.extend(pending[:batch_size])
+            del pending[:batch_size]
+            stopping.extend(batch)
+            for process in batch:
+                if process.get_state() in RUNNING_STATES:
+                    process.stop()
+            return False
+
+        self._watch(advance)
+
+        def onwait():
+            self._notifyWatchers()
+            if failed:
+                raise RPCError(SupervisorFaults.SPAWN_ERROR, ', '.join(failed))
+            if finished:
+                return True
+            return NOT_DONE_YET
+
+        onwait.delay = 0.05
+        onwait.rpcinterface = self
+        return onwait # deferred
+
     def _makeConfigParser(self, section_name, options):
         """ Populate a new UnhosedConfigParser instance with a
         section built from an options dict.
@@ -164,5 +1936,76 @@ class TwiddlerNamespaceRPCInterface:
             raise RPCError(SupervisorFaults.INCORRECT_PARAMETERS)
         return config
 
+def _templateKey(info):
+    """ Return a key for the template that a program was added from """
+    return (info['template_name'],
+            json.dumps(info['program_options'], sort_keys=True))
+
+def _replayProgramsToGroup(group_name, programs):
+    return [('addProgramToGroup', group_name, p['program_name'],
+             p['program_options']) for p in programs]
+
+def _replayProgramsFromTemplate(group_name, template_name, programs):
+    return [('addProgramFromTemplate', group_name, template_name,
+             p['program_name'], p.get('overrides', {})) for p in programs]
+
+# calls that add many programs at once, and functions that split their
+# arguments into calls that add one program each
+BATCH_REPLAY_CALLS = {
+    'addProgramsToGroup': _replayProgramsToGroup,
+    'addProgramsFromTemplate': _replayProgramsFromTemplate,
+    }
+
+def _usesProgramExpansion(value):
+    """ Return True if an option value uses an expansion that differs
+    for each program added from a template """
+    if isinstance(value, dict):
+        return any(_usesProgramExpansion(v) for v in value.values())
+    if not isinstance(value, basestring):
+        return False
+    for name in ('program_name', 'group_name', 'process_num'):
+        if '%%(%s)' % name in value:
+            return True
+    return False
+
+def _normalizeOption(value):
+    """ Convert an option value to a type that can be sent over XML-RPC """
+    if value is None:
+        return ''
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, int):
+        if -2**31 <= value < 2**31:
+            return int(value)
+        return str(value) # too big for an XML-RPC int
+    if isinstance(value, (list, tuple)):
+        return [_normalizeOption(v) for v in value]
+    if isinstance(value, dict):
+        return dict([(str(k), _normalizeOption(v)) for k, v in value.items()])
+    if isinstance(value, basestring):
+        return value
+    if value in OPTION_CLASS_NAMES:
+        return OPTION_CLASS_NAMES[value]
+    return str(value)
+
+def _sameConfig(old, new, old_autostart):
+    """ Return True if two process configs have the same options.  A log
+    file that was created automatically for the old config is the same as
+    an AUTO log file that has not been created yet for the new one.  The
+    old config's autostart is given separately, since it is turned off
+    while the spawn scheduler has the process queued. """
+    for name in ProcessConfig.req_param_names + ProcessConfig.optional_param_names:
+        old_value = getattr(old, name, None)
+        new_value = getattr(new, name, None)
+        if name == 'autostart':
+            old_value, new_value = bool(old_autostart), bool(new_value)
+        if name in childlogs.AUTO_LOG_CHANNELS and new_value is Automatic:
+            channel = childlogs.AUTO_LOG_CHANNELS[name]
+            if childlogs.is_autochildlog(old, channel, old_value):
+                continue
+        if old_value != new_value:
+            return False
+    return True
+
 def make_twiddler_rpcinterface(supervisord, **config):
     return TwiddlerNamespaceRPCInterface(supervisord, **config)
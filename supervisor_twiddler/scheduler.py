@@ -0,0 +1,161 @@
+import collections
+import time
+
+from supervisor import events
+from supervisor.states import ProcessStates
+
+class TokenBucket:
+    """ A token bucket that allows rate events per second on average,
+    with bursts of up to burst events. """
+    def __init__(self, rate, burst=None, clock=time.time):
+        self.rate = float(rate)
+        if burst is None:
+            burst = max(1.0, self.rate)
+        self.burst = float(burst)
+        self.tokens = self.burst
+        self.clock = clock
+        self.last = clock()
+
+    def take(self):
+        """ Take a token if one is available.  Returns True if a token
+        was taken or False if the bucket is empty. """
+        now = self.clock()
+        if now < self.last: # system clock rolled back
+            self.last = now
+        self.tokens = min(self.burst,
+                          self.tokens + (now - self.last) * self.rate)
+        self.last = now
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+class SpawnScheduler:
+    """ Limits how quickly the processes added by twiddler are started.
+    Supervisor starts a new process with autostart on the next transition
+    of its group, so adding many processes at once would fork them all in
+    one pass of the main loop.  The scheduler turns off autostart for new
+    processes and queues them, then turns it back on for a few at a time:
+    no more than concurrency processes (or group_concurrency per group) may
+    be starting at once, and no more than rate per second are released.
+
+    The queue is pumped when processes are added and on every process
+    state change and tick event.  Supervisor only sends tick events every
+    5 seconds, so when the rate is the only limit and no processes are
+    changing state, a queued process may wait that long to be released.
+
+    While a process is queued, its config has autostart turned off, so
+    autostart() must be used to find whether it was asked to autostart.
+    """
+    def __init__(self, supervisord, concurrency=0, group_concurrency=0,
+                 rate=0, clock=time.time):
+        self.supervisord = supervisord
+        self.concurrency = concurrency
+        self.group_concurrency = group_concurrency
+        self.bucket = None
+        if rate:
+            self.bucket = TokenBucket(rate, clock=clock)
+        self.pending = collections.deque() # (group_name, process)
+        self.queued = {} # {id(process): process} for processes in pending
+        self.starting = [] # (group_name, process)
+        self._subscribed = False
+
+    def add(self, group_name, processes):
+        """ Queue the processes with autostart to be started later """
+        for process in processes:
+            if process.config.autostart:
+                self._queue(group_name, process, process.config)
+        if self.pending:
+            self.pump()
+
+    def pump(self, event=None):
+        """ Release as many queued processes as the limits allow """
+        self.starting = [(g, p) for g, p in self.starting
+                         if self._isStarting(g, p)]
+        group_counts = {}
+        for group_name, process in self.starting:
+            group_counts[group_name] = group_counts.get(group_name, 0) + 1
+
+        skipped = []
+        while self.pending:
+            if self.concurrency and len(self.starting) >= self.concurrency:
+                break
+            group_name, process = self.pending[0]
+            if self.queued.get(id(process)) is not process:
+                self.pending.popleft() # no longer queued
+                continue
+            if not self._exists(group_name, process):
+                self.pending.popleft()
+                del self.queued[id(process)]
+                continue
+            if (self.group_concurrency and
+                    group_counts.get(group_name, 0) >= self.group_concurrency):
+                skipped.append(self.pending.popleft())
+                continue
+            if self.bucket is not None and not self.bucket.take():
+                break
+            self.pending.popleft()
+            del self.queued[id(process)]
+            process.config.autostart = True
+            self.starting.append((group_name, process))
+            group_counts[group_name] = group_counts.get(group_name, 0) + 1
+        self.pending.extendleft(reversed(skipped))
+
+    def replace(self, group_name, process, new_config):
+        """ Keep the queued state of a process whose config is about to be
+        replaced by new_config.  If new_config has autostart and the process
+        is queued or has never been started, the process stays queued (or is
+        queued again) instead of being started by the next transition of its
+        group.  If new_config does not have autostart, the process is no
+        longer queued.  Call pump() after the config has been replaced. """
+        self.starting = [(g, p) for g, p in self.starting if p is not process]
+        if not new_config.autostart:
+            self.queued.pop(id(process), None)
+        elif (id(process) in self.queued or
+                (process.get_state() == ProcessStates.STOPPED and
+                 not process.laststart)):
+            self._queue(group_name, process, new_config)
+
+    def autostart(self, process):
+        """ Return True if the process has autostart, including a queued
+        process whose config has it turned off until it is released """
+        if self.queued.get(id(process)) is process:
+            return True
+        return bool(process.config.autostart)
+
+    def status(self):
+        """ Return a dict with the numbers of queued and starting processes """
+        return {'pending': len(self.queued), 'starting': len(self.starting)}
+
+    def _queue(self, group_name, process, config):
+        """ Turn off autostart in config and queue the process if it is
+        not queued already """
+        config.autostart = False
+        if id(process) not in self.queued:
+            self.queued[id(process)] = process
+            self.pending.append((group_name, process))
+            self._subscribe()
+
+    def _exists(self, group_name, process):
+        """ Return True if process has not been removed from its group """
+        group = self.supervisord.process_groups.get(group_name)
+        if group is None:
+            return False
+        return group.processes.get(process.config.name) is process
+
+    def _isStarting(self, group_name, process):
+        """ Return True if a released process has not finished starting """
+        if not self._exists(group_name, process):
+            return False
+        state = process.get_state()
+        if state == ProcessStates.STOPPED:
+            return not process.laststart # waiting for its group's transition
+        return state in (ProcessStates.STARTING, ProcessStates.BACKOFF)
+
+    def _subscribe(self):
+        # subscriptions can not be safely removed from inside a callback,
+        # so the scheduler stays subscribed once it has been used
+        if not self._subscribed:
+            events.subscribe(events.ProcessStateEvent, self.pump)
+            events.subscribe(events.TickEvent, self.pump)
+            self._subscribed = True
@@ -0,0 +1,175 @@
+import sys
+
+from supervisor_twiddler.compat import basestring
+
+# options of process configs that hold strings or dicts that are often
+# the same for many processes and are not changed after they are parsed
+SHARED_OPTIONS = ('command', 'directory', 'environment', 'serverurl',
+                  'stdout_logfile', 'stderr_logfile')
+
+class SharedValues:
+    """ A pool of option values that are shared by process configs.  When
+    a config is added, each of its options that is equal to one already in
+    the pool is replaced by the pooled value, so that thousands of similar
+    processes hold references to one copy of a large environment instead of
+    thousands of copies.
+
+    The keys and values of an environment are pooled strings too, so that
+    environments that differ only in a few variables (such as a worker
+    number) still share the strings of all the others.
+
+    Pooled values are counted by the configs that use them and are dropped
+    when the last of those configs is released.  The pool holds a reference
+    to each config until it is released.
+    """
+    def __init__(self):
+        self._strings = {} # {(type, string): [string, references, size]}
+        self._dicts = {} # {(length, hash): [[dict, references, size, keys]]}
+        self._configs = {} # {id(config): (config, uses)}
+
+    def share(self, config):
+        """ Replace the options of config with pooled values """
+        if id(config) in self._configs:
+            return
+        uses = []
+        for name in SHARED_OPTIONS:
+            value = getattr(config, name, None)
+            if isinstance(value, dict):
+                entry = self._shareDict(value)
+                if entry is None:
+                    continue
+                uses.append(entry)
+            elif isinstance(value, (bytes, basestring)):
+                uses.append(self._shareString(value))
+            else:
+                continue
+            pooled = self._pooledValue(uses[-1])
+            if pooled is not value:
+                setattr(config, name, pooled)
+        self._configs[id(config)] = (config, uses)
+
+    def release(self, config):
+        """ Stop counting the values used by config """
+        config, uses = self._configs.pop(id(config), (None, ()))
+        for use in uses:
+            if isinstance(use, tuple):
+                self._releaseString(use)
+            else:
+                self._releaseDict(use)
+
+    def prune(self, configs):
+        """ Release the configs in the pool that are not in configs, such
+        as those of processes that were removed by something that did not
+        release them.  Returns the number of configs released. """
+        kept = set([id(config) for config in configs])
+        stale = [config for key, (config, uses) in self._configs.items()
+                 if key not in kept]
+        for config in stale:
+            self.release(config)
+        return len(stale)
+
+    def __contains__(self, config):
+        return id(config) in self._configs
+
+    def report(self):
+        """ Return a dict with counts of the configs and values in the
+        pool and an estimate of the bytes saved by sharing them, less the
+        bytes used by the pool itself. """
+        values = 0
+        references = 0
+        saved = 0
+        overhead = (sys.getsizeof(self._strings) +
+                    sys.getsizeof(self._dicts) +
+                    sys.getsizeof(self._configs))
+        for key, entry in self._strings.items():
+            values += 1
+            references += entry[1]
+            saved += entry[2] * (entry[1] - 1)
+            overhead += sys.getsizeof(key) + sys.getsizeof(entry)
+        for key, bucket in self._dicts.items():
+            overhead += sys.getsizeof(key) + sys.getsizeof(bucket)
+            for entry in bucket:
+                values += 1
+                references += entry[1]
+                saved += entry[2] * (entry[1] - 1)
+                overhead += sys.getsizeof(entry) + sys.getsizeof(entry[3])
+        for record in self._configs.values():
+            overhead += sys.getsizeof(record) + sys.getsizeof(record[1])
+        return {'configs': len(self._configs),
+                'values': values,
+                'references': references,
+                'saved_bytes': saved - overhead}
+
+    def _pooledValue(self, use):
+        if isinstance(use, tuple):
+            return self._strings[use][0]
+        return use[0]
+
+    def _shareString(self, value):
+        """ Count a use of a string and return its key in the pool """
+        key = (type(value), value)
+        entry = self._strings.get(key)
+        if entry is None:
+            self._strings[key] = [value, 1, sys.getsizeof(value)]
+        else:
+            entry[1] += 1
+        return key
+
+    def _releaseString(self, key):
+        entry = self._strings[key]
+        entry[1] -= 1
+        if entry[1] == 0:
+            del self._strings[key]
+
+    def _shareDict(self, value):
+        """ Count a use of a dict and return its entry in the pool, or
+        None if it can not be shared.  The dict is found by a hash of its
+        items instead of by a copy of them, and a dict that is new to the
+        pool is replaced by one with pooled keys and values. """
+        key = _hash_dict(value)
+        if key is None:
+            return None
+        bucket = self._dicts.setdefault(key, [])
+        for entry in bucket:
+            if entry[0] == value:
+                entry[1] += 1
+                return entry
+
+        keys = []
+        pooled = {}
+        size = sys.getsizeof(value)
+        for k, v in value.items():
+            if isinstance(k, (bytes, basestring)):
+                keys.append(self._shareString(k))
+                k = self._strings[keys[-1]][0]
+            if isinstance(v, (bytes, basestring)):
+                keys.append(self._shareString(v))
+                v = self._strings[keys[-1]][0]
+            pooled[k] = v
+            size += sys.getsizeof(k) + sys.getsizeof(v)
+        entry = [pooled, 1, size, keys]
+        bucket.append(entry)
+        return entry
+
+    def _releaseDict(self, entry):
+        entry[1] -= 1
+        if entry[1] > 0:
+            return
+        key = _hash_dict(entry[0])
+        bucket = self._dicts[key]
+        bucket[:] = [e for e in bucket if e is not entry]
+        if not bucket:
+            del self._dicts[key]
+        for string_key in entry[3]:
+            self._releaseString(string_key)
+
+def _hash_dict(value):
+    """ Return a hashable key for the items of a dict that does not depend
+    on their order, or None if an item can not be hashed. """
+    h = 0
+    try:
+        for item in value.items():
+            h ^= hash(item)
+    except TypeError:
+        return None
+    return (len(value), h)
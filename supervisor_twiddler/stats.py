@@ -0,0 +1,113 @@
+import bisect
+import functools
+import time
+
+from supervisor.xmlrpc import RPCError
+
+timer = getattr(time, 'perf_counter', time.time)
+
+# upper bounds of the latency histogram buckets in seconds; the last
+# bucket (+Inf) holds everything slower
+BUCKET_BOUNDS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5,
+                 1.0, 5.0)
+
+class Stats:
+    """ Counts calls, errors by fault code, and a histogram of latencies
+    for each of a set of names, such as the names of RPC methods. """
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.entries = {} # {name: entry}
+
+    def record(self, name, seconds, error=None):
+        """ Record a call to name that took seconds.  error is a string
+        describing the error, such as a fault code, if it failed. """
+        entry = self.entries.get(name)
+        if entry is None:
+            entry = {'calls': 0,
+                     'errors': {},
+                     'total': 0.0,
+                     'max': 0.0,
+                     'buckets': [0] * (len(BUCKET_BOUNDS) + 1)}
+            self.entries[name] = entry
+        entry['calls'] += 1
+        entry['total'] += seconds
+        if seconds > entry['max']:
+            entry['max'] = seconds
+        entry['buckets'][bisect.bisect_left(BUCKET_BOUNDS, seconds)] += 1
+        if error is not None:
+            entry['errors'][error] = entry['errors'].get(error, 0) + 1
+
+    def wrap(self, name, method):
+        """ Return a function that calls method and records the call """
+        def wrapper(*args, **kw):
+            start = timer()
+            try:
+                result = method(*args, **kw)
+            except RPCError as e:
+                self.record(name, timer() - start, str(e.code))
+                raise
+            except Exception as e:
+                self.record(name, timer() - start, e.__class__.__name__)
+                raise
+            self.record(name, timer() - start)
+            return result
+        return functools.wraps(method)(wrapper)
+
+    def report(self):
+        """ Return a dict of the stats for each name that can be sent
+        over XML-RPC.  Times are in milliseconds and histogram counts
+        are cumulative, one for each of BUCKET_BOUNDS and then one for
+        all calls. """
+        report = {}
+        for name, entry in self.entries.items():
+            report[name] = {'calls': entry['calls'],
+                            'errors': sum(entry['errors'].values()),
+                            'faults': dict(entry['errors']),
+                            'total_ms': entry['total'] * 1000.0,
+                            'max_ms': entry['max'] * 1000.0,
+                            'histogram': _cumulative(entry['buckets'])}
+        return report
+
+    def prometheus(self, prefix, label):
+        """ Return the stats in the Prometheus text format.  Metric names
+        start with prefix and each name is the value of label. """
+        lines = []
+        names = sorted(self.entries.keys())
+
+        lines.append('# TYPE %s_calls_total counter' % prefix)
+        for name in names:
+            lines.append('%s_calls_total{%s="%s"} %d' % (
+                prefix, label, _escape(name), self.entries[name]['calls']))
+
+        lines.append('# TYPE %s_errors_total counter' % prefix)
+        for name in names:
+            for error, count in sorted(self.entries[name]['errors'].items()):
+                lines.append('%s_errors_total{%s="%s",error="%s"} %d' % (
+                    prefix, label, _escape(name), _escape(error), count))
+
+        lines.append('# TYPE %s_duration_seconds histogram' % prefix)
+        for name in names:
+            entry = self.entries[name]
+            counts = _cumulative(entry['buckets'])
+            bounds = [repr(b) for b in BUCKET_BOUNDS] + ['+Inf']
+            for bound, count in zip(bounds, counts):
+                lines.append('%s_duration_seconds_bucket{%s="%s",le="%s"} %d' % (
+                    prefix, label, _escape(name), bound, count))
+            lines.append('%s_duration_seconds_sum{%s="%s"} %r' % (
+                prefix, label, _escape(name), entry['total']))
+            lines.append('%s_duration_seconds_count{%s="%s"} %d' % (
+                prefix, label, _escape(name), entry['calls']))
+
+        return '\n'.join(lines) + '\n'
+
+def _cumulative(counts):
+    total = 0
+    cumulative = []
+    for count in counts:
+        total += count
+        cumulative.append(total)
+    return cumulative
+
+def _escape(value):
+    """ Escape a Prometheus label value """
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
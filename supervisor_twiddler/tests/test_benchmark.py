@@ -0,0 +1,87 @@
+import json
+import sys
+import unittest
+
+from supervisor.compat import StringIO
+
+class TestBenchmark(unittest.TestCase):
+    def test_percentile_of_empty_list_is_zero(self):
+        from supervisor_twiddler.benchmark import percentile
+        self.assertEqual(0.0, percentile([], 0.5))
+
+    def test_percentile_uses_nearest_rank(self):
+        from supervisor_twiddler.benchmark import percentile
+        values = list(range(101))
+        self.assertEqual(0, percentile(values, 0.0))
+        self.assertEqual(50, percentile(values, 0.5))
+        self.assertEqual(99, percentile(values, 0.99))
+        self.assertEqual(100, percentile(values, 1.0))
+
+    def test_summarize_reports_throughput(self):
+        from supervisor_twiddler.benchmark import summarize
+        result = summarize('op', 10, [0.5, 0.5], units=100)
+        self.assertEqual(2, result['count'])
+        self.assertEqual(2.0, result['ops_per_second'])
+        self.assertEqual(100.0, result['units_per_second'])
+        self.assertEqual(500.0, result['p50_ms'])
+
+    def test_run_reports_each_operation_for_each_size(self):
+        from supervisor_twiddler.benchmark import LocalTarget, run
+        target = LocalTarget()
+        report = run(target, sizes=[2, 3], repeat=2)
+        self.assertEqual('local', report['target'])
+        operations = [(r['operation'], r['size'], r['count'])
+                      for r in report['results']]
+        self.assertEqual([('addProgramToGroup', 2, 2),
+                          ('getGroupNames', 2, 2),
+                          ('removeProcessFromGroup', 2, 2),
+                          ('stdin_write_handler', 2, 2),
+                          ('xmlrpc_request', 2, 2),
+                          ('json_request', 2, 2),
+                          ('xmlrpc_response', 2, 2),
+                          ('json_response', 2, 2),
+                          ('addProgramToGroup', 3, 3),
+                          ('getGroupNames', 3, 2),
+                          ('removeProcessFromGroup', 3, 3),
+                          ('stdin_write_handler', 3, 3),
+                          ('xmlrpc_request', 3, 2),
+                          ('json_request', 3, 2),
+                          ('xmlrpc_response', 3, 2),
+                          ('json_response', 3, 2)], operations)
+        self.assertEqual([], list(target.supervisord.process_groups.keys()))
+
+    def test_main_writes_json(self):
+        from supervisor_twiddler import benchmark
+        stdout = StringIO()
+        old_stdout, sys.stdout = sys.stdout, stdout
+        try:
+            benchmark.main(['--sizes', '2', '--json'])
+        finally:
+            sys.stdout = old_stdout
+        report = json.loads(stdout.getvalue())
+        self.assertEqual(8, len(report['results']))
+
+    def test_bench_encoding_sends_the_same_call_both_ways(self):
+        from supervisor_twiddler.benchmark import bench_encoding
+        results = bench_encoding(5, repeat=1)
+        self.assertEqual(['xmlrpc_request', 'json_request',
+                          'xmlrpc_response', 'json_response'],
+                         [r['operation'] for r in results])
+        for result in results:
+            self.assertTrue(result['units_per_second'] > 0)
+
+    def test_main_rejects_sizes_out_of_range(self):
+        from supervisor_twiddler import benchmark
+        stderr = StringIO()
+        old_stderr, sys.stderr = sys.stderr, stderr
+        try:
+            self.assertRaises(SystemExit, benchmark.main, ['--sizes', '0'])
+            self.assertRaises(SystemExit, benchmark.main, ['--sizes', '50001'])
+        finally:
+            sys.stderr = old_stderr
+
+def test_suite():
+    return unittest.findTestCases(sys.modules[__name__])
+
+if __name__ == '__main__':
+    unittest.main(defaultTest='test_suite')
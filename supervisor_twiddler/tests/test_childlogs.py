@@ -0,0 +1,121 @@
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+from supervisor.datatypes import Automatic
+from supervisor.tests.base import DummyLogger
+
+class TestChildLogs(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def test_name_autochildlogs_names_auto_logs_without_creating_them(self):
+        from supervisor_twiddler.childlogs import name_autochildlogs
+        config = self.makeConfig(stderr_logfile='/var/log/foo.log')
+        name_autochildlogs(config)
+        self.assertEqual(self.tempdir, os.path.dirname(config.stdout_logfile))
+        self.assertTrue(os.path.basename(config.stdout_logfile).startswith(
+            'foo-stdout---abc-'))
+        self.assertFalse(os.path.exists(config.stdout_logfile))
+        self.assertEqual('/var/log/foo.log', config.stderr_logfile)
+        self.assertEqual([], os.listdir(self.tempdir))
+
+    def test_names_are_autochildlogs(self):
+        from supervisor_twiddler.childlogs import name_autochildlogs
+        from supervisor_twiddler.childlogs import is_autochildlog
+        config = self.makeConfig()
+        self.assertTrue(is_autochildlog(config, 'stdout', Automatic))
+        name_autochildlogs(config)
+        self.assertTrue(is_autochildlog(config, 'stdout',
+                                        config.stdout_logfile))
+        self.assertFalse(is_autochildlog(config, 'stdout',
+                                         config.stderr_logfile))
+        self.assertFalse(is_autochildlog(config, 'stdout', '/var/log/foo'))
+        self.assertFalse(is_autochildlog(config, 'stdout', None))
+
+    def test_inherit_autochildlogs_keeps_old_auto_log_names(self):
+        from supervisor_twiddler.childlogs import name_autochildlogs
+        from supervisor_twiddler.childlogs import inherit_autochildlogs
+        old_config = self.makeConfig()
+        name_autochildlogs(old_config)
+        new_config = self.makeConfig(stderr_logfile='/var/log/foo.log')
+        inherit_autochildlogs(old_config, new_config)
+        self.assertEqual(old_config.stdout_logfile, new_config.stdout_logfile)
+        self.assertEqual('/var/log/foo.log', new_config.stderr_logfile)
+
+    def test_remove_autochildlogs_removes_auto_logs_and_backups(self):
+        from supervisor_twiddler.childlogs import name_autochildlogs
+        from supervisor_twiddler.childlogs import remove_autochildlogs
+        other = os.path.join(self.tempdir, 'other.log')
+        config = self.makeConfig(stderr_logfile=other)
+        name_autochildlogs(config)
+        for filename in (config.stdout_logfile,
+                         config.stdout_logfile + '.1',
+                         config.stdout_logfile + '.2',
+                         other):
+            open(filename, 'w').close()
+        process = DummyProcess(config)
+
+        self.assertEqual(3, remove_autochildlogs(process))
+        self.assertEqual(['other.log'], os.listdir(self.tempdir))
+        self.assertTrue(process.handler.closed)
+
+    def test_remove_autochildlogs_ignores_files_that_do_not_exist(self):
+        from supervisor_twiddler.childlogs import name_autochildlogs
+        from supervisor_twiddler.childlogs import remove_autochildlogs
+        config = self.makeConfig()
+        name_autochildlogs(config)
+        self.assertEqual(0, remove_autochildlogs(DummyProcess(config)))
+        self.assertEqual([], config.options.logger.data)
+
+    def makeConfig(self, stdout_logfile=Automatic, stderr_logfile=Automatic):
+        options = DummyOptions(self.tempdir)
+        return DummyConfig(options, stdout_logfile, stderr_logfile)
+
+class DummyOptions:
+    identifier = 'abc'
+
+    def __init__(self, childlogdir):
+        self.childlogdir = childlogdir
+        self.logger = DummyLogger()
+
+class DummyConfig:
+    name = 'foo'
+    stdout_logfile_backups = 2
+    stderr_logfile_backups = 0
+
+    def __init__(self, options, stdout_logfile, stderr_logfile):
+        self.options = options
+        self.stdout_logfile = stdout_logfile
+        self.stderr_logfile = stderr_logfile
+
+class DummyHandler:
+    closed = False
+
+    def close(self):
+        self.closed = True
+
+class DummyLog:
+    def __init__(self, handler):
+        self.handlers = [handler]
+
+class DummyDispatcher:
+    def __init__(self, handler):
+        self.normallog = DummyLog(handler)
+
+class DummyProcess:
+    def __init__(self, config):
+        self.config = config
+        self.handler = DummyHandler()
+        self.dispatchers = {1: DummyDispatcher(self.handler)}
+
+def test_suite():
+    return unittest.findTestCases(sys.modules[__name__])
+
+if __name__ == '__main__':
+    unittest.main(defaultTest='test_suite')
@@ -0,0 +1,196 @@
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+
+from supervisor.compat import xmlrpclib
+
+from supervisor_twiddler.rpcinterface import Faults
+
+class TestFleetClient(unittest.TestCase):
+    def test_ctor_raises_when_concurrency_is_less_than_one(self):
+        self.assertRaises(ValueError, self.makeOne, ['unix:///tmp/x'],
+                          concurrency=0)
+
+    def test_call_returns_results_in_order_of_serverurls(self):
+        urls = ['unix:///tmp/%d.sock' % i for i in range(5)]
+        client = self.makeOne(urls, concurrency=3)
+        for url in urls:
+            client._hosts[url] = DummyHost(url, [url])
+        results = client.getGroupNames()
+        self.assertEqual(urls, [r.serverurl for r in results])
+        self.assertEqual(urls, [r.value for r in results])
+        self.assertEqual([True] * 5, [r.ok for r in results])
+
+    def test_call_passes_args(self):
+        client = self.makeOne(['unix:///tmp/a.sock'])
+        host = DummyHost('unix:///tmp/a.sock', [True])
+        client._hosts[host.serverurl] = host
+        client.addGroup('foo', 5)
+        self.assertEqual([('addGroup', ('foo', 5))], host.calls)
+
+    def test_map_uses_args_for_each_host(self):
+        urls = ['unix:///tmp/a.sock', 'unix:///tmp/b.sock']
+        client = self.makeOne(urls)
+        for url in urls:
+            client._hosts[url] = DummyHost(url, [True])
+        client.map('addGroup', [('a',), ('b',)])
+        self.assertEqual([('addGroup', ('a',))], client._hosts[urls[0]].calls)
+        self.assertEqual([('addGroup', ('b',))], client._hosts[urls[1]].calls)
+
+    def test_map_raises_for_wrong_number_of_args(self):
+        client = self.makeOne(['unix:///tmp/a.sock'])
+        self.assertRaises(ValueError, client.map, 'addGroup', [])
+
+    def test_unknown_method_raises_attribute_error(self):
+        client = self.makeOne(['unix:///tmp/a.sock'])
+        self.assertRaises(AttributeError, getattr, client, 'nonexistent')
+        self.assertRaises(ValueError, client.call, 'nonexistent')
+
+    def test_faults_are_returned_without_retrying(self):
+        client = self.makeOne(['unix:///tmp/a.sock'], retry_delay=0)
+        fault = xmlrpclib.Fault(10, 'BAD_NAME: foo')
+        host = DummyHost('unix:///tmp/a.sock', [fault, True])
+        client._hosts[host.serverurl] = host
+        result = client.removeGroup('foo')[0]
+        self.assertFalse(result.ok)
+        self.assertEqual(10, result.fault_code)
+        self.assertEqual('BAD_NAME: foo', result.fault_string)
+        self.assertEqual(1, result.attempts)
+
+    def test_rate_limited_calls_are_retried(self):
+        client = self.makeOne(['unix:///tmp/a.sock'], retry_delay=0)
+        fault = xmlrpclib.Fault(Faults.RATE_LIMITED, 'RATE_LIMITED')
+        host = DummyHost('unix:///tmp/a.sock', [fault, True])
+        client._hosts[host.serverurl] = host
+        result = client.addGroup('foo')[0]
+        self.assertTrue(result.ok)
+        self.assertEqual(True, result.value)
+        self.assertEqual(2, result.attempts)
+
+    def test_connection_errors_are_retried_then_returned(self):
+        client = self.makeOne(['unix:///tmp/a.sock'], retries=2,
+                              retry_delay=0)
+        error = IOError('refused')
+        host = DummyHost('unix:///tmp/a.sock', [error, error, error])
+        client._hosts[host.serverurl] = host
+        result = client.getGroupNames()[0]
+        self.assertFalse(result.ok)
+        self.assertTrue(result.error.endswith(': refused'))
+        self.assertEqual(3, result.attempts)
+        self.assertEqual(3, host.closed)
+
+    def makeOne(self, *arg, **kw):
+        from supervisor_twiddler.client import FleetClient
+        return FleetClient(*arg, **kw)
+
+class TestFleetClientWithSupervisord(unittest.TestCase):
+    """ Runs supervisord instances on unix sockets and calls them """
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.supervisords = []
+        self.serverurls = []
+        for i in range(2):
+            sockfile = os.path.join(self.tempdir, 'supervisor%d.sock' % i)
+            self.supervisords.append(self.startSupervisord(i, sockfile))
+            self.serverurls.append('unix://' + sockfile)
+        for serverurl in self.serverurls:
+            if not self.waitForSocket(serverurl[7:]):
+                self.tearDown()
+                self.skipTest('supervisord did not start')
+
+    def tearDown(self):
+        for process in self.supervisords:
+            if process.poll() is None:
+                process.terminate()
+                process.wait()
+        self.supervisords = []
+        shutil.rmtree(self.tempdir, ignore_errors=True)
+
+    def startSupervisord(self, i, sockfile):
+        here = os.path.join(self.tempdir, str(i))
+        os.mkdir(here)
+        conf = os.path.join(here, 'supervisord.conf')
+        with open(conf, 'w') as f:
+            f.write(SUPERVISORD_CONF % {'here': here, 'sockfile': sockfile})
+        env = dict(os.environ)
+        root = os.path.dirname(os.path.dirname(os.path.dirname(
+            os.path.abspath(__file__))))
+        env['PYTHONPATH'] = os.pathsep.join(
+            [root] + [p for p in sys.path if p])
+        return subprocess.Popen(
+            [sys.executable, '-c',
+             'from supervisor.supervisord import main; main()',
+             '-n', '-c', conf], env=env,
+            stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+
+    def waitForSocket(self, sockfile, timeout=10):
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            if os.path.exists(sockfile):
+                return True
+            time.sleep(0.05)
+        return False
+
+    def test_fan_out_to_supervisord_instances(self):
+        from supervisor_twiddler.client import FleetClient
+        client = FleetClient(self.serverurls, concurrency=2, retry_delay=0.1)
+        try:
+            results = client.addGroup('fleet')
+            self.assertEqual([True, True], [r.value for r in results])
+
+            options = {'command': '/bin/cat', 'autostart': 'false'}
+            results = client.addProgramToGroup('fleet', 'cat', options)
+            self.assertEqual([True, True], [r.value for r in results])
+
+            results = client.addProgramToGroup('fleet', 'cat', options)
+            self.assertEqual([10, 10], [r.fault_code for r in results])
+
+            results = client.getProcessInventory('fleet')
+            for result in results:
+                names = [p['name'] for p in result.value['processes']]
+                self.assertEqual(['cat'], names)
+        finally:
+            client.close()
+
+SUPERVISORD_CONF = """\
+[supervisord]
+logfile = %(here)s/supervisord.log
+pidfile = %(here)s/supervisord.pid
+childlogdir = %(here)s
+
+[unix_http_server]
+file = %(sockfile)s
+
+[rpcinterface:supervisor]
+supervisor.rpcinterface_factory = supervisor.rpcinterface:make_main_rpcinterface
+
+[rpcinterface:twiddler]
+supervisor.rpcinterface_factory = supervisor_twiddler.rpcinterface:make_twiddler_rpcinterface
+"""
+
+class DummyHost:
+    def __init__(self, serverurl, responses):
+        self.serverurl = serverurl
+        self.responses = list(responses)
+        self.calls = []
+        self.closed = 0
+
+    def call(self, method, args):
+        self.calls.append((method, args))
+        response = self.responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+    def close(self):
+        self.closed += 1
+
+def test_suite():
+    return unittest.findTestCases(sys.modules[__name__])
+
+if __name__ == '__main__':
+    unittest.main(defaultTest='test_suite')
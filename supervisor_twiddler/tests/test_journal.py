@@ -0,0 +1,91 @@
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+class TestJournal(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tempdir, 'twiddler.journal')
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def test_load_returns_empty_list_when_no_files_exist(self):
+        journal = self.makeOne(self.path)
+        self.assertEqual([], journal.load())
+        self.assertEqual(0, journal.sequence)
+
+    def test_append_writes_calls_that_are_loaded_in_order(self):
+        journal = self.makeOne(self.path)
+        journal.append('addGroup', ('foo', 999))
+        journal.append('removeGroup', ('foo',))
+        journal.close()
+
+        journal = self.makeOne(self.path)
+        self.assertEqual([('addGroup', ['foo', 999]),
+                          ('removeGroup', ['foo'])], journal.load())
+        self.assertEqual(2, journal.sequence)
+
+    def test_append_returns_true_when_compaction_is_due(self):
+        journal = self.makeOne(self.path, compact_after=2)
+        self.assertFalse(journal.append('addGroup', ('foo', 999)))
+        self.assertTrue(journal.append('addGroup', ('bar', 999)))
+        journal.close()
+
+    def test_load_ignores_partial_last_line(self):
+        journal = self.makeOne(self.path)
+        journal.append('addGroup', ('foo', 999))
+        journal.close()
+        with open(self.path, 'a') as f:
+            f.write('[2, "addGroup", ["ba')
+
+        journal = self.makeOne(self.path)
+        self.assertEqual([('addGroup', ['foo', 999])], journal.load())
+
+    def test_compact_replaces_journal_with_snapshot(self):
+        journal = self.makeOne(self.path)
+        journal.append('addGroup', ('foo', 999))
+        journal.append('removeGroup', ('foo',))
+        journal.compact([('addGroup', ['bar', 5])])
+        journal.append('addGroup', ('baz', 999))
+        journal.close()
+
+        self.assertTrue(os.path.exists(journal.snapshot_path))
+        journal = self.makeOne(self.path)
+        self.assertEqual([('addGroup', ['bar', 5]),
+                          ('addGroup', ['baz', 999])], journal.load())
+        self.assertEqual(3, journal.sequence)
+
+    def test_load_skips_calls_already_in_snapshot(self):
+        journal = self.makeOne(self.path)
+        journal.append('addGroup', ('foo', 999))
+        journal.close()
+        saved = open(self.path).read()
+
+        journal = self.makeOne(self.path)
+        journal.load()
+        journal.compact([('addGroup', ['foo', 999])])
+        journal.close()
+
+        # simulate supervisord dying after the snapshot was written
+        # but before the journal was emptied
+        with open(self.path, 'w') as f:
+            f.write(saved)
+
+        journal = self.makeOne(self.path)
+        self.assertEqual([('addGroup', ['foo', 999])], journal.load())
+
+    def getTargetClass(self):
+        from supervisor_twiddler.journal import Journal
+        return Journal
+
+    def makeOne(self, *arg, **kw):
+        return self.getTargetClass()(*arg, **kw)
+
+def test_suite():
+    return unittest.findTestCases(sys.modules[__name__])
+
+if __name__ == '__main__':
+    unittest.main(defaultTest='test_suite')
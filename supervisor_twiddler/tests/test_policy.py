@@ -0,0 +1,109 @@
+import sys
+import unittest
+
+METHODS = ['getGroupNames', 'addGroup', 'removeGroup', 'callJSON']
+
+class TestPolicy(unittest.TestCase):
+    def test_check_allows_everything_by_default(self):
+        policy = self.makeOne(METHODS)
+        for name in METHODS:
+            self.assertEqual(None, policy.check(name))
+        self.assertEqual(None, policy.check_group('anything'))
+
+    def test_check_denies_methods_not_in_whitelist(self):
+        policy = self.makeOne(METHODS, whitelist=['getGroupNames'])
+        self.assertEqual(None, policy.check('getGroupNames'))
+        self.assertEqual(('NOT_IN_WHITELIST', 'addGroup'),
+                         policy.check('addGroup'))
+
+    def test_check_denies_unknown_methods(self):
+        policy = self.makeOne(METHODS)
+        self.assertEqual(('NOT_IN_WHITELIST', 'nonexistent'),
+                         policy.check('nonexistent'))
+
+    def test_check_denies_writes_when_read_only(self):
+        policy = self.makeOne(METHODS, read_only=True)
+        self.assertEqual(None, policy.check('getGroupNames'))
+        self.assertEqual(('READ_ONLY', 'addGroup'), policy.check('addGroup'))
+
+    def test_check_leaves_dispatch_methods_to_the_methods_they_call(self):
+        clock = DummyClock()
+        policy = self.makeOne(METHODS, read_only=True, mutation_rate=1,
+                              clock=clock)
+        for i in range(3):
+            self.assertEqual(None, policy.check('callJSON'))
+
+    def test_check_limits_rate_of_calls(self):
+        clock = DummyClock()
+        policy = self.makeOne(METHODS, rate_limits={'addGroup': (1, 2)},
+                              clock=clock)
+        self.assertEqual(None, policy.check('addGroup'))
+        self.assertEqual(None, policy.check('addGroup'))
+        self.assertEqual(('RATE_LIMITED', 'addGroup'), policy.check('addGroup'))
+        self.assertEqual(None, policy.check('removeGroup'))
+        clock.now += 1
+        self.assertEqual(None, policy.check('addGroup'))
+
+    def test_check_limits_rate_of_all_mutations_together(self):
+        clock = DummyClock()
+        policy = self.makeOne(METHODS, mutation_rate=1, mutation_burst=2,
+                              clock=clock)
+        self.assertEqual(None, policy.check('addGroup'))
+        self.assertEqual(None, policy.check('removeGroup'))
+        self.assertEqual(('RATE_LIMITED', 'addGroup'), policy.check('addGroup'))
+        self.assertEqual(None, policy.check('getGroupNames'))
+
+    def test_check_does_not_take_tokens_for_denied_calls(self):
+        clock = DummyClock()
+        policy = self.makeOne(METHODS, read_only=True,
+                              rate_limits={'getGroupNames': (1, 1)},
+                              clock=clock)
+        policy.check('addGroup')
+        self.assertEqual(None, policy.check('getGroupNames'))
+
+    def test_ctor_raises_for_rate_limit_of_unknown_method(self):
+        self.assertRaises(ValueError, self.makeOne, METHODS,
+                          rate_limits={'nonexistent': (1, None)})
+
+    def test_check_group_matches_patterns(self):
+        policy = self.makeOne(METHODS, group_patterns=['tenant_*', 'shared'])
+        self.assertEqual(None, policy.check_group('tenant_a'))
+        self.assertEqual(None, policy.check_group('shared'))
+        self.assertEqual(('GROUP_NOT_PERMITTED', 'group: shared2'),
+                         policy.check_group('shared2'))
+        self.assertEqual(('GROUP_NOT_PERMITTED', 'group: other'),
+                         policy.check_group('other'))
+
+    def makeOne(self, *arg, **kw):
+        from supervisor_twiddler.policy import Policy
+        return Policy(*arg, **kw)
+
+class TestParseRateLimits(unittest.TestCase):
+    def test_parses_rates_and_bursts(self):
+        from supervisor_twiddler.policy import parse_rate_limits
+        self.assertEqual({'addGroup': (10.0, None),
+                          'removeGroup': (0.5, 5.0)},
+                         parse_rate_limits('addGroup:10, removeGroup:0.5:5'))
+
+    def test_empty_string_is_no_limits(self):
+        from supervisor_twiddler.policy import parse_rate_limits
+        self.assertEqual({}, parse_rate_limits(''))
+
+    def test_raises_for_bad_limits(self):
+        from supervisor_twiddler.policy import parse_rate_limits
+        for bad in ('addGroup', 'addGroup:x', 'addGroup:0', 'addGroup:1:0',
+                    'addGroup:1:2:3'):
+            self.assertRaises(ValueError, parse_rate_limits, bad)
+
+class DummyClock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+def test_suite():
+    return unittest.findTestCases(sys.modules[__name__])
+
+if __name__ == '__main__':
+    unittest.main(defaultTest='test_suite')
@@ -4,6 +4,7 @@ import supervisor_twiddler
 import supervisor_twiddler.resulthandler
 from supervisor_twiddler.compat import _b, _u
 from supervisor.tests.base import DummyEvent, DummyOptions, DummyPConfig, DummyProcess
+from supervisor.tests.base import DummyPGroupConfig, DummyProcessGroup
 from supervisor.dispatchers import RejectEvent
 
 class TestStdinWriteHandler(unittest.TestCase):
@@ -32,7 +33,7 @@ class TestStdinWriteHandler(unittest.TestCase):
 
         response = 'STDIN:foobar'
         supervisor_twiddler.resulthandler.stdin_write_handler(event, response)
-        self.assertEqual(process.stdin_buffer, 'foobar')
+        self.assertEqual(process.stdin_buffer, _b('foobar'))
 
     def test_write_encodes_unicode_as_utf8(self):
         options = DummyOptions()
@@ -47,7 +48,71 @@ class TestStdinWriteHandler(unittest.TestCase):
 
         response = _u(_b('STDIN:foobar'))
         supervisor_twiddler.resulthandler.stdin_write_handler(event, response)
-        self.assertEqual(process.stdin_buffer, 'foobar')
+        self.assertEqual(process.stdin_buffer, _b('foobar'))
+
+    def test_handler_does_nothing_when_response_is_OK_bytes(self):
+        event = DummyEvent()
+        response = _b('OK')
+        supervisor_twiddler.resulthandler.stdin_write_handler(event, response)
+
+    def test_handler_rejects_event_when_bytes_response_is_unexpected(self):
+        event = DummyEvent()
+        response = _b('unexpected')
+        self.assertRaises(RejectEvent,
+                          supervisor_twiddler.resulthandler.stdin_write_handler,
+                          event, response)
+
+    def test_handler_writes_binary_payload_intact(self):
+        options = DummyOptions()
+        config = DummyPConfig(options, 'cat', 'bin/cat')
+
+        process = DummyProcess(config)
+        process.pid = 42
+        process.killing = False
+
+        event = DummyEvent()
+        event.process = process
+
+        payload = _b('\x00\xff\xfe\n\r\x80STDIN:')
+        response = _b('STDIN:') + payload
+        supervisor_twiddler.resulthandler.stdin_write_handler(event, response)
+        self.assertEqual(process.stdin_buffer, payload)
+
+    def test_handler_writes_view_of_bytes_response(self):
+        options = DummyOptions()
+        config = DummyPConfig(options, 'cat', 'bin/cat')
+
+        process = DummyProcess(config)
+        process.pid = 42
+        process.killing = False
+        written = []
+        process.write = written.append
+
+        event = DummyEvent()
+        event.process = process
+
+        response = _b('STDIN:foobar')
+        supervisor_twiddler.resulthandler.stdin_write_handler(event, response)
+        self.assertEqual(len(written), 1)
+        self.assertEqual(bytes(written[0]), _b('foobar'))
+        if sys.version_info[0] >= 3:
+            self.assertTrue(isinstance(written[0], memoryview))
+            self.assertTrue(written[0].obj is response)
+
+    def test_handler_records_timings_by_kind_of_result_when_enabled(self):
+        from supervisor_twiddler.resulthandler import timings
+        event = DummyEvent()
+        handler = supervisor_twiddler.resulthandler.stdin_write_handler
+        timings.enabled = True
+        try:
+            handler(event, _b('OK'))
+            self.assertRaises(RejectEvent, handler, event, _b('unexpected'))
+            report = timings.report()
+        finally:
+            timings.enabled = False
+            timings.entries.clear()
+        self.assertEqual(1, report['OK']['calls'])
+        self.assertEqual({'rejected': 1}, report['other']['faults'])
 
     def test_write_fails_silently_if_process_has_no_pid(self):
         options = DummyOptions()
@@ -62,7 +127,7 @@ class TestStdinWriteHandler(unittest.TestCase):
 
         response = 'STDIN:foobar'
         supervisor_twiddler.resulthandler.stdin_write_handler(event, response)
-        self.assertEqual(process.stdin_buffer, '')
+        self.assertEqual(process.stdin_buffer, _b(''))
 
     def test_write_fails_silently_if_process_is_killing(self):
         options = DummyOptions()
@@ -77,7 +142,7 @@ class TestStdinWriteHandler(unittest.TestCase):
 
         response = 'STDIN:foobar'
         supervisor_twiddler.resulthandler.stdin_write_handler(event, response)
-        self.assertEqual(process.stdin_buffer, '')
+        self.assertEqual(process.stdin_buffer, _b(''))
 
     def test_write_fails_silently_if_oserror_during_write(self):
         options = DummyOptions()
@@ -87,13 +152,313 @@ class TestStdinWriteHandler(unittest.TestCase):
         process.pid = 42
         process.killing = False
         process.write_error = True
+        process.write_exception = OSError()
 
         event = DummyEvent()
         event.process = process
 
         response = 'STDIN:foobar'
         supervisor_twiddler.resulthandler.stdin_write_handler(event, response)
-        self.assertEqual(process.stdin_buffer, '')
+        self.assertEqual(process.stdin_buffer, _b(''))
+
+class TestBoundedStdinWriteHandler(unittest.TestCase):
+    def _makeProcess(self, pending=_b('')):
+        return makeBufferedProcess('cat', pending)
+
+    def _makeEvent(self, process):
+        event = DummyEvent()
+        event.process = process
+        return event
+
+    def _makeOne(self, *args):
+        from supervisor_twiddler.resulthandler import make_stdin_write_handler
+        return make_stdin_write_handler(*args)
+
+    def test_ctor_raises_for_unknown_policy(self):
+        self.assertRaises(ValueError, self._makeOne, 10, 'unknown')
+
+    def test_writes_when_under_high_water(self):
+        handler = self._makeOne(10, 'drop')
+        process = self._makeProcess()
+        handler(self._makeEvent(process), 'STDIN:foobar')
+        dispatcher = process.dispatchers[5]
+        self.assertEqual(dispatcher.input_buffer, _b('foobar'))
+        stats = handler.stats['cat']
+        self.assertEqual(stats['queued_bytes'], 6)
+        self.assertEqual(stats['pending_bytes'], 6)
+        self.assertEqual(stats['dropped_bytes'], 0)
+
+    def test_drop_policy_drops_when_over_high_water(self):
+        handler = self._makeOne(10, 'drop')
+        process = self._makeProcess(_b('12345'))
+        handler(self._makeEvent(process), 'STDIN:foobar')
+        dispatcher = process.dispatchers[5]
+        self.assertEqual(dispatcher.input_buffer, _b('12345'))
+        stats = handler.stats['cat']
+        self.assertEqual(stats['queued_bytes'], 0)
+        self.assertEqual(stats['dropped_bytes'], 6)
+
+    def test_block_policy_rejects_event_when_over_high_water(self):
+        handler = self._makeOne(10, 'block')
+        process = self._makeProcess(_b('12345'))
+        self.assertRaises(RejectEvent,
+                          handler, self._makeEvent(process), 'STDIN:foobar')
+        dispatcher = process.dispatchers[5]
+        self.assertEqual(dispatcher.input_buffer, _b('12345'))
+        stats = handler.stats['cat']
+        self.assertEqual(stats['blocked_bytes'], 6)
+        self.assertEqual(stats['dropped_bytes'], 0)
+
+    def test_block_policy_accepts_event_again_after_buffer_drains(self):
+        handler = self._makeOne(10, 'block')
+        process = self._makeProcess(_b('12345'))
+        event = self._makeEvent(process)
+        self.assertRaises(RejectEvent, handler, event, 'STDIN:foobar')
+        process.dispatchers[5].input_buffer = _b('')
+        handler(event, 'STDIN:foobar')
+        self.assertEqual(process.dispatchers[5].input_buffer, _b('foobar'))
+
+    def test_counts_written_bytes_as_buffer_drains(self):
+        handler = self._makeOne(100, 'drop')
+        process = self._makeProcess()
+        event = self._makeEvent(process)
+        handler(event, 'STDIN:foobar')
+        process.dispatchers[5].input_buffer = _b('bar')
+        handler(event, 'STDIN:baz')
+        stats = handler.stats['cat']
+        self.assertEqual(stats['queued_bytes'], 9)
+        self.assertEqual(stats['written_bytes'], 3)
+        self.assertEqual(stats['pending_bytes'], 6)
+
+    def test_accepts_payload_larger_than_high_water_when_buffer_is_empty(self):
+        for policy in ('drop', 'block'):
+            handler = self._makeOne(10, policy)
+            process = self._makeProcess()
+            handler(self._makeEvent(process), 'STDIN:' + 'x' * 20)
+            self.assertEqual(process.dispatchers[5].input_buffer, _b('x' * 20))
+            stats = handler.stats['cat']
+            self.assertEqual(stats['queued_bytes'], 20)
+            self.assertEqual(stats['dropped_bytes'], 0)
+            self.assertEqual(stats['blocked_bytes'], 0)
+
+            # but the next payload waits until the buffer drains
+            if policy == 'block':
+                self.assertRaises(RejectEvent, handler,
+                                  self._makeEvent(process), 'STDIN:y')
+            else:
+                handler(self._makeEvent(process), 'STDIN:y')
+                self.assertEqual(stats['dropped_bytes'], 1)
+
+    def test_block_policy_accepts_large_frames_when_buffer_is_empty(self):
+        handler = self._makeOne(10, 'block')
+        process = self._makeProcess()
+        handler(self._makeEvent(process), 'STDINS:- 20\n' + 'x' * 20)
+        self.assertEqual(process.dispatchers[5].input_buffer, _b('x' * 20))
+
+    def test_zero_high_water_is_unbounded(self):
+        handler = self._makeOne(0, 'block')
+        process = self._makeProcess(_b('x') * 1000)
+        handler(self._makeEvent(process), 'STDIN:foobar')
+        self.assertEqual(len(process.dispatchers[5].input_buffer), 1006)
+
+    def test_counts_dropped_bytes_if_process_has_no_pid(self):
+        handler = self._makeOne(10, 'block')
+        process = self._makeProcess()
+        process.pid = None
+        handler(self._makeEvent(process), 'STDIN:foobar')
+        self.assertEqual(handler.stats['cat']['dropped_bytes'], 6)
+
+class TestFramedStdinWriteHandler(unittest.TestCase):
+    def _makeGroup(self, *names):
+        options = DummyOptions()
+        gconfig = DummyPGroupConfig(options, 'workers')
+        group = DummyProcessGroup(gconfig)
+        group.processes = {}
+        for name in names:
+            process = makeBufferedProcess(name)
+            process.group = group
+            group.processes[name] = process
+        return group
+
+    def _makeEvent(self, process):
+        event = DummyEvent()
+        event.process = process
+        return event
+
+    def _makeOne(self, *args):
+        from supervisor_twiddler.resulthandler import make_stdin_write_handler
+        return make_stdin_write_handler(*args)
+
+    def _buffer(self, process):
+        return process.dispatchers[5].input_buffer
+
+    def test_writes_frame_to_event_process(self):
+        group = self._makeGroup('worker_1')
+        process = group.processes['worker_1']
+        handler = self._makeOne()
+        handler(self._makeEvent(process), 'STDINS:- 6\nfoobar')
+        self.assertEqual(self._buffer(process), _b('foobar'))
+
+    def test_writes_frames_to_other_processes_in_group(self):
+        group = self._makeGroup('worker_1', 'worker_2')
+        process = group.processes['worker_1']
+        handler = self._makeOne()
+        response = 'STDINS:- 3\nfooworker_2 3\nbar'
+        handler(self._makeEvent(process), response)
+        self.assertEqual(self._buffer(process), _b('foo'))
+        self.assertEqual(self._buffer(group.processes['worker_2']), _b('bar'))
+
+    def test_coalesces_frames_into_one_write_per_process(self):
+        group = self._makeGroup('worker_1', 'worker_2')
+        process = group.processes['worker_1']
+        handler = self._makeOne()
+        response = 'STDINS:- 3\nfooworker_2 1\n1- 3\nbarworker_2 1\n2'
+        handler(self._makeEvent(process), response)
+        self.assertEqual(self._buffer(process), _b('foobar'))
+        self.assertEqual(process.dispatchers[5].writes, 1)
+        worker_2 = group.processes['worker_2']
+        self.assertEqual(self._buffer(worker_2), _b('12'))
+        self.assertEqual(worker_2.dispatchers[5].writes, 1)
+
+    def test_payloads_may_contain_newlines(self):
+        group = self._makeGroup('worker_1')
+        process = group.processes['worker_1']
+        handler = self._makeOne()
+        handler(self._makeEvent(process), 'STDINS:- 8\nfoo\nbar\n')
+        self.assertEqual(self._buffer(process), _b('foo\nbar\n'))
+
+    def test_writes_binary_frames_from_bytes_response_intact(self):
+        group = self._makeGroup('worker_1', 'worker_2')
+        process = group.processes['worker_1']
+        handler = self._makeOne()
+        response = (_b('STDINS:- 3\n\x00\xff\n') +
+                    _b('worker_2 2\n\x80\x81') +
+                    _b('- 2\n\r\n'))
+        handler(self._makeEvent(process), response)
+        self.assertEqual(self._buffer(process), _b('\x00\xff\n\r\n'))
+        worker_2 = group.processes['worker_2']
+        self.assertEqual(self._buffer(worker_2), _b('\x80\x81'))
+
+    def test_skips_frames_for_unknown_processes(self):
+        group = self._makeGroup('worker_1')
+        process = group.processes['worker_1']
+        handler = self._makeOne()
+        response = 'STDINS:nonexistent 3\nfoo- 3\nbar'
+        handler(self._makeEvent(process), response)
+        self.assertEqual(self._buffer(process), _b('bar'))
+
+    def test_rejects_event_when_frames_are_malformed(self):
+        group = self._makeGroup('worker_1')
+        process = group.processes['worker_1']
+        handler = self._makeOne()
+        event = self._makeEvent(process)
+        for response in ('STDINS:- 3', 'STDINS:- x\nfoo',
+                         'STDINS:- 4\nfoo', 'STDINS:-\nfoo'):
+            self.assertRaises(RejectEvent, handler, event, response)
+        self.assertEqual(self._buffer(process), _b(''))
+
+    def test_block_policy_rejects_event_without_writing_any_frames(self):
+        group = self._makeGroup('worker_1', 'worker_2')
+        process = group.processes['worker_1']
+        worker_2 = group.processes['worker_2']
+        worker_2.dispatchers[5].input_buffer = _b('12345')
+        handler = self._makeOne(8, 'block')
+        response = 'STDINS:- 3\nfooworker_2 6\nfoobar'
+        self.assertRaises(RejectEvent,
+                          handler, self._makeEvent(process), response)
+        self.assertEqual(self._buffer(process), _b(''))
+        self.assertEqual(self._buffer(worker_2), _b('12345'))
+
+    def test_drop_policy_writes_frames_that_fit(self):
+        group = self._makeGroup('worker_1', 'worker_2')
+        process = group.processes['worker_1']
+        worker_2 = group.processes['worker_2']
+        worker_2.dispatchers[5].input_buffer = _b('12345')
+        handler = self._makeOne(8, 'drop')
+        response = 'STDINS:- 3\nfooworker_2 6\nfoobar'
+        handler(self._makeEvent(process), response)
+        self.assertEqual(self._buffer(process), _b('foo'))
+        self.assertEqual(self._buffer(worker_2), _b('12345'))
+        self.assertEqual(handler.stats['worker_2']['dropped_bytes'], 6)
+
+class TestByteStats(unittest.TestCase):
+    def setUp(self):
+        from supervisor_twiddler.resulthandler import forget_byte_stats
+        forget_byte_stats(['stats_a', 'stats_b'])
+
+    tearDown = setUp
+
+    def _makeOne(self, *args):
+        from supervisor_twiddler.resulthandler import make_stdin_write_handler
+        return make_stdin_write_handler(*args)
+
+    def _write(self, handler, name, chars, pending=_b('')):
+        event = DummyEvent()
+        event.process = makeBufferedProcess(name, pending)
+        handler(event, _b('STDIN:') + chars)
+
+    def test_byte_stats_adds_counters_of_all_handlers(self):
+        from supervisor_twiddler.resulthandler import byte_stats
+        first = self._makeOne()
+        second = self._makeOne(1, 'drop')
+        self._write(first, 'stats_a', _b('foo'))
+        self._write(second, 'stats_a', _b('foobar'), _b('z'))
+        self._write(second, 'stats_b', _b('x'))
+        stats = byte_stats()
+        self.assertEqual(3, stats['stats_a']['queued_bytes'])
+        self.assertEqual(6, stats['stats_a']['dropped_bytes'])
+        self.assertEqual(1, stats['stats_b']['queued_bytes'])
+        self.assertEqual({'queued_bytes': 3, 'written_bytes': 0,
+                          'dropped_bytes': 0, 'blocked_bytes': 0,
+                          'pending_bytes': 3}, first.stats['stats_a'])
+
+    def test_forget_byte_stats_drops_counters_of_all_handlers(self):
+        from supervisor_twiddler.resulthandler import byte_stats
+        from supervisor_twiddler.resulthandler import forget_byte_stats
+        first = self._makeOne()
+        second = self._makeOne()
+        self._write(first, 'stats_a', _b('foo'))
+        self._write(second, 'stats_a', _b('foo'))
+        self._write(second, 'stats_b', _b('foo'))
+        forget_byte_stats(['stats_a'])
+        self.assertEqual({}, first.stats)
+        self.assertEqual(['stats_b'], list(second.stats.keys()))
+        self.assertFalse('stats_a' in byte_stats())
+
+    def test_byte_stats_prometheus(self):
+        from supervisor_twiddler.resulthandler import byte_stats_prometheus
+        handler = self._makeOne()
+        self._write(handler, 'stats_a', _b('foo'))
+        text = byte_stats_prometheus('twiddler_stdin')
+        self.assertTrue('# TYPE twiddler_stdin_bytes_total counter\n' in text)
+        self.assertTrue('twiddler_stdin_bytes_total{process="stats_a",'
+                        'result="queued"} 3\n' in text)
+        self.assertTrue('# TYPE twiddler_stdin_pending_bytes gauge\n' in text)
+        self.assertTrue('twiddler_stdin_pending_bytes{process="stats_a"} 3\n'
+                        in text)
+
+def makeBufferedProcess(name, pending=_b('')):
+    options = DummyOptions()
+    config = DummyPConfig(options, name, 'bin/cat')
+
+    process = DummyProcess(config)
+    process.pid = 42
+    process.killing = False
+
+    dispatcher = DummyStdinDispatcher(pending)
+    process.pipes = {'stdin': 5}
+    process.dispatchers = {5: dispatcher}
+    process.write = dispatcher.write
+    return process
+
+class DummyStdinDispatcher:
+    def __init__(self, input_buffer=_b('')):
+        self.input_buffer = input_buffer
+        self.writes = 0
+
+    def write(self, chars):
+        self.input_buffer += chars
+        self.writes += 1
 
 def test_suite():
     return unittest.findTestCases(sys.modules[__name__])
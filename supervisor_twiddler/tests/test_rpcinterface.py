@@ -1,4 +1,7 @@
+import os
+import shutil
 import sys
+import tempfile
 import unittest
 
 import supervisor
@@ -7,12 +10,17 @@ from supervisor.states import SupervisorStates, ProcessStates
 
 from supervisor_twiddler.rpcinterface import Faults as TwiddlerFaults
 
-from supervisor.tests.base import DummySupervisor
+from supervisor.tests.base import DummySupervisor, DummyLogger
 from supervisor.tests.base import DummyPConfig, DummyProcess
 from supervisor.tests.base import DummyPGroupConfig, DummyProcessGroup
 
 class TestRPCInterface(unittest.TestCase):
 
+    def tearDown(self):
+        # deferred calls and the spawn scheduler subscribe to events
+        from supervisor import events
+        events.clear()
+
     # Fault Constants
 
     def test_twiddler_fault_names_dont_clash_with_supervisord_fault_names(self):
@@ -49,6 +57,301 @@ class TestRPCInterface(unittest.TestCase):
             rpcinterface.TwiddlerNamespaceRPCInterface))
         self.assertEqual(supervisord, interface.supervisord)
 
+    # Journal
+
+    def test_journal_is_disabled_by_default(self):
+        supervisord = DummySupervisor()
+        interface = self.makeOne(supervisord)
+        self.assertEqual(None, interface._journal)
+
+    def test_journal_restores_configuration_in_new_interface(self):
+        tempdir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tempdir, 'twiddler.journal')
+
+            supervisord = self.makeSupervisor()
+            interface = self.makeOne(supervisord, journal=path)
+            interface.addGroup('group_name')
+            interface.addProgramToGroup('group_name', 'find',
+                {'command': '/usr/bin/find /', 'autostart': 'false',
+                 'process_name': 'find_%(process_num)d', 'numprocs': 3})
+            interface.removeProcessFromGroup('group_name', 'find_1')
+            interface.addProgramTemplate('tmpl', {'command': '/bin/cat',
+                                                  'autostart': 'false'})
+            interface.addProgramFromTemplate('group_name', 'tmpl', 'cat',
+                {'environment': {'FOO': '1'}})
+            interface._journal.close()
+
+            supervisord = self.makeSupervisor()
+            interface = self.makeOne(supervisord, journal=path)
+            self.assertEqual(['group_name'], interface.getGroupNames())
+            group = supervisord.process_groups['group_name']
+            self.assertEqual(['cat', 'find_0', 'find_2'],
+                             sorted(group.processes.keys()))
+            self.assertEqual({'FOO': '1'},
+                             group.processes['cat'].config.environment)
+            self.assertEqual(['tmpl'], interface.getProgramTemplateNames())
+
+            # the journal was compacted into a snapshot at startup and
+            # replaying the snapshot gives the same configuration
+            interface._journal.close()
+            supervisord = self.makeSupervisor()
+            interface = self.makeOne(supervisord, journal=path)
+            group = supervisord.process_groups['group_name']
+            self.assertEqual(['cat', 'find_0', 'find_2'],
+                             sorted(group.processes.keys()))
+            interface._journal.close()
+        finally:
+            shutil.rmtree(tempdir)
+
+    def test_journal_keeps_program_when_duplicate_name_is_rejected(self):
+        tempdir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tempdir, 'twiddler.journal')
+
+            supervisord = self.makeSupervisor()
+            interface = self.makeOne(supervisord, journal=path)
+            interface.addGroup('group_name')
+            interface.addProgramToGroup('group_name', 'a',
+                {'command': '/bin/cat', 'autostart': 'false',
+                 'process_name': 'a_one'})
+            self.assertRPCError(SupervisorFaults.BAD_NAME,
+                                interface.addProgramToGroup, 'group_name', 'a',
+                                {'command': '/bin/cat', 'autostart': 'false',
+                                 'process_name': 'a_two'})
+            interface._journal.close()
+
+            # restart twice, so the snapshot written at the first startup
+            # is replayed at the second
+            for i in range(2):
+                supervisord = self.makeSupervisor()
+                interface = self.makeOne(supervisord, journal=path)
+                group = supervisord.process_groups['group_name']
+                self.assertEqual(['a_one'], sorted(group.processes.keys()))
+                interface._journal.close()
+        finally:
+            shutil.rmtree(tempdir)
+
+    def test_journal_snapshot_includes_removed_groups_and_processes(self):
+        tempdir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tempdir, 'twiddler.journal')
+
+            supervisord = self.makeSupervisor()
+            interface = self.makeOne(supervisord)
+            interface.addGroups([{'group_name': 'foo'}, {'group_name': 'bar'}])
+            interface.addProgramToGroup('foo', 'ls', {'command': '/bin/ls',
+                                                      'autostart': 'false'})
+
+            interface = self.makeOne(supervisord, journal=path)
+            interface.removeGroup('bar')
+            interface.removeProcessFromGroup('foo', 'ls')
+            self.assertEqual(
+                [('removeGroups', [['bar']]),
+                 ('removeProcessesFromGroup', ['foo', ['ls']])],
+                interface._makeSnapshot())
+            interface._journal.close()
+        finally:
+            shutil.rmtree(tempdir)
+
+    def test_journal_snapshot_adds_programs_in_one_call_without_parsing(self):
+        supervisord = self.makeSupervisor()
+        interface = self.makeOne(supervisord)
+        interface.addGroup('foo')
+        interface.addProgramToGroup('foo', 'ls',
+            {'command': '/bin/ls', 'autostart': 'false',
+             'process_name': 'ls_%(process_num)d', 'numprocs': '3'})
+        interface.addProgramToGroup('foo', 'cat', {'command': '/bin/cat',
+                                                   'autostart': 'false'})
+        interface.addProgramTemplate('tmpl', {'command': '/bin/sh',
+                                              'autostart': 'false'})
+        interface.addProgramFromTemplate('foo', 'tmpl', 'sh',
+                                         {'environment': {'A': '1'}})
+        interface.removeProcessFromGroup('foo', 'ls_1')
+
+        def makeProcessConfigs(*args):
+            raise AssertionError('programs were parsed again')
+        interface._makeProcessConfigs = makeProcessConfigs
+
+        self.assertEqual(
+            [('addGroups', [[{'group_name': 'foo', 'priority': 999}]]),
+             ('addProgramTemplate',
+              ['tmpl', {'command': '/bin/sh', 'autostart': 'false'}]),
+             ('addProgramsToGroup',
+              ['foo', [{'program_name': 'cat',
+                        'program_options': {'command': '/bin/cat',
+                                            'autostart': 'false'}},
+                       {'program_name': 'ls',
+                        'program_options': {'command': '/bin/ls',
+                                            'autostart': 'false',
+                                            'process_name':
+                                                'ls_%(process_num)d',
+                                            'numprocs': '3'}}]]),
+             ('addProgramsFromTemplate',
+              ['foo', 'tmpl', [{'program_name': 'sh',
+                                'overrides': {'environment': {'A': '1'}}}]]),
+             ('removeProcessesFromGroup', ['foo', ['ls_1']])],
+            interface._makeSnapshot())
+
+    def test_journal_snapshot_adds_program_after_processes_it_took(self):
+        supervisord = self.makeSupervisor()
+        interface = self.makeOne(supervisord)
+        interface.addGroup('group_name')
+        interface.addProgramToGroup('group_name', 'a',
+            {'command': '/bin/cat', 'autostart': 'false',
+             'process_name': 'x_%(process_num)d', 'numprocs': '2'})
+        group = supervisord.process_groups['group_name']
+        group.processes['x_1'].pid = 42
+        group.processes['x_1'].state = ProcessStates.RUNNING
+
+        # program b takes x_0 from program a, which keeps running x_1
+        interface.reconcileGroup('group_name',
+            [{'program_name': 'b',
+              'program_options': {'command': '/bin/cat',
+                                  'autostart': 'false',
+                                  'process_name': 'x_0'}}])
+        snapshot = interface._makeSnapshot()
+        self.assertEqual(['addGroups', 'addProgramsToGroup',
+                          'removeProcessesFromGroup', 'addProgramsToGroup'],
+                         [method for method, args in snapshot])
+
+        supervisord = self.makeSupervisor()
+        interface = self.makeOne(supervisord)
+        for method, args in snapshot:
+            getattr(interface, method)(*args)
+        group = supervisord.process_groups['group_name']
+        self.assertEqual(['x_0', 'x_1'], sorted(group.processes))
+        self.assertEqual({'a': ['x_1'], 'b': ['x_0']},
+            dict([(name, info['process_names']) for name, info in
+                  interface._programs['group_name'].items()]))
+
+    def test_journal_snapshot_of_scaled_program(self):
+        supervisord = self.makeSupervisor()
+        interface = self.makeOne(supervisord)
+        interface.addGroup('foo')
+        interface.addProgramToGroup('foo', 'ls',
+            {'command': '/bin/ls', 'autostart': 'false',
+             'process_name': 'ls_%(process_num)d', 'numprocs': '3'})
+        interface.removeProcessFromGroup('foo', 'ls_1')
+        interface.scaleProgram('foo', 'ls', 2)
+        interface.scaleProgram('foo', 'ls', 4)
+
+        snapshot = interface._makeSnapshot()
+        self.assertEqual(('removeProcessesFromGroup', ['foo', ['ls_1']]),
+                         snapshot[-1])
+
+        supervisord = self.makeSupervisor()
+        interface = self.makeOne(supervisord)
+        for method, args in snapshot:
+            getattr(interface, method)(*args)
+        group = supervisord.process_groups['foo']
+        self.assertEqual(['ls_0', 'ls_2', 'ls_3'], sorted(group.processes))
+
+    def test_journal_is_compacted_after_number_of_calls(self):
+        tempdir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tempdir, 'twiddler.journal')
+
+            supervisord = self.makeSupervisor()
+            interface = self.makeOne(supervisord, journal=path,
+                                     journal_compact_after='2')
+            interface.addGroup('foo')
+            interface.addGroup('bar')
+            self.assertEqual(0, interface._journal.entries_since_compact)
+            self.assertEqual('', open(path).read())
+            interface._journal.close()
+        finally:
+            shutil.rmtree(tempdir)
+
+    def test_journal_replay_ignores_whitelist_and_logs_failures(self):
+        tempdir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tempdir, 'twiddler.journal')
+
+            supervisord = self.makeSupervisor()
+            interface = self.makeOne(supervisord, journal=path)
+            interface.addGroup('foo')
+            interface._journal.append('removeGroup', ['nonexistant_group'])
+            interface._journal.close()
+
+            supervisord = self.makeSupervisor()
+            interface = self.makeOne(supervisord, journal=path,
+                                     whitelist='getGroupNames')
+            self.assertEqual(['foo'], interface.getGroupNames())
+            self.assertTrue('nonexistant_group' in
+                            ''.join(supervisord.options.logger.data))
+            interface._journal.close()
+        finally:
+            shutil.rmtree(tempdir)
+
+    def test_journal_replay_keeps_programs_when_one_in_batch_fails(self):
+        tempdir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tempdir, 'twiddler.journal')
+
+            supervisord = self.makeSupervisor()
+            interface = self.makeOne(supervisord, journal=path)
+            interface.addGroup('g')
+            for name in ('a', 'b', 'c'):
+                interface.addProgramToGroup('g', name,
+                    {'command': '/bin/cat', 'autostart': 'false'})
+            interface._journal.close()
+
+            # compact the journal into a snapshot with one batch for g
+            supervisord = self.makeSupervisor()
+            interface = self.makeOne(supervisord, journal=path)
+            self.assertTrue(('addProgramsToGroup' in
+                             [m for m, args in interface._makeSnapshot()]))
+            interface._journal.close()
+
+            # on the next start, g already has a process named c
+            supervisord = self.makeSupervisor()
+            other = self.makeOne(supervisord)
+            other.addGroup('g')
+            other.addProgramToGroup('g', 'c', {'command': '/bin/ls',
+                                               'autostart': 'false'})
+            interface = self.makeOne(supervisord, journal=path)
+            group = supervisord.process_groups['g']
+            self.assertEqual(['a', 'b', 'c'], sorted(group.processes))
+            self.assertEqual('/bin/ls', group.processes['c'].config.command)
+            self.assertEqual(['a', 'b'], sorted(interface._programs['g']))
+            self.assertTrue('BAD_NAME: c' in
+                            ''.join(supervisord.options.logger.data))
+            interface._journal.close()
+        finally:
+            shutil.rmtree(tempdir)
+
+    def test_journal_keeps_programs_from_removed_templates(self):
+        tempdir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tempdir, 'twiddler.journal')
+
+            supervisord = self.makeSupervisor()
+            interface = self.makeOne(supervisord, journal=path)
+            interface.addGroup('g')
+            interface.addProgramTemplate('t', {'command': '/bin/cat',
+                                               'autostart': 'false'})
+            interface.addProgramFromTemplate('g', 't', 'p')
+            interface.removeProgramTemplate('t')
+            # a new template with the same name does not change p
+            interface.addProgramTemplate('t', {'command': '/bin/ls',
+                                               'autostart': 'false'})
+            interface._journal.close()
+
+            for i in range(3):
+                supervisord = self.makeSupervisor()
+                interface = self.makeOne(supervisord, journal=path)
+                group = supervisord.process_groups['g']
+                self.assertEqual(['p'], list(group.processes.keys()))
+                self.assertEqual('/bin/cat',
+                                 group.processes['p'].config.command)
+                self.assertEqual(['t'], interface.getProgramTemplateNames())
+                self.assertEqual({'command': '/bin/ls', 'autostart': 'false'},
+                                 interface._templates['t']['program_options'])
+                interface._journal.close()
+        finally:
+            shutil.rmtree(tempdir)
+
     # Updater
 
     def test_updater_raises_shutdown_error_if_supervisord_in_shutdown_state(self):
@@ -58,6 +361,130 @@ class TestRPCInterface(unittest.TestCase):
         self.assertRPCError(SupervisorFaults.SHUTDOWN_STATE,
                             interface.getAPIVersion)
 
+    # Policy
+
+    def test_ctor_raises_for_bad_rate_limits(self):
+        supervisord = DummySupervisor()
+        self.assertRaises(ValueError, self.makeOne, supervisord,
+                          rate_limits='addGroup:fast')
+
+    def test_read_only_denies_methods_that_change_things(self):
+        supervisord = self.makeSupervisor()
+        interface = self.makeOne(supervisord, read_only='true')
+
+        self.assertEqual([], interface.getGroupNames())
+        self.assertRPCError(TwiddlerFaults.READ_ONLY,
+                            interface.addGroup, 'foo')
+        self.assertEqual([], list(supervisord.process_groups.keys()))
+
+    def test_group_patterns_deny_groups_that_dont_match(self):
+        supervisord = self.makeSupervisor()
+        interface = self.makeOne(supervisord, group_patterns='tenant_*')
+
+        interface.addGroup('tenant_a')
+        self.assertRPCError(TwiddlerFaults.GROUP_NOT_PERMITTED,
+                            interface.addGroup, 'other')
+        self.assertRPCError(TwiddlerFaults.GROUP_NOT_PERMITTED,
+                            interface.addGroups, [{'group_name': 'tenant_b'},
+                                                  {'group_name': 'other'}])
+        self.assertEqual(['tenant_a'], interface.getGroupNames())
+
+    def test_group_patterns_apply_to_existing_groups(self):
+        pgroup = self.makeEmptyGroup()
+        supervisord = DummySupervisor(process_groups = {'group_name': pgroup})
+        interface = self.makeOne(supervisord, group_patterns='tenant_*')
+
+        self.assertRPCError(TwiddlerFaults.GROUP_NOT_PERMITTED,
+                            interface.addProgramToGroup, 'group_name', 'foo',
+                            {'command': '/usr/bin/find /'})
+        self.assertRPCError(TwiddlerFaults.GROUP_NOT_PERMITTED,
+                            interface.removeGroup, 'group_name')
+
+    def test_group_patterns_hide_groups_from_reads(self):
+        supervisord = self.makeSupervisor()
+        unscoped = self.makeOne(supervisord)
+        for group_name in ('tenant_a', 'other'):
+            unscoped.addGroup(group_name)
+            unscoped.addProgramToGroup(group_name, 'cat',
+                {'command': '/bin/cat', 'autostart': 'false'})
+        interface = self.makeOne(supervisord, group_patterns='tenant_*')
+
+        self.assertEqual(['tenant_a'], interface.getGroupNames())
+        inventory = interface.getProcessInventory('*', '*', 0, 0, ['state'])
+        self.assertEqual(1, inventory['total'])
+        self.assertEqual('tenant_a', inventory['processes'][0]['group'])
+        self.assertRPCError(TwiddlerFaults.GROUP_NOT_PERMITTED,
+                            interface.waitForProcessStates,
+                            ['other:cat'], ['STOPPED'])
+
+    def test_rate_limits_raise_rate_limited(self):
+        supervisord = self.makeSupervisor()
+        interface = self.makeOne(supervisord, rate_limits='addGroup:1:1')
+
+        interface.addGroup('foo')
+        self.assertRPCError(TwiddlerFaults.RATE_LIMITED,
+                            interface.addGroup, 'bar')
+        self.assertEqual(['foo'], interface.getGroupNames())
+
+    def test_mutation_rate_limits_changes_but_not_reads(self):
+        supervisord = self.makeSupervisor()
+        interface = self.makeOne(supervisord, mutation_rate='1',
+                                 mutation_burst='1')
+
+        interface.addGroup('foo')
+        self.assertRPCError(TwiddlerFaults.RATE_LIMITED,
+                            interface.removeGroup, 'foo')
+        for i in range(3):
+            self.assertEqual(['foo'], interface.getGroupNames())
+
+    def test_coalesce_window_returns_result_of_repeated_change(self):
+        supervisord = self.makeSupervisor()
+        interface = self.makeOne(supervisord, coalesce_window='60')
+
+        self.assertEqual(True, interface.addGroup('foo'))
+        self.assertEqual(True, interface.addGroup('foo'))
+        self.assertEqual(1, interface.getStats()['coalesced'])
+        self.assertEqual(1, interface.getChangesSince(0)['generation'])
+
+    def test_coalesce_window_does_not_coalesce_after_other_changes(self):
+        supervisord = self.makeSupervisor()
+        interface = self.makeOne(supervisord, coalesce_window='60')
+
+        interface.addGroup('foo')
+        interface.addGroup('bar')
+        self.assertRPCError(SupervisorFaults.BAD_NAME,
+                            interface.addGroup, 'foo')
+        self.assertEqual(0, interface.getStats()['coalesced'])
+
+    def test_coalesce_window_does_not_coalesce_failed_calls(self):
+        supervisord = self.makeSupervisor()
+        interface = self.makeOne(supervisord, coalesce_window='60')
+
+        for i in range(2):
+            self.assertRPCError(SupervisorFaults.BAD_NAME,
+                                interface.removeGroup, 'nonexistent')
+        self.assertEqual(0, interface.getStats()['coalesced'])
+
+    def test_coalesce_window_does_not_coalesce_in_shutdown_state(self):
+        supervisord = self.makeSupervisor()
+        interface = self.makeOne(supervisord, coalesce_window='60')
+
+        interface.addGroup('foo')
+        supervisord.options.mood = SupervisorStates.SHUTDOWN
+        self.assertRPCError(SupervisorFaults.SHUTDOWN_STATE,
+                            interface.addGroup, 'foo')
+        self.assertEqual(0, interface._coalesced)
+
+    def test_coalesce_window_does_not_coalesce_calls_denied_by_policy(self):
+        supervisord = self.makeSupervisor()
+        interface = self.makeOne(supervisord, coalesce_window='60',
+                                 rate_limits='addGroup:1:1')
+
+        interface.addGroup('foo')
+        self.assertRPCError(TwiddlerFaults.RATE_LIMITED,
+                            interface.addGroup, 'foo')
+        self.assertEqual(0, interface._coalesced)
+
     # API Method twiddler.getAPIVersion()
 
     def test_getAPIVersion_can_be_disabled(self):
@@ -109,6 +536,157 @@ class TestRPCInterface(unittest.TestCase):
         names.index('foo')
         names.index('bar')
 
+    # API Method twiddler.addGroup()
+
+    def test_addGroup_can_be_disabled(self):
+        supervisord = DummySupervisor()
+        interface = self.makeOne(supervisord, whitelist='foo,bar')
+
+        self.assertRPCError(TwiddlerFaults.NOT_IN_WHITELIST,
+                            interface.addGroup, 'group_name')
+
+    def test_addGroup_raises_bad_name_when_group_already_exists(self):
+        supervisord = self.makeSupervisor()
+        interface = self.makeOne(supervisord)
+
+        interface.addGroup('group_name')
+        self.assertRPCError(SupervisorFaults.BAD_NAME,
+                            interface.addGroup, 'group_name')
+
+    def test_addGroup_raises_incorrect_params_when_name_or_priority_is_bad(self):
+        supervisord = self.makeSupervisor()
+        interface = self.makeOne(supervisord)
+
+        self.assertRPCError(SupervisorFaults.INCORRECT_PARAMETERS,
+                            interface.addGroup, 'bad:name')
+        self.assertRPCError(SupervisorFaults.INCORRECT_PARAMETERS,
+                            interface.addGroup, 'group_name', 'bad')
+        self.assertEqual({}, supervisord.process_groups)
+
+    def test_addGroup_adds_empty_process_group(self):
+        supervisord = self.makeSupervisor()
+        interface = self.makeOne(supervisord)
+
+        self.assertTrue(interface.addGroup('group_name', 50))
+        self.assertEqual('addGroup', interface.update_text)
+        self.assertEqual(['group_name'], interface.getGroupNames())
+
+        group = supervisord.process_groups['group_name']
+        self.assertTrue(isinstance(group, supervisor.process.ProcessGroup))
+        self.assertEqual('group_name', group.config.name)
+        self.assertEqual(50, group.config.priority)
+        self.assertEqual([], group.config.process_configs)
+
+        poptions = {'command': '/usr/bin/find /'}
+        interface.addProgramToGroup('group_name', 'find', poptions)
+        self.assertEqual(['find'], list(group.processes.keys()))
+
+    # API Method twiddler.addGroups()
+
+    def test_addGroups_can_be_disabled(self):
+        supervisord = DummySupervisor()
+        interface = self.makeOne(supervisord, whitelist='foo,bar')
+
+        self.assertRPCError(TwiddlerFaults.NOT_IN_WHITELIST,
+                            interface.addGroups, [])
+
+    def test_addGroups_adds_nothing_when_any_group_is_invalid(self):
+        supervisord = self.makeSupervisor()
+        interface = self.makeOne(supervisord)
+        interface.addGroup('exists')
+
+        for bad_groups in [42, [42], [{'priority': 1}],
+                           [{'group_name': 'foo'}, {'group_name': 'foo'}],
+                           [{'group_name': 'foo'}, {'group_name': 'exists'}]]:
+            self.assertRaises(supervisor.xmlrpc.RPCError,
+                              interface.addGroups, bad_groups)
+        self.assertEqual(['exists'], list(supervisord.process_groups.keys()))
+
+    def test_addGroups_adds_all_groups(self):
+        supervisord = self.makeSupervisor()
+        interface = self.makeOne(supervisord)
+
+        groups = [{'group_name': 'foo'}, {'group_name': 'bar', 'priority': 5}]
+        self.assertTrue(interface.addGroups(groups))
+        self.assertEqual('addGroups', interface.update_text)
+        self.assertEqual(['bar', 'foo'], sorted(interface.getGroupNames()))
+        self.assertEqual(999, supervisord.process_groups['foo'].config.priority)
+        self.assertEqual(5, supervisord.process_groups['bar'].config.priority)
+
+    # API Method twiddler.removeGroup()
+
+    def test_removeGroup_can_be_disabled(self):
+        supervisord = DummySupervisor()
+        interface = self.makeOne(supervisord, whitelist='foo,bar')
+
+        self.assertRPCError(TwiddlerFaults.NOT_IN_WHITELIST,
+                            interface.removeGroup, 'group_name')
+
+    def test_removeGroup_raises_bad_name_when_group_doesnt_exist(self):
+        supervisord = self.makeSupervisor()
+        interface = self.makeOne(supervisord)
+
+        self.assertRPCError(SupervisorFaults.BAD_NAME,
+                            interface.removeGroup, 'nonexistant_group')
+
+    def test_removeGroup_raises_still_running_when_process_is_running(self):
+        supervisord = self.makeSupervisor()
+        interface = self.makeOne(supervisord)
+        interface.addGroup('group_name')
+        interface.addProgramToGroup('group_name', 'find',
+                                    {'command': '/usr/bin/find /'})
+        group = supervisord.process_groups['group_name']
+        group.processes['find'].state = ProcessStates.RUNNING
+
+        self.assertRPCError(SupervisorFaults.STILL_RUNNING,
+                            interface.removeGroup, 'group_name')
+        self.assertEqual(['group_name'], interface.getGroupNames())
+
+    def test_removeGroup_removes_group_and_its_programs(self):
+        supervisord = self.makeSupervisor()
+        interface = self.makeOne(supervisord)
+        interface.addGroup('group_name')
+        interface.addProgramToGroup('group_name', 'find',
+                                    {'command': '/usr/bin/find /'})
+
+        self.assertTrue(interface.removeGroup('group_name'))
+        self.assertEqual('removeGroup', interface.update_text)
+        self.assertEqual([], interface.getGroupNames())
+
+        interface.addGroup('group_name')
+        self.assertRPCError(SupervisorFaults.BAD_NAME,
+                            interface.removeProgramFromGroup,
+                            'group_name', 'find')
+
+    # API Method twiddler.removeGroups()
+
+    def test_removeGroups_can_be_disabled(self):
+        supervisord = DummySupervisor()
+        interface = self.makeOne(supervisord, whitelist='foo,bar')
+
+        self.assertRPCError(TwiddlerFaults.NOT_IN_WHITELIST,
+                            interface.removeGroups, [])
+
+    def test_removeGroups_removes_nothing_when_any_group_is_invalid(self):
+        supervisord = self.makeSupervisor()
+        interface = self.makeOne(supervisord)
+        interface.addGroups([{'group_name': 'foo'}, {'group_name': 'bar'}])
+
+        for bad_names in ['foo', ['foo', 'nonexistant_group']]:
+            self.assertRaises(supervisor.xmlrpc.RPCError,
+                              interface.removeGroups, bad_names)
+        self.assertEqual(['bar', 'foo'], sorted(interface.getGroupNames()))
+
+    def test_removeGroups_removes_all_groups(self):
+        supervisord = self.makeSupervisor()
+        interface = self.makeOne(supervisord)
+        interface.addGroups([{'group_name': 'foo'}, {'group_name': 'bar'},
+                             {'group_name': 'baz'}])
+
+        self.assertTrue(interface.removeGroups(['foo', 'baz']))
+        self.assertEqual('removeGroups', interface.update_text)
+        self.assertEqual(['bar'], interface.getGroupNames())
+
     # API Method twiddler.addProgramToGroup()
 
     def test_addProgramToGroup_can_be_disabled(self):
@@ -251,136 +829,2386 @@ class TestRPCInterface(unittest.TestCase):
         self.assertEqual(3, len(pgroup.config.process_configs))
         self.assertEqual(3, len(pgroup.processes))
 
-    # API Method twiddler.removeProcessFromGroup()
+    def test_addProgramToGroup_scans_existing_configs_once_with_10k_processes(self):
+        class CountingList(list):
+            iterations = 0
+            def __iter__(self):
+                CountingList.iterations += 1
+                return list.__iter__(self)
+
+        pconfigs = CountingList()
+        for i in range(10000):
+            pconfigs.append(DummyPConfig(None, 'existing_%d' % i, '/bin/foo'))
+        gconfig = DummyPGroupConfig(None, pconfigs=pconfigs)
+        pgroup = DummyProcessGroup(gconfig)
+        pgroup.processes = {}
 
-    def test_removeProcessFromGroup_can_be_disabled(self):
+        supervisord = DummySupervisor(process_groups = {'group_name': pgroup})
+        supervisord.options = supervisor.options.ServerOptions()
+        interface = self.makeOne(supervisord)
+
+        poptions = {'command': '/usr/bin/find /',
+                    'process_name': 'find_%(process_num)d',
+                    'numprocs': 200}
+        self.assertTrue(interface.addProgramToGroup('group_name', 'find', poptions))
+        self.assertEqual(1, CountingList.iterations)
+        self.assertEqual(10200, len(pgroup.config.process_configs))
+
+    # API Method twiddler.addProgramsToGroup()
+
+    def test_addProgramsToGroup_can_be_disabled(self):
         supervisord = DummySupervisor()
         interface = self.makeOne(supervisord, whitelist='foo,bar')
 
         self.assertRPCError(TwiddlerFaults.NOT_IN_WHITELIST,
-                            interface.removeProcessFromGroup, 'group', 'process')
+                            interface.addProgramsToGroup, 'grp', [])
 
-    def test_removeProcessFromGroup_raises_bad_name_when_group_doesnt_exist(self):
-        pconfig = DummyPConfig(None, 'foo', '/bin/foo')
-        gconfig = DummyPGroupConfig(None, pconfigs=[pconfig])
+    def test_addProgramsToGroup_raises_bad_name_when_group_doesnt_exist(self):
+        supervisord = DummySupervisor(process_groups = {})
+        interface = self.makeOne(supervisord)
+
+        self.assertRPCError(SupervisorFaults.BAD_NAME,
+                            interface.addProgramsToGroup,
+                            'nonexistant_group', [])
+
+    def test_addProgramsToGroup_raises_incorrect_params_when_programs_is_not_array(self):
+        gconfig = DummyPGroupConfig(None, pconfigs=[])
         pgroup = DummyProcessGroup(gconfig)
 
         supervisord = DummySupervisor(process_groups = {'group_name': pgroup})
         interface = self.makeOne(supervisord)
 
-        self.assertRPCError(SupervisorFaults.BAD_NAME,
-                            interface.removeProcessFromGroup,
-                            'nonexistant_group_name', 'process_name')
+        self.assertRPCError(SupervisorFaults.INCORRECT_PARAMETERS,
+                            interface.addProgramsToGroup, 'group_name', 42)
 
-    def test_removeProcessFromGroup_raises_bad_name_when_process_does_not_exist(self):
-        pconfig = DummyPConfig(None, 'foo', '/bin/foo')
-        gconfig = DummyPGroupConfig(None, pconfigs=[pconfig])
+    def test_addProgramsToGroup_raises_incorrect_params_when_program_is_malformed(self):
+        gconfig = DummyPGroupConfig(None, pconfigs=[])
         pgroup = DummyProcessGroup(gconfig)
-        pgroup.processes = {}
 
         supervisord = DummySupervisor(process_groups = {'group_name': pgroup})
+        supervisord.options = supervisor.options.ServerOptions()
         interface = self.makeOne(supervisord)
 
-        self.assertRPCError(SupervisorFaults.BAD_NAME,
-                            interface.removeProcessFromGroup,
-                            'group_name', 'nonexistant_process_name')
-
-    def test_removeProcessFromGroup_raises_still_running_when_process_has_pid(self):
-        pconfig = DummyPConfig(None, 'foo', '/bin/foo')
-        process = DummyProcess(pconfig)
-        process.pid = 42
+        for bad_program in [42, {}, {'program_name': 'foo'}]:
+            self.assertRPCError(SupervisorFaults.INCORRECT_PARAMETERS,
+                                interface.addProgramsToGroup,
+                                'group_name', [bad_program])
 
-        gconfig = DummyPGroupConfig(None, pconfigs=[pconfig])
+    def test_addProgramsToGroup_adds_nothing_when_any_program_is_invalid(self):
+        gconfig = DummyPGroupConfig(None, pconfigs=[])
         pgroup = DummyProcessGroup(gconfig)
-        pgroup.processes = { 'process_with_pid': process }
+        pgroup.processes = {}
 
         supervisord = DummySupervisor(process_groups = {'group_name': pgroup})
+        supervisord.options = supervisor.options.ServerOptions()
         interface = self.makeOne(supervisord)
 
-        self.assertRPCError(SupervisorFaults.STILL_RUNNING,
-                            interface.removeProcessFromGroup,
-                            'group_name', 'process_with_pid')
-
-    def test_removeProcessFromGroup_transitions_process_group(self):
-        pconfig = DummyPConfig(None, 'foo', '/bin/foo')
-        process = DummyProcess(pconfig, ProcessStates.EXITED)
+        programs = [{'program_name': 'good',
+                     'program_options': {'command': '/usr/bin/find /'}},
+                    {'program_name': 'bad',
+                     'program_options': {}}]
+        self.assertRPCError(SupervisorFaults.INCORRECT_PARAMETERS,
+                            interface.addProgramsToGroup,
+                            'group_name', programs)
+        self.assertEqual([], pgroup.config.process_configs)
+        self.assertEqual({}, pgroup.processes)
 
+    def test_addProgramsToGroup_raises_bad_name_when_process_already_exists(self):
+        pconfig = DummyPConfig(None, 'process_that_exists', '/bin/foo')
         gconfig = DummyPGroupConfig(None, pconfigs=[pconfig])
         pgroup = DummyProcessGroup(gconfig)
-        pgroup.processes = { 'process_name': process }
+        pgroup.processes = {}
 
         supervisord = DummySupervisor(process_groups = {'group_name': pgroup})
+        supervisord.options = supervisor.options.ServerOptions()
         interface = self.makeOne(supervisord)
 
-        result = interface.removeProcessFromGroup('group_name', 'process_name')
-        self.assertTrue(result)
-        self.assertTrue(pgroup.transitioned)
+        programs = [{'program_name': 'new_process',
+                     'program_options': {'command': '/usr/bin/find /'}},
+                    {'program_name': 'process_that_exists',
+                     'program_options': {'command': '/usr/bin/find /'}}]
+        self.assertRPCError(SupervisorFaults.BAD_NAME,
+                            interface.addProgramsToGroup,
+                            'group_name', programs)
+        self.assertEqual([pconfig], pgroup.config.process_configs)
+        self.assertEqual({}, pgroup.processes)
 
-    def test_removeProcessFromGroup_deletes_the_process(self):
-        pconfig = DummyPConfig(None, 'foo', '/bin/foo')
-        process = DummyProcess(pconfig, ProcessStates.STOPPED)
+    def test_addProgramsToGroup_raises_bad_name_when_programs_collide(self):
+        gconfig = DummyPGroupConfig(None, pconfigs=[])
+        pgroup = DummyProcessGroup(gconfig)
+        pgroup.processes = {}
 
-        gconfig = DummyPGroupConfig(None, pconfigs=[pconfig])
+        supervisord = DummySupervisor(process_groups = {'group_name': pgroup})
+        supervisord.options = supervisor.options.ServerOptions()
+        interface = self.makeOne(supervisord)
+
+        programs = [{'program_name': 'foo',
+                     'program_options': {'command': '/usr/bin/find /'}},
+                    {'program_name': 'foo',
+                     'program_options': {'command': '/usr/bin/find /'}}]
+        self.assertRPCError(SupervisorFaults.BAD_NAME,
+                            interface.addProgramsToGroup,
+                            'group_name', programs)
+        self.assertEqual([], pgroup.config.process_configs)
+
+    def test_addProgramsToGroup_raises_bad_name_when_program_already_added(self):
+        pgroup = self.makeEmptyGroup()
+        supervisord = DummySupervisor(process_groups = {'group_name': pgroup})
+        supervisord.options = supervisor.options.ServerOptions()
+        interface = self.makeOne(supervisord)
+        interface.addProgramToGroup('group_name', 'foo',
+            {'command': '/usr/bin/find /', 'process_name': 'foo_one'})
+
+        programs = [{'program_name': 'bar',
+                     'program_options': {'command': '/usr/bin/find /'}},
+                    {'program_name': 'foo',
+                     'program_options': {'command': '/usr/bin/find /',
+                                         'process_name': 'foo_two'}}]
+        self.assertRPCError(SupervisorFaults.BAD_NAME,
+                            interface.addProgramsToGroup,
+                            'group_name', programs)
+        self.assertRPCError(SupervisorFaults.BAD_NAME,
+                            interface.addProgramToGroup, 'group_name', 'foo',
+                            {'command': '/usr/bin/find /',
+                             'process_name': 'foo_two'})
+        self.assertEqual(['foo_one'], sorted(pgroup.processes.keys()))
+        self.assertEqual(['foo_one'],
+            interface._programs['group_name']['foo']['process_names'])
+
+    def test_addProgramsToGroup_adds_all_programs_and_returns_results(self):
+        gconfig = DummyPGroupConfig(None, pconfigs=[])
         pgroup = DummyProcessGroup(gconfig)
-        pgroup.processes = { 'process_name': process }
+        pgroup.processes = {}
 
         supervisord = DummySupervisor(process_groups = {'group_name': pgroup})
+        supervisord.options = supervisor.options.ServerOptions()
         interface = self.makeOne(supervisord)
 
-        result = interface.removeProcessFromGroup('group_name', 'process_name')
-        self.assertTrue(result)
-        self.assertTrue(pgroup.processes.get('process_name') is None)
-        self.assertEqual('removeProcessFromGroup', interface.update_text)
+        programs = [{'program_name': 'foo',
+                     'program_options': {'command': '/usr/bin/find /',
+                                         'autostart': 'false'}},
+                    {'program_name': 'bar',
+                     'program_options': {'command': '/usr/bin/find /',
+                                         'process_name': 'bar_%(process_num)d',
+                                         'numprocs': 2}}]
+        results = interface.addProgramsToGroup('group_name', programs)
+        self.assertEqual('addProgramsToGroup', interface.update_text)
+
+        self.assertEqual([{'program_name': 'foo', 'process_names': ['foo']},
+                          {'program_name': 'bar',
+                           'process_names': ['bar_0', 'bar_1']}], results)
+        self.assertEqual(3, len(pgroup.config.process_configs))
+        self.assertEqual(['bar_0', 'bar_1', 'foo'], sorted(pgroup.processes))
+        for process in pgroup.processes.values():
+            self.assertTrue(isinstance(process, supervisor.process.Subprocess))
 
-    # API Method twiddler.log()
+    # Spawn scheduler
 
-    def test_log_can_be_disabled(self):
+    def test_ctor_makes_no_spawn_scheduler_by_default(self):
+        supervisord = DummySupervisor()
+        interface = self.makeOne(supervisord)
+        self.assertEqual(None, interface._scheduler)
+
+    def test_addProgramsToGroup_releases_autostart_up_to_spawn_concurrency(self):
+        from supervisor import events
+        pgroup = self.makeEmptyGroup()
+        supervisord = DummySupervisor(process_groups = {'group_name': pgroup})
+        supervisord.options = supervisor.options.ServerOptions()
+        interface = self.makeOne(supervisord, spawn_concurrency='2')
+
+        try:
+            programs = [{'program_name': name,
+                         'program_options': {'command': '/usr/bin/find /'}}
+                        for name in ('a', 'b', 'c')]
+            interface.addProgramsToGroup('group_name', programs)
+        finally:
+            events.clear()
+
+        autostarts = [pgroup.processes[name].config.autostart
+                      for name in ('a', 'b', 'c')]
+        self.assertEqual([True, True, False], autostarts)
+        self.assertEqual({'pending': 1, 'starting': 2},
+                         interface._scheduler.status())
+
+    def test_queued_processes_keep_autostart_when_configs_are_replaced(self):
+        from supervisor import events
+        supervisord = self.makeSupervisor()
+        interface = self.makeOne(supervisord, spawn_concurrency='1')
+        interface.addGroup('group_name')
+        group = supervisord.process_groups['group_name']
+
+        try:
+            interface.addProgramToGroup('group_name', 'foo',
+                                        {'command': '/bin/foo'})
+            interface.addProgramToGroup('group_name', 'bar',
+                                        {'command': '/bin/bar'})
+            queued = group.processes['bar']
+            self.assertFalse(queued.config.autostart)
+
+            # options that parse to the same config are unchanged even
+            # though the scheduler has turned off autostart
+            programs = [{'program_name': 'foo',
+                         'program_options': {'command': '/bin/foo'}},
+                        {'program_name': 'bar',
+                         'program_options': {'command': '/bin/bar',
+                                             'autostart': 'true'}}]
+            result = interface.reconcileGroup('group_name', programs)
+            self.assertEqual([], result['changed'])
+            self.assertEqual(2, result['unchanged'])
+
+            # a changed config does not bypass the queue
+            programs[1]['program_options']['command'] = '/bin/bar2'
+            result = interface.reconcileGroup('group_name', programs)
+            self.assertEqual(['bar'], result['changed'])
+            self.assertEqual('/bin/bar2', queued.config.command)
+            self.assertFalse(queued.config.autostart)
+
+            interface.replaceProgramInGroup('group_name', 'bar',
+                                            {'command': '/bin/bar3'})
+            self.assertEqual('/bin/bar3', queued.config.command)
+            self.assertFalse(queued.config.autostart)
+            self.assertEqual({'pending': 1, 'starting': 1},
+                             interface._scheduler.status())
+
+            inventory = interface.getProcessInventory('*', '*', 0, 0,
+                                                      ['autostart'])
+            self.assertEqual([True, True],
+                             [p['autostart'] for p in inventory['processes']])
+        finally:
+            events.clear()
+
+    # Auto child logs
+
+    def test_auto_child_logs_are_created_when_processes_are_added(self):
+        supervisord, interface, tempdir = self.makeWithChildLogDir()
+        try:
+            interface.addProgramToGroup('group_name', 'foo',
+                                        {'command': '/bin/foo',
+                                         'autostart': 'false'})
+            config = supervisord.process_groups['group_name'].processes['foo'].config
+            self.assertTrue(os.path.exists(config.stdout_logfile))
+            self.assertEqual(2, len(os.listdir(tempdir)))
+        finally:
+            shutil.rmtree(tempdir)
+
+    def test_lazy_auto_child_logs_are_named_but_not_created(self):
+        supervisord, interface, tempdir = self.makeWithChildLogDir(
+            lazy_autochildlogs='true')
+        try:
+            interface.addProgramToGroup('group_name', 'foo',
+                                        {'command': '/bin/foo',
+                                         'autostart': 'false'})
+            config = supervisord.process_groups['group_name'].processes['foo'].config
+            self.assertEqual(tempdir, os.path.dirname(config.stdout_logfile))
+            self.assertEqual(tempdir, os.path.dirname(config.stderr_logfile))
+            self.assertEqual([], os.listdir(tempdir))
+        finally:
+            shutil.rmtree(tempdir)
+
+    def test_auto_child_logs_are_left_when_processes_are_removed(self):
+        supervisord, interface, tempdir = self.makeWithChildLogDir()
+        try:
+            interface.addProgramToGroup('group_name', 'foo',
+                                        {'command': '/bin/foo',
+                                         'autostart': 'false'})
+            interface.removeProcessFromGroup('group_name', 'foo')
+            self.assertEqual(2, len(os.listdir(tempdir)))
+        finally:
+            shutil.rmtree(tempdir)
+
+    def test_auto_child_logs_are_removed_with_processes_when_enabled(self):
+        supervisord, interface, tempdir = self.makeWithChildLogDir(
+            remove_autochildlogs='true')
+        try:
+            other = os.path.join(tempdir, 'bar.log')
+            interface.addProgramToGroup('group_name', 'foo',
+                                        {'command': '/bin/foo',
+                                         'autostart': 'false'})
+            interface.addProgramToGroup('group_name', 'bar',
+                                        {'command': '/bin/bar',
+                                         'autostart': 'false',
+                                         'stdout_logfile': other,
+                                         'stderr_logfile': 'NONE'})
+            config = supervisord.process_groups['group_name'].processes['foo'].config
+            open(config.stdout_logfile + '.1', 'w').close() # rotated backup
+            open(other, 'w').close()
+            self.assertEqual(4, len(os.listdir(tempdir)))
+
+            interface.removeProcessFromGroup('group_name', 'foo')
+            interface.removeProcessFromGroup('group_name', 'bar')
+            self.assertEqual(['bar.log'], os.listdir(tempdir))
+        finally:
+            shutil.rmtree(tempdir)
+
+    def test_auto_child_logs_are_removed_with_groups_when_enabled(self):
+        supervisord, interface, tempdir = self.makeWithChildLogDir(
+            remove_autochildlogs='true')
+        try:
+            interface.addProgramToGroup('group_name', 'foo',
+                                        {'command': '/bin/foo',
+                                         'autostart': 'false'})
+            interface.removeGroup('group_name')
+            self.assertEqual([], os.listdir(tempdir))
+        finally:
+            shutil.rmtree(tempdir)
+
+    def test_auto_child_logs_are_kept_when_configs_are_replaced(self):
+        supervisord, interface, tempdir = self.makeWithChildLogDir(
+            remove_autochildlogs='true')
+        try:
+            interface.addProgramToGroup('group_name', 'foo',
+                                        {'command': '/bin/foo',
+                                         'autostart': 'false'})
+            group = supervisord.process_groups['group_name']
+            old_logfile = group.processes['foo'].config.stdout_logfile
+
+            interface.replaceProgramInGroup('group_name', 'foo',
+                                            {'command': '/bin/foo2',
+                                             'autostart': 'false'})
+            self.assertEqual(old_logfile,
+                             group.processes['foo'].config.stdout_logfile)
+            self.assertEqual(2, len(os.listdir(tempdir)))
+        finally:
+            shutil.rmtree(tempdir)
+
+    def test_auto_child_logs_are_kept_when_configs_are_replaced_by_default(self):
+        supervisord, interface, tempdir = self.makeWithChildLogDir()
+        try:
+            interface.addProgramToGroup('group_name', 'foo',
+                                        {'command': '/bin/foo',
+                                         'autostart': 'false'})
+            group = supervisord.process_groups['group_name']
+            old_logfile = group.processes['foo'].config.stdout_logfile
+
+            interface.replaceProgramInGroup('group_name', 'foo',
+                                            {'command': '/bin/foo2',
+                                             'autostart': 'false'})
+            self.assertEqual(old_logfile,
+                             group.processes['foo'].config.stdout_logfile)
+            self.assertEqual(2, len(os.listdir(tempdir)))
+        finally:
+            shutil.rmtree(tempdir)
+
+    # API Method twiddler.validatePrograms()
+
+    def test_validatePrograms_can_be_disabled(self):
         supervisord = DummySupervisor()
         interface = self.makeOne(supervisord, whitelist='foo,bar')
 
         self.assertRPCError(TwiddlerFaults.NOT_IN_WHITELIST,
-                            interface.log, 'message')
+                            interface.validatePrograms, [])
 
-    def test_log_write_message_when_level_is_string(self):
+    def test_validatePrograms_raises_incorrect_params_when_programs_is_not_array(self):
         supervisord = DummySupervisor()
         interface = self.makeOne(supervisord)
 
-        result = interface.log('hello', 'info')
-        self.assertTrue(result)
-        result = interface.log('there', 'INFO')
-        self.assertTrue(result)
-        self.assertEqual('log', interface.update_text)
+        self.assertRPCError(SupervisorFaults.INCORRECT_PARAMETERS,
+                            interface.validatePrograms, 42)
 
-        logger = supervisord.options.logger
-        self.assertEqual(['hello', 'there'], logger.data)
+    def test_validatePrograms_raises_bad_name_when_group_doesnt_exist(self):
+        supervisord = DummySupervisor(process_groups = {})
+        interface = self.makeOne(supervisord)
 
-    def test_log_write_message_when_level_is_integer(self):
-        supervisord = DummySupervisor()
+        self.assertRPCError(SupervisorFaults.BAD_NAME,
+                            interface.validatePrograms, [], 'nonexistent')
+
+    def test_validatePrograms_returns_processes_and_normalized_options(self):
+        supervisord = DummySupervisor(process_groups = {})
+        supervisord.options = supervisor.options.ServerOptions()
         interface = self.makeOne(supervisord)
 
-        from supervisor.loggers import LevelsByName
-        result = interface.log('hello', LevelsByName.INFO)
-        self.assertTrue(result)
+        poptions = {'command': '/usr/bin/find %(process_num)s',
+                    'process_name': '%(program_name)s_%(process_num)s',
+                    'numprocs': '2',
+                    'environment': 'FOO="bar"',
+                    'autorestart': 'unexpected',
+                    'stdout_logfile_maxbytes': '5GB'}
+        results = interface.validatePrograms([{'program_name': 'foo',
+                                               'program_options': poptions}])
+        self.assertEqual(1, len(results))
+        result = results[0]
+        self.assertEqual('foo', result['program_name'])
+        self.assertEqual(True, result['valid'])
+        self.assertEqual('', result['error'])
+        processes = result['processes']
+        self.assertEqual(['foo_0', 'foo_1'], [p['name'] for p in processes])
+        self.assertEqual('/usr/bin/find 1', processes[1]['command'])
+        self.assertEqual({'FOO': 'bar'}, processes[0]['environment'])
+        self.assertEqual('unexpected', processes[0]['autorestart'])
+        self.assertEqual('AUTO', processes[0]['stdout_logfile'])
+        self.assertEqual(str(5 * 1024 * 1024 * 1024),
+                         processes[0]['stdout_logfile_maxbytes'])
+        self.assertEqual('', processes[0]['directory'])
+
+        from supervisor.compat import xmlrpclib
+        xmlrpclib.dumps((results,)) # can be sent over XML-RPC
+
+    def test_validatePrograms_reports_every_invalid_program(self):
+        supervisord = DummySupervisor(process_groups = {})
+        supervisord.options = supervisor.options.ServerOptions()
+        interface = self.makeOne(supervisord)
 
-        logger = supervisord.options.logger
-        self.assertEqual(['hello'], logger.data)
+        programs = [{'program_name': 'no_command', 'program_options': {}},
+                    {'program_name': 'good',
+                     'program_options': {'command': '/usr/bin/find /'}},
+                    {'program_name': 'bad_numprocs',
+                     'program_options': {'command': '/usr/bin/find /',
+                                         'numprocs': 'x'}},
+                    {'program_name': 'bad_user',
+                     'program_options': {'command': '/usr/bin/find /',
+                                         'user': 'nonexistent_user_xyz'}},
+                    42]
+        results = interface.validatePrograms(programs)
+        self.assertEqual([False, True, False, False, False],
+                         [r['valid'] for r in results])
+        for result in (results[0], results[2], results[3]):
+            self.assertTrue(
+                result['error'].startswith('INCORRECT_PARAMETERS'))
+        self.assertEqual('INCORRECT_PARAMETERS', results[4]['error'])
+
+    def test_validatePrograms_reports_duplicate_process_names(self):
+        pconfig = DummyPConfig(None, 'exists', '/bin/foo')
+        gconfig = DummyPGroupConfig(None, pconfigs=[pconfig])
+        pgroup = DummyProcessGroup(gconfig)
+        supervisord = DummySupervisor(process_groups = {'group_name': pgroup})
+        supervisord.options = supervisor.options.ServerOptions()
+        interface = self.makeOne(supervisord)
 
-    def test_log_raises_incorrect_parameters_when_level_is_bad(self):
+        poptions = {'command': '/usr/bin/find /'}
+        programs = [{'program_name': 'exists', 'program_options': poptions},
+                    {'program_name': 'new', 'program_options': poptions},
+                    {'program_name': 'new', 'program_options': poptions}]
+        results = interface.validatePrograms(programs, 'group_name')
+        self.assertEqual([False, True, False], [r['valid'] for r in results])
+        self.assertEqual('BAD_NAME: exists', results[0]['error'])
+        self.assertEqual('BAD_NAME: new', results[2]['error'])
+        self.assertEqual([pconfig], pgroup.config.process_configs)
+
+    def test_validatePrograms_is_allowed_when_read_only(self):
+        supervisord = DummySupervisor(process_groups = {})
+        supervisord.options = supervisor.options.ServerOptions()
+        interface = self.makeOne(supervisord, read_only='true')
+
+        self.assertEqual([], interface.validatePrograms([]))
+
+    # API Method twiddler.callJSON()
+
+    def test_callJSON_can_be_disabled(self):
+        supervisord = DummySupervisor()
+        interface = self.makeOne(supervisord, whitelist='foo,bar')
+
+        self.assertRPCError(TwiddlerFaults.NOT_IN_WHITELIST,
+                            interface.callJSON, '{}')
+
+    def test_callJSON_raises_incorrect_params_when_json_is_bad(self):
         supervisord = DummySupervisor()
         interface = self.makeOne(supervisord)
 
-        for bad_level in ['bad_level', 9999, None]:
+        for bad in ['', '{', '[]', 'not json']:
             self.assertRPCError(SupervisorFaults.INCORRECT_PARAMETERS,
-                                interface.log, 'hello', bad_level)
+                                interface.callJSON, bad)
 
-    # Helpers Methods
+    def test_callJSON_calls_method_and_returns_result(self):
+        import json
+        supervisord = DummySupervisor(process_groups = {'foo': None})
+        interface = self.makeOne(supervisord)
 
-    def getTargetClass(self):
-        from supervisor_twiddler.rpcinterface import TwiddlerNamespaceRPCInterface
-        return TwiddlerNamespaceRPCInterface
+        request = {'jsonrpc': '2.0', 'method': 'getGroupNames', 'id': 7}
+        response = json.loads(interface.callJSON(json.dumps(request)))
+        self.assertEqual({'jsonrpc': '2.0', 'result': ['foo'], 'id': 7},
+                         response)
+        self.assertEqual('getGroupNames', interface.update_text)
 
-    def makeOne(self, *arg, **kw):
-        return self.getTargetClass()(*arg, **kw)
+    def test_callJSON_accepts_params_as_object(self):
+        import json
+        pgroup = self.makeEmptyGroup()
+        supervisord = DummySupervisor(process_groups = {'group_name': pgroup})
+        supervisord.options = supervisor.options.ServerOptions()
+        interface = self.makeOne(supervisord)
+
+        request = {'jsonrpc': '2.0', 'method': 'addProgramToGroup', 'id': 1,
+                   'params': {'group_name': 'group_name',
+                              'program_name': 'foo',
+                              'program_options': {'command': '/bin/foo'}}}
+        response = json.loads(interface.callJSON(json.dumps(request)))
+        self.assertEqual(True, response['result'])
+        self.assertEqual(['foo'], list(pgroup.processes.keys()))
+
+    def test_callJSON_returns_fault_codes_as_errors(self):
+        import json
+        supervisord = DummySupervisor(process_groups = {})
+        interface = self.makeOne(supervisord, read_only='true')
+
+        requests = [{'jsonrpc': '2.0', 'method': 'removeGroup',
+                     'params': ['foo'], 'id': 1},
+                    {'jsonrpc': '2.0', 'method': 'nonexistent', 'id': 2},
+                    {'jsonrpc': '2.0', 'method': '_update', 'id': 3},
+                    {'jsonrpc': '2.0', 'method': 'getGroupNames',
+                     'params': ['extra'], 'id': 4},
+                    {'jsonrpc': '2.0', 'method': 'callJSON',
+                     'params': ['{}'], 'id': 5},
+                    {'jsonrpc': '2.0', 'params': [], 'id': 6},
+                    42]
+        responses = json.loads(interface.callJSON(json.dumps(requests)))
+        self.assertEqual([TwiddlerFaults.READ_ONLY,
+                          SupervisorFaults.UNKNOWN_METHOD,
+                          SupervisorFaults.UNKNOWN_METHOD,
+                          SupervisorFaults.INCORRECT_PARAMETERS,
+                          SupervisorFaults.INCORRECT_PARAMETERS,
+                          SupervisorFaults.INCORRECT_PARAMETERS,
+                          SupervisorFaults.INCORRECT_PARAMETERS],
+                         [r['error']['code'] for r in responses])
+        self.assertEqual([1, 2, 3, 4, 5, 6, None],
+                         [r['id'] for r in responses])
+        self.assertEqual('UNKNOWN_METHOD: nonexistent',
+                         responses[1]['error']['message'])
+
+    def test_callJSON_makes_batch_calls_in_order(self):
+        import json
+        supervisord = self.makeSupervisor()
+        interface = self.makeOne(supervisord)
+
+        requests = [{'jsonrpc': '2.0', 'method': 'addGroup',
+                     'params': ['foo'], 'id': 1},
+                    {'jsonrpc': '2.0', 'method': 'addGroup',
+                     'params': ['foo'], 'id': 2},
+                    {'jsonrpc': '2.0', 'method': 'getGroupNames', 'id': 3}]
+        responses = json.loads(interface.callJSON(json.dumps(requests)))
+        self.assertEqual(True, responses[0]['result'])
+        self.assertEqual(SupervisorFaults.BAD_NAME,
+                         responses[1]['error']['code'])
+        self.assertEqual(['foo'], responses[2]['result'])
+        self.assertEqual(1, interface._generation)
+
+    def test_callJSON_waits_for_deferred_results(self):
+        import json
+        pconfig = DummyPConfig(None, 'foo', '/bin/foo')
+        pgroup = DummyProcessGroup(DummyPGroupConfig(None, pconfigs=[pconfig]))
+        pgroup.processes = {'foo': DummyProcess(pconfig, ProcessStates.STARTING)}
+        supervisord = DummySupervisor(process_groups = {'group_name': pgroup})
+        interface = self.makeOne(supervisord)
+
+        requests = [{'jsonrpc': '2.0', 'method': 'waitForProcessStates',
+                     'params': [['group_name:foo'], ['RUNNING']], 'id': 1},
+                    {'jsonrpc': '2.0', 'method': 'getAPIVersion', 'id': 2}]
+        callback = interface.callJSON(json.dumps(requests))
+        from supervisor.http import NOT_DONE_YET
+        self.assertEqual(NOT_DONE_YET, callback())
+        self.assertEqual(0.05, callback.delay)
+
+        pgroup.processes['foo'].state = ProcessStates.RUNNING
+        responses = json.loads(callback())
+        self.assertEqual([True], [r['reached'] for r in responses[0]['result']])
+        from supervisor_twiddler.rpcinterface import API_VERSION
+        self.assertEqual(API_VERSION, responses[1]['result'])
+
+    def test_callJSON_does_not_hide_type_errors_raised_in_methods(self):
+        import json
+        supervisord = DummySupervisor(process_groups = {})
+        interface = self.makeOne(supervisord)
+
+        def getGroupNames():
+            raise TypeError('bug')
+        interface.getGroupNames = getGroupNames
+
+        requests = [{'jsonrpc': '2.0', 'method': 'getGroupNames', 'id': 1},
+                    {'jsonrpc': '2.0', 'method': 'getGroupNames',
+                     'params': {'unknown': 1}, 'id': 2}]
+        responses = json.loads(interface.callJSON(json.dumps(requests)))
+        self.assertEqual([SupervisorFaults.FAILED,
+                          SupervisorFaults.INCORRECT_PARAMETERS],
+                         [r['error']['code'] for r in responses])
+        self.assertTrue('bug' in responses[0]['error']['message'])
+
+    def test_callJSON_checks_params_of_wrapped_methods(self):
+        import json
+        supervisord = DummySupervisor(process_groups = {})
+        interface = self.makeOne(supervisord, stats='true')
+        try:
+            request = {'jsonrpc': '2.0', 'method': 'getGroupNames',
+                       'params': ['extra'], 'id': 1}
+            response = json.loads(interface.callJSON(json.dumps(request)))
+        finally:
+            self.tearDownStats()
+        self.assertEqual(SupervisorFaults.INCORRECT_PARAMETERS,
+                         response['error']['code'])
+
+    def test_callJSON_does_not_respond_to_notifications(self):
+        import json
+        supervisord = self.makeSupervisor()
+        interface = self.makeOne(supervisord)
+
+        requests = [{'jsonrpc': '2.0', 'method': 'addGroup',
+                     'params': ['foo']},
+                    {'jsonrpc': '2.0', 'method': 'removeGroup',
+                     'params': ['nonexistent']},
+                    {'jsonrpc': '2.0', 'method': 'getGroupNames', 'id': None}]
+        responses = json.loads(interface.callJSON(json.dumps(requests)))
+        self.assertEqual([{'jsonrpc': '2.0', 'result': ['foo'], 'id': None}],
+                         responses)
+
+        request = {'jsonrpc': '2.0', 'method': 'addGroup', 'params': ['bar']}
+        self.assertEqual('', interface.callJSON(json.dumps(request)))
+        self.assertEqual('', interface.callJSON(json.dumps([request])))
+        self.assertTrue('bar' in supervisord.process_groups)
+
+    def test_callJSON_is_allowed_when_read_only(self):
+        import json
+        supervisord = DummySupervisor(process_groups = {})
+        interface = self.makeOne(supervisord, read_only='true',
+                                 mutation_rate='1')
+
+        request = {'jsonrpc': '2.0', 'method': 'getGroupNames', 'id': 1}
+        for i in range(3):
+            response = json.loads(interface.callJSON(json.dumps(request)))
+            self.assertEqual([], response['result'])
+
+    # API Method twiddler.removeProcessFromGroup()
+
+    def test_removeProcessFromGroup_can_be_disabled(self):
+        supervisord = DummySupervisor()
+        interface = self.makeOne(supervisord, whitelist='foo,bar')
+
+        self.assertRPCError(TwiddlerFaults.NOT_IN_WHITELIST,
+                            interface.removeProcessFromGroup, 'group', 'process')
+
+    def test_removeProcessFromGroup_raises_bad_name_when_group_doesnt_exist(self):
+        pconfig = DummyPConfig(None, 'foo', '/bin/foo')
+        gconfig = DummyPGroupConfig(None, pconfigs=[pconfig])
+        pgroup = DummyProcessGroup(gconfig)
+
+        supervisord = DummySupervisor(process_groups = {'group_name': pgroup})
+        interface = self.makeOne(supervisord)
+
+        self.assertRPCError(SupervisorFaults.BAD_NAME,
+                            interface.removeProcessFromGroup,
+                            'nonexistant_group_name', 'process_name')
+
+    def test_removeProcessFromGroup_raises_bad_name_when_process_does_not_exist(self):
+        pconfig = DummyPConfig(None, 'foo', '/bin/foo')
+        gconfig = DummyPGroupConfig(None, pconfigs=[pconfig])
+        pgroup = DummyProcessGroup(gconfig)
+        pgroup.processes = {}
+
+        supervisord = DummySupervisor(process_groups = {'group_name': pgroup})
+        interface = self.makeOne(supervisord)
+
+        self.assertRPCError(SupervisorFaults.BAD_NAME,
+                            interface.removeProcessFromGroup,
+                            'group_name', 'nonexistant_process_name')
+
+    def test_removeProcessFromGroup_raises_still_running_when_process_has_pid(self):
+        pconfig = DummyPConfig(None, 'foo', '/bin/foo')
+        process = DummyProcess(pconfig)
+        process.pid = 42
+
+        gconfig = DummyPGroupConfig(None, pconfigs=[pconfig])
+        pgroup = DummyProcessGroup(gconfig)
+        pgroup.processes = { 'process_with_pid': process }
+
+        supervisord = DummySupervisor(process_groups = {'group_name': pgroup})
+        interface = self.makeOne(supervisord)
+
+        self.assertRPCError(SupervisorFaults.STILL_RUNNING,
+                            interface.removeProcessFromGroup,
+                            'group_name', 'process_with_pid')
+
+    def test_removeProcessFromGroup_transitions_process_group(self):
+        pconfig = DummyPConfig(None, 'foo', '/bin/foo')
+        process = DummyProcess(pconfig, ProcessStates.EXITED)
+
+        gconfig = DummyPGroupConfig(None, pconfigs=[pconfig])
+        pgroup = DummyProcessGroup(gconfig)
+        pgroup.processes = { 'process_name': process }
+
+        supervisord = DummySupervisor(process_groups = {'group_name': pgroup})
+        interface = self.makeOne(supervisord)
+
+        result = interface.removeProcessFromGroup('group_name', 'process_name')
+        self.assertTrue(result)
+        self.assertTrue(pgroup.transitioned)
+
+    def test_removeProcessFromGroup_deletes_the_process(self):
+        pconfig = DummyPConfig(None, 'foo', '/bin/foo')
+        process = DummyProcess(pconfig, ProcessStates.STOPPED)
+
+        gconfig = DummyPGroupConfig(None, pconfigs=[pconfig])
+        pgroup = DummyProcessGroup(gconfig)
+        pgroup.processes = { 'process_name': process }
+
+        supervisord = DummySupervisor(process_groups = {'group_name': pgroup})
+        interface = self.makeOne(supervisord)
+
+        result = interface.removeProcessFromGroup('group_name', 'process_name')
+        self.assertTrue(result)
+        self.assertTrue(pgroup.processes.get('process_name') is None)
+        self.assertEqual('removeProcessFromGroup', interface.update_text)
+
+    def test_removeProcessFromGroup_deletes_only_the_process_config(self):
+        foo_pconfig = DummyPConfig(None, 'foo', '/bin/foo')
+        bar_pconfig = DummyPConfig(None, 'bar', '/bin/bar')
+        process = DummyProcess(foo_pconfig, ProcessStates.STOPPED)
+
+        gconfig = DummyPGroupConfig(None, pconfigs=[foo_pconfig, bar_pconfig])
+        pgroup = DummyProcessGroup(gconfig)
+        pgroup.processes = { 'foo': process }
+
+        supervisord = DummySupervisor(process_groups = {'group_name': pgroup})
+        interface = self.makeOne(supervisord)
+
+        result = interface.removeProcessFromGroup('group_name', 'foo')
+        self.assertTrue(result)
+        self.assertEqual([bar_pconfig], pgroup.config.process_configs)
+
+    # API Method twiddler.removeProcessesFromGroup()
+
+    def test_removeProcessesFromGroup_can_be_disabled(self):
+        supervisord = DummySupervisor()
+        interface = self.makeOne(supervisord, whitelist='foo,bar')
+
+        self.assertRPCError(TwiddlerFaults.NOT_IN_WHITELIST,
+                            interface.removeProcessesFromGroup, 'group', [])
+
+    def test_removeProcessesFromGroup_raises_bad_name_when_group_doesnt_exist(self):
+        supervisord = DummySupervisor(process_groups = {})
+        interface = self.makeOne(supervisord)
+
+        self.assertRPCError(SupervisorFaults.BAD_NAME,
+                            interface.removeProcessesFromGroup,
+                            'nonexistant_group_name', ['process_name'])
+
+    def test_removeProcessesFromGroup_raises_incorrect_params_when_names_is_not_array(self):
+        gconfig = DummyPGroupConfig(None, pconfigs=[])
+        pgroup = DummyProcessGroup(gconfig)
+        pgroup.processes = {}
+
+        supervisord = DummySupervisor(process_groups = {'group_name': pgroup})
+        interface = self.makeOne(supervisord)
+
+        self.assertRPCError(SupervisorFaults.INCORRECT_PARAMETERS,
+                            interface.removeProcessesFromGroup,
+                            'group_name', 'process_name')
+
+    def test_removeProcessesFromGroup_removes_nothing_when_any_process_is_running(self):
+        foo_pconfig = DummyPConfig(None, 'foo', '/bin/foo')
+        foo_process = DummyProcess(foo_pconfig, ProcessStates.STOPPED)
+        bar_pconfig = DummyPConfig(None, 'bar', '/bin/bar')
+        bar_process = DummyProcess(bar_pconfig, ProcessStates.RUNNING)
+        bar_process.pid = 42
+
+        gconfig = DummyPGroupConfig(None, pconfigs=[foo_pconfig, bar_pconfig])
+        pgroup = DummyProcessGroup(gconfig)
+        pgroup.processes = {'foo': foo_process, 'bar': bar_process}
+
+        supervisord = DummySupervisor(process_groups = {'group_name': pgroup})
+        interface = self.makeOne(supervisord)
+
+        self.assertRPCError(SupervisorFaults.STILL_RUNNING,
+                            interface.removeProcessesFromGroup,
+                            'group_name', ['foo', 'bar'])
+        self.assertEqual(2, len(pgroup.config.process_configs))
+        self.assertEqual(2, len(pgroup.processes))
+        self.assertFalse(pgroup.transitioned)
+
+    def test_removeProcessesFromGroup_removes_nothing_when_any_process_doesnt_exist(self):
+        foo_pconfig = DummyPConfig(None, 'foo', '/bin/foo')
+        foo_process = DummyProcess(foo_pconfig, ProcessStates.STOPPED)
+
+        gconfig = DummyPGroupConfig(None, pconfigs=[foo_pconfig])
+        pgroup = DummyProcessGroup(gconfig)
+        pgroup.processes = {'foo': foo_process}
+
+        supervisord = DummySupervisor(process_groups = {'group_name': pgroup})
+        interface = self.makeOne(supervisord)
+
+        self.assertRPCError(SupervisorFaults.BAD_NAME,
+                            interface.removeProcessesFromGroup,
+                            'group_name', ['foo', 'nonexistant_process_name'])
+        self.assertEqual(1, len(pgroup.config.process_configs))
+        self.assertEqual(1, len(pgroup.processes))
+
+    def test_removeProcessesFromGroup_deletes_processes_and_configs(self):
+        pconfigs = []
+        processes = {}
+        for name in ('foo', 'bar', 'baz'):
+            pconfig = DummyPConfig(None, name, '/bin/%s' % name)
+            pconfigs.append(pconfig)
+            processes[name] = DummyProcess(pconfig, ProcessStates.EXITED)
+
+        gconfig = DummyPGroupConfig(None, pconfigs=pconfigs)
+        pgroup = DummyProcessGroup(gconfig)
+        pgroup.processes = processes
+
+        supervisord = DummySupervisor(process_groups = {'group_name': pgroup})
+        interface = self.makeOne(supervisord)
+
+        result = interface.removeProcessesFromGroup('group_name', ['foo', 'baz'])
+        self.assertTrue(result)
+        self.assertEqual('removeProcessesFromGroup', interface.update_text)
+        self.assertTrue(pgroup.transitioned)
+        self.assertEqual(['bar'], list(pgroup.processes.keys()))
+        self.assertEqual(['bar'], [c.name for c in pgroup.config.process_configs])
+
+    # API Method twiddler.removeProgramFromGroup()
+
+    def test_removeProgramFromGroup_can_be_disabled(self):
+        supervisord = DummySupervisor()
+        interface = self.makeOne(supervisord, whitelist='foo,bar')
+
+        self.assertRPCError(TwiddlerFaults.NOT_IN_WHITELIST,
+                            interface.removeProgramFromGroup, 'group', 'program')
+
+    def test_removeProgramFromGroup_raises_bad_name_when_program_was_not_added(self):
+        gconfig = DummyPGroupConfig(None, pconfigs=[])
+        pgroup = DummyProcessGroup(gconfig)
+        pgroup.processes = {}
+
+        supervisord = DummySupervisor(process_groups = {'group_name': pgroup})
+        interface = self.makeOne(supervisord)
+
+        self.assertRPCError(SupervisorFaults.BAD_NAME,
+                            interface.removeProgramFromGroup,
+                            'group_name', 'nonexistant_program_name')
+
+    def test_removeProgramFromGroup_deletes_all_processes_of_program(self):
+        pconfig = DummyPConfig(None, 'foo', '/bin/foo')
+        gconfig = DummyPGroupConfig(None, pconfigs=[pconfig])
+        pgroup = DummyProcessGroup(gconfig)
+        pgroup.processes = {'foo': DummyProcess(pconfig)}
+
+        supervisord = DummySupervisor(process_groups = {'group_name': pgroup})
+        supervisord.options = supervisor.options.ServerOptions()
+        interface = self.makeOne(supervisord)
+
+        poptions = {'command': '/usr/bin/find /',
+                    'process_name': 'find_%(process_num)d',
+                    'numprocs': 3}
+        interface.addProgramToGroup('group_name', 'find', poptions)
+        self.assertEqual(4, len(pgroup.processes))
+
+        result = interface.removeProgramFromGroup('group_name', 'find')
+        self.assertTrue(result)
+        self.assertEqual('removeProgramFromGroup', interface.update_text)
+        self.assertEqual(['foo'], list(pgroup.processes.keys()))
+        self.assertEqual([pconfig], pgroup.config.process_configs)
+
+        self.assertRPCError(SupervisorFaults.BAD_NAME,
+                            interface.removeProgramFromGroup,
+                            'group_name', 'find')
+
+    def test_removeProgramFromGroup_skips_processes_already_removed(self):
+        gconfig = DummyPGroupConfig(None, pconfigs=[])
+        pgroup = DummyProcessGroup(gconfig)
+        pgroup.processes = {}
+
+        supervisord = DummySupervisor(process_groups = {'group_name': pgroup})
+        supervisord.options = supervisor.options.ServerOptions()
+        interface = self.makeOne(supervisord)
+
+        poptions = {'command': '/usr/bin/find /',
+                    'process_name': 'find_%(process_num)d',
+                    'numprocs': 2}
+        interface.addProgramToGroup('group_name', 'find', poptions)
+        interface.removeProcessFromGroup('group_name', 'find_0')
+
+        result = interface.removeProgramFromGroup('group_name', 'find')
+        self.assertTrue(result)
+        self.assertEqual({}, pgroup.processes)
+        self.assertEqual([], pgroup.config.process_configs)
+
+    # API Method twiddler.replaceProgramInGroup()
+
+    def test_replaceProgramInGroup_can_be_disabled(self):
+        supervisord = DummySupervisor()
+        interface = self.makeOne(supervisord, whitelist='foo,bar')
+
+        self.assertRPCError(TwiddlerFaults.NOT_IN_WHITELIST,
+                            interface.replaceProgramInGroup, 'grp', 'prog', {})
+
+    def test_replaceProgramInGroup_raises_bad_name_when_program_was_not_added(self):
+        pconfig = DummyPConfig(None, 'foo', '/bin/foo')
+        gconfig = DummyPGroupConfig(None, pconfigs=[pconfig])
+        pgroup = DummyProcessGroup(gconfig)
+        pgroup.processes = {'foo': DummyProcess(pconfig)}
+
+        supervisord = DummySupervisor(process_groups = {'group_name': pgroup})
+        interface = self.makeOne(supervisord)
+
+        self.assertRPCError(SupervisorFaults.BAD_NAME,
+                            interface.replaceProgramInGroup,
+                            'group_name', 'foo', {'command': '/bin/foo'})
+
+    def test_replaceProgramInGroup_raises_incorrect_params_when_poptions_is_invalid(self):
+        pgroup = self.makeEmptyGroup()
+        supervisord = DummySupervisor(process_groups = {'group_name': pgroup})
+        supervisord.options = supervisor.options.ServerOptions()
+        interface = self.makeOne(supervisord)
+        interface.addProgramToGroup('group_name', 'find', {'command': '/usr/bin/find /'})
+        config = pgroup.config.process_configs[0]
+
+        self.assertRPCError(SupervisorFaults.INCORRECT_PARAMETERS,
+                            interface.replaceProgramInGroup,
+                            'group_name', 'find', {})
+        self.assertRPCError(SupervisorFaults.INCORRECT_PARAMETERS,
+                            interface.replaceProgramInGroup,
+                            'group_name', 'find', {'command': '/bin/ls'}, -1)
+        self.assertEqual([config], pgroup.config.process_configs)
+
+    def test_replaceProgramInGroup_swaps_configs_in_place(self):
+        pgroup = self.makeEmptyGroup()
+        supervisord = DummySupervisor(process_groups = {'group_name': pgroup})
+        supervisord.options = supervisor.options.ServerOptions()
+        interface = self.makeOne(supervisord)
+
+        poptions = {'command': '/usr/bin/find /',
+                    'process_name': 'find_%(process_num)d',
+                    'numprocs': 2}
+        interface.addProgramToGroup('group_name', 'find', poptions)
+        process = pgroup.processes['find_0']
+        process.pid = 42
+        process.state = ProcessStates.RUNNING
+
+        poptions = {'command': '/bin/ls',
+                    'process_name': 'find_%(process_num)d',
+                    'numprocs': 2}
+        result = interface.replaceProgramInGroup('group_name', 'find', poptions)
+        self.assertTrue(result)
+        self.assertEqual('replaceProgramInGroup', interface.update_text)
+
+        self.assertTrue(pgroup.processes['find_0'] is process)
+        self.assertEqual(42, process.pid)
+        self.assertEqual('/bin/ls', process.config.command)
+        self.assertEqual('/bin/ls', pgroup.processes['find_1'].config.command)
+        self.assertEqual(['/bin/ls', '/bin/ls'],
+            [c.command for c in pgroup.config.process_configs])
+
+    def test_replaceProgramInGroup_adds_and_removes_processes(self):
+        pgroup = self.makeEmptyGroup()
+        supervisord = DummySupervisor(process_groups = {'group_name': pgroup})
+        supervisord.options = supervisor.options.ServerOptions()
+        interface = self.makeOne(supervisord)
+
+        poptions = {'command': '/usr/bin/find /',
+                    'process_name': 'find_%(process_num)d',
+                    'numprocs': 2}
+        interface.addProgramToGroup('group_name', 'find', poptions)
+
+        poptions['numprocs_start'] = 1
+        result = interface.replaceProgramInGroup('group_name', 'find', poptions)
+        self.assertTrue(result)
+        self.assertEqual(['find_1', 'find_2'], sorted(pgroup.processes))
+        self.assertEqual(['find_1', 'find_2'],
+            sorted([c.name for c in pgroup.config.process_configs]))
+
+        interface.removeProgramFromGroup('group_name', 'find')
+        self.assertEqual({}, pgroup.processes)
+
+    def test_replaceProgramInGroup_raises_still_running_when_removed_process_is_running(self):
+        pgroup = self.makeEmptyGroup()
+        supervisord = DummySupervisor(process_groups = {'group_name': pgroup})
+        supervisord.options = supervisor.options.ServerOptions()
+        interface = self.makeOne(supervisord)
+
+        poptions = {'command': '/usr/bin/find /',
+                    'process_name': 'find_%(process_num)d',
+                    'numprocs': 2}
+        interface.addProgramToGroup('group_name', 'find', poptions)
+        pgroup.processes['find_1'].pid = 42
+
+        poptions = {'command': '/bin/ls',
+                    'process_name': 'find_%(process_num)d',
+                    'numprocs': 1}
+        self.assertRPCError(SupervisorFaults.STILL_RUNNING,
+                            interface.replaceProgramInGroup,
+                            'group_name', 'find', poptions)
+        self.assertEqual(['/usr/bin/find /', '/usr/bin/find /'],
+            [c.command for c in pgroup.config.process_configs])
+
+    def test_replaceProgramInGroup_raises_bad_name_when_new_process_exists(self):
+        pconfig = DummyPConfig(None, 'find_1', '/bin/foo')
+        gconfig = DummyPGroupConfig(None, pconfigs=[pconfig])
+        pgroup = DummyProcessGroup(gconfig)
+        pgroup.processes = {'find_1': DummyProcess(pconfig)}
+
+        supervisord = DummySupervisor(process_groups = {'group_name': pgroup})
+        supervisord.options = supervisor.options.ServerOptions()
+        interface = self.makeOne(supervisord)
+
+        poptions = {'command': '/usr/bin/find /',
+                    'process_name': 'find_%(process_num)d',
+                    'numprocs': 1}
+        interface.addProgramToGroup('group_name', 'find', poptions)
+
+        poptions['numprocs'] = 2
+        self.assertRPCError(SupervisorFaults.BAD_NAME,
+                            interface.replaceProgramInGroup,
+                            'group_name', 'find', poptions)
+
+    def test_replaceProgramInGroup_restarts_running_processes_in_batches(self):
+        pgroup = self.makeEmptyGroup()
+        supervisord = DummySupervisor(process_groups = {'group_name': pgroup})
+        supervisord.options = supervisor.options.ServerOptions()
+        interface = self.makeOne(supervisord)
+
+        poptions = {'command': '/usr/bin/find /',
+                    'process_name': 'find_%(process_num)d',
+                    'numprocs': 3}
+        interface.addProgramToGroup('group_name', 'find', poptions)
+        for name, process in list(pgroup.processes.items()):
+            pgroup.processes[name] = DummyProcess(process.config,
+                                                  ProcessStates.RUNNING)
+
+        poptions['command'] = '/bin/ls'
+        callback = interface.replaceProgramInGroup('group_name', 'find',
+                                                   poptions, 2)
+        from supervisor.http import NOT_DONE_YET
+        self.assertTrue(callable(callback))
+
+        # first batch is stopped
+        self.assertEqual(NOT_DONE_YET, callback())
+        stopped = [n for n, p in pgroup.processes.items() if p.stop_called]
+        self.assertEqual(['find_0', 'find_1'], sorted(stopped))
+        self.assertFalse(pgroup.processes['find_2'].stop_called)
+
+        # first batch is started
+        self.assertEqual(NOT_DONE_YET, callback())
+        self.assertTrue(pgroup.processes['find_0'].spawned)
+        self.assertTrue(pgroup.processes['find_1'].spawned)
+
+        # second batch is stopped, then started
+        self.assertEqual(NOT_DONE_YET, callback())
+        self.assertTrue(pgroup.processes['find_2'].stop_called)
+        self.assertEqual(NOT_DONE_YET, callback())
+        self.assertTrue(pgroup.processes['find_2'].spawned)
+
+        self.assertEqual(True, callback())
+        for process in pgroup.processes.values():
+            self.assertEqual('/bin/ls', process.config.command)
+
+    def test_replaceProgramInGroup_restarts_batches_without_the_client(self):
+        from supervisor import events
+        pgroup = self.makeEmptyGroup()
+        supervisord = DummySupervisor(process_groups = {'group_name': pgroup})
+        supervisord.options = supervisor.options.ServerOptions()
+        interface = self.makeOne(supervisord)
+
+        poptions = {'command': '/usr/bin/find /',
+                    'process_name': 'find_%(process_num)d',
+                    'numprocs': 2}
+        interface.addProgramToGroup('group_name', 'find', poptions)
+        for name, process in list(pgroup.processes.items()):
+            pgroup.processes[name] = DummyProcess(process.config,
+                                                  ProcessStates.RUNNING)
+
+        # the client goes away without polling the callback
+        poptions['command'] = '/bin/ls'
+        interface.replaceProgramInGroup('group_name', 'find', poptions, 1)
+
+        for i in range(4):
+            events.notify(events.Tick5Event(i * 5, supervisord))
+        for process in pgroup.processes.values():
+            self.assertTrue(process.stop_called)
+            self.assertTrue(process.spawned)
+            self.assertEqual(ProcessStates.RUNNING, process.state)
+
+        events.notify(events.Tick5Event(20, supervisord))
+        self.assertEqual([], interface._watchers)
+
+    def test_replaceProgramInGroup_waits_for_stopped_process_to_be_reaped(self):
+        pgroup = self.makeEmptyGroup()
+        supervisord = DummySupervisor(process_groups = {'group_name': pgroup})
+        supervisord.options = supervisor.options.ServerOptions()
+        interface = self.makeOne(supervisord)
+
+        interface.addProgramToGroup('group_name', 'find',
+                                    {'command': '/usr/bin/find /'})
+        process = DummyProcess(pgroup.processes['find'].config,
+                               ProcessStates.RUNNING)
+        pgroup.processes['find'] = process
+
+        callback = interface.replaceProgramInGroup('group_name', 'find',
+                                                   {'command': '/bin/ls'}, 1)
+        callback() # stop
+        self.assertTrue(process.stop_called)
+
+        # the state change to STOPPED is sent before the pid is cleared
+        process.pid = 42
+        callback()
+        self.assertFalse(process.spawned)
+        process.pid = 0
+        callback()
+        self.assertTrue(process.spawned)
+
+    def test_replaceProgramInGroup_stops_rollout_when_batch_fails(self):
+        pgroup = self.makeEmptyGroup()
+        supervisord = DummySupervisor(process_groups = {'group_name': pgroup})
+        supervisord.options = supervisor.options.ServerOptions()
+        interface = self.makeOne(supervisord)
+
+        poptions = {'command': '/usr/bin/find /',
+                    'process_name': 'find_%(process_num)d',
+                    'numprocs': 3}
+        interface.addProgramToGroup('group_name', 'find', poptions)
+        for name, process in list(pgroup.processes.items()):
+            pgroup.processes[name] = DummyProcess(process.config,
+                                                  ProcessStates.RUNNING)
+
+        poptions['command'] = '/nonexistent'
+        callback = interface.replaceProgramInGroup('group_name', 'find',
+                                                   poptions, 1)
+        from supervisor.http import NOT_DONE_YET
+        callback() # stop find_0
+        callback() # start find_0
+        pgroup.processes['find_0'].state = ProcessStates.FATAL
+        self.assertRPCError(SupervisorFaults.SPAWN_ERROR, callback)
+        self.assertFalse(pgroup.processes['find_1'].stop_called)
+        self.assertFalse(pgroup.processes['find_2'].stop_called)
+
+    def test_replaceProgramInGroup_reports_names_of_failed_processes(self):
+        pgroup = self.makeEmptyGroup()
+        supervisord = DummySupervisor(process_groups = {'group_name': pgroup})
+        supervisord.options = supervisor.options.ServerOptions()
+        interface = self.makeOne(supervisord)
+
+        poptions = {'command': '/usr/bin/find /',
+                    'process_name': 'find_%(process_num)d',
+                    'numprocs': 2}
+        interface.addProgramToGroup('group_name', 'find', poptions)
+        for name, process in list(pgroup.processes.items()):
+            pgroup.processes[name] = DummyProcess(process.config,
+                                                  ProcessStates.RUNNING)
+
+        callback = interface.replaceProgramInGroup('group_name', 'find',
+                                                   poptions, 2)
+        callback() # stop batch
+        callback() # start batch
+        pgroup.processes['find_1'].state = ProcessStates.EXITED
+        from supervisor.xmlrpc import RPCError
+        try:
+            callback()
+            self.fail('nothing raised')
+        except RPCError as e:
+            self.assertEqual(SupervisorFaults.SPAWN_ERROR, e.code)
+            self.assertEqual('SPAWN_ERROR: find_1', e.text)
+
+    def test_replaceProgramInGroup_waits_for_batch_to_leave_starting(self):
+        pgroup = self.makeEmptyGroup()
+        supervisord = DummySupervisor(process_groups = {'group_name': pgroup})
+        supervisord.options = supervisor.options.ServerOptions()
+        interface = self.makeOne(supervisord)
+
+        poptions = {'command': '/usr/bin/find /',
+                    'process_name': 'find_%(process_num)d',
+                    'numprocs': 2}
+        interface.addProgramToGroup('group_name', 'find', poptions)
+        for name, process in list(pgroup.processes.items()):
+            pgroup.processes[name] = DummyProcess(process.config,
+                                                  ProcessStates.RUNNING)
+
+        callback = interface.replaceProgramInGroup('group_name', 'find',
+                                                   poptions, 1)
+        from supervisor.http import NOT_DONE_YET
+        callback() # stop find_0
+        callback() # start find_0
+        pgroup.processes['find_0'].state = ProcessStates.STARTING
+        self.assertEqual(NOT_DONE_YET, callback())
+        self.assertFalse(pgroup.processes['find_1'].stop_called)
+
+        pgroup.processes['find_0'].state = ProcessStates.RUNNING
+        self.assertEqual(NOT_DONE_YET, callback())
+        self.assertTrue(pgroup.processes['find_1'].stop_called)
+
+    # API Method twiddler.reconcileGroup()
+
+    def test_reconcileGroup_can_be_disabled(self):
+        supervisord = DummySupervisor()
+        interface = self.makeOne(supervisord, whitelist='foo,bar')
+
+        self.assertRPCError(TwiddlerFaults.NOT_IN_WHITELIST,
+                            interface.reconcileGroup, 'group_name', [])
+
+    def test_reconcileGroup_raises_bad_name_when_group_doesnt_exist(self):
+        supervisord = DummySupervisor(process_groups = {})
+        interface = self.makeOne(supervisord)
+
+        self.assertRPCError(SupervisorFaults.BAD_NAME,
+                            interface.reconcileGroup, 'nonexistent', [])
+
+    def test_reconcileGroup_raises_incorrect_params_when_programs_are_bad(self):
+        supervisord = self.makeSupervisor()
+        interface = self.makeOne(supervisord)
+        interface.addGroup('group_name')
+
+        for bad in [42, [42], [{'program_name': 'foo'}],
+                    [{'program_name': 'foo', 'program_options': 42}],
+                    [{'program_name': 'foo', 'program_options': {}}]]:
+            self.assertRPCError(SupervisorFaults.INCORRECT_PARAMETERS,
+                                interface.reconcileGroup, 'group_name', bad)
+
+    def test_reconcileGroup_raises_bad_name_for_duplicate_names(self):
+        supervisord = self.makeSupervisor()
+        interface = self.makeOne(supervisord)
+        interface.addGroup('group_name')
+
+        poptions = {'command': '/usr/bin/find /'}
+        duplicate_programs = [{'program_name': 'foo', 'program_options': poptions},
+                              {'program_name': 'foo', 'program_options': poptions}]
+        self.assertRPCError(SupervisorFaults.BAD_NAME,
+                            interface.reconcileGroup, 'group_name',
+                            duplicate_programs)
+
+        duplicate_processes = [
+            {'program_name': 'foo', 'program_options': poptions},
+            {'program_name': 'bar',
+             'program_options': {'command': '/bin/cat', 'process_name': 'foo'}}]
+        self.assertRPCError(SupervisorFaults.BAD_NAME,
+                            interface.reconcileGroup, 'group_name',
+                            duplicate_processes)
+        self.assertEqual({}, supervisord.process_groups['group_name'].processes)
+
+    def test_reconcileGroup_adds_missing_programs(self):
+        supervisord = self.makeSupervisor()
+        interface = self.makeOne(supervisord)
+        interface.addGroup('group_name')
+        generation = interface._generation
+
+        programs = [{'program_name': 'foo',
+                     'program_options': {'command': '/usr/bin/find /',
+                                         'autostart': 'false'}},
+                    {'program_name': 'bar',
+                     'program_options': {'command': '/bin/cat',
+                                         'process_name': 'bar_%(process_num)s',
+                                         'numprocs': '2',
+                                         'autostart': 'false'}}]
+        result = interface.reconcileGroup('group_name', programs)
+        self.assertEqual('reconcileGroup', interface.update_text)
+        self.assertEqual({'added': ['foo', 'bar_0', 'bar_1'],
+                          'changed': [],
+                          'removed': [],
+                          'unchanged': 0,
+                          'restart_needed': [],
+                          'stop_needed': []}, result)
+        group = supervisord.process_groups['group_name']
+        self.assertEqual(['bar_0', 'bar_1', 'foo'],
+                         sorted(group.processes.keys()))
+        self.assertEqual(['foo', 'bar_0', 'bar_1'],
+                         [c.name for c in group.config.process_configs])
+        self.assertEqual(generation + 1, interface._generation)
+
+        # programs can be removed by name like those added individually
+        interface.removeProgramFromGroup('group_name', 'bar')
+        self.assertEqual(['foo'], list(group.processes.keys()))
+
+    def test_reconcileGroup_does_nothing_when_programs_are_unchanged(self):
+        supervisord = self.makeSupervisor()
+        interface = self.makeOne(supervisord)
+        interface.addGroup('group_name')
+
+        programs = [{'program_name': 'prog_%d' % i,
+                     'program_options': {'command': '/bin/cat'}}
+                    for i in range(3)]
+        interface.reconcileGroup('group_name', programs)
+        generation = interface._generation
+
+        parsed = []
+        def makeProcessConfigs(*args):
+            parsed.append(args)
+            raise AssertionError('programs were parsed again')
+        interface._makeProcessConfigs = makeProcessConfigs
+
+        result = interface.reconcileGroup('group_name', programs)
+        self.assertEqual({'added': [],
+                          'changed': [],
+                          'removed': [],
+                          'unchanged': 3,
+                          'restart_needed': [],
+                          'stop_needed': []}, result)
+        self.assertEqual([], parsed)
+        self.assertEqual(generation, interface._generation)
+
+    def test_reconcileGroup_changes_configs_with_different_options(self):
+        supervisord = self.makeSupervisor()
+        interface = self.makeOne(supervisord)
+        interface.addGroup('group_name')
+        interface.addProgramToGroup('group_name', 'foo', {'command': '/bin/foo'})
+        interface.addProgramToGroup('group_name', 'bar', {'command': '/bin/bar'})
+        group = supervisord.process_groups['group_name']
+        running = group.processes['bar']
+        running.pid = 42
+        running.state = ProcessStates.RUNNING
+
+        programs = [{'program_name': 'foo',
+                     'program_options': {'command': '/bin/foo2'}},
+                    {'program_name': 'bar',
+                     'program_options': {'command': '/bin/bar2'}}]
+        result = interface.reconcileGroup('group_name', programs)
+        self.assertEqual(['bar', 'foo'], result['changed'])
+        self.assertEqual(['bar'], result['restart_needed'])
+        self.assertEqual('/bin/foo2', group.processes['foo'].config.command)
+        self.assertEqual('/bin/bar2', group.processes['bar'].config.command)
+        self.assertTrue(group.processes['bar'] is running)
+        self.assertEqual(['/bin/foo2', '/bin/bar2'],
+                         [c.command for c in group.config.process_configs])
+
+        changes = interface.getChangesSince(0)['changes']
+        self.assertEqual(['group_name:bar', 'group_name:foo'],
+                         sorted(changes[-1]['changed']))
+
+    def test_reconcileGroup_removes_only_stopped_processes(self):
+        supervisord = self.makeSupervisor()
+        interface = self.makeOne(supervisord)
+        interface.addGroup('group_name')
+        for name in ('foo', 'bar', 'baz'):
+            interface.addProgramToGroup('group_name', name,
+                                        {'command': '/bin/' + name})
+        group = supervisord.process_groups['group_name']
+        group.processes['bar'].pid = 42
+        group.processes['bar'].state = ProcessStates.RUNNING
+
+        programs = [{'program_name': 'foo',
+                     'program_options': {'command': '/bin/foo'}}]
+        result = interface.reconcileGroup('group_name', programs)
+        self.assertEqual(['baz'], result['removed'])
+        self.assertEqual(['bar'], result['stop_needed'])
+        self.assertEqual(1, result['unchanged'])
+        self.assertEqual(['bar', 'foo'], sorted(group.processes.keys()))
+
+        # once it is stopped, reconciling again removes it
+        group.processes['bar'].pid = 0
+        group.processes['bar'].state = ProcessStates.STOPPED
+        result = interface.reconcileGroup('group_name', programs)
+        self.assertEqual(['bar'], result['removed'])
+        self.assertEqual(['foo'], list(group.processes.keys()))
+
+    def test_reconcileGroup_keeps_processes_with_auto_logs_matched_by_name(self):
+        supervisord = self.makeSupervisor()
+        interface = self.makeOne(supervisord)
+        interface.addGroup('group_name')
+        interface.addProgramToGroup('group_name', 'foo', {'command': '/bin/cat'})
+        group = supervisord.process_groups['group_name']
+        process = group.processes['foo']
+        old_logfile = process.config.stdout_logfile
+
+        # a different program that makes the same process
+        programs = [{'program_name': 'bar',
+                     'program_options': {'command': '/bin/cat',
+                                         'process_name': 'foo'}}]
+        result = interface.reconcileGroup('group_name', programs)
+        self.assertEqual([], result['changed'])
+        self.assertEqual(1, result['unchanged'])
+        self.assertTrue(group.processes['foo'] is process)
+        self.assertEqual(old_logfile, process.config.stdout_logfile)
+        self.assertEqual(['bar'],
+                         list(interface._programs['group_name'].keys()))
+
+    def test_reconcileGroup_is_replayed_from_journal(self):
+        tempdir = tempfile.mkdtemp()
+        try:
+            journal = os.path.join(tempdir, 'journal')
+            supervisord = self.makeSupervisor()
+            interface = self.makeOne(supervisord, journal=journal)
+            interface.addGroup('group_name')
+            programs = [{'program_name': 'foo',
+                         'program_options': {'command': '/bin/foo'}}]
+            interface.reconcileGroup('group_name', programs)
+
+            supervisord = self.makeSupervisor()
+            interface = self.makeOne(supervisord, journal=journal)
+            group = supervisord.process_groups['group_name']
+            self.assertEqual(['foo'], list(group.processes.keys()))
+        finally:
+            shutil.rmtree(tempdir)
+
+    # API Method twiddler.scaleProgram()
+
+    def test_scaleProgram_can_be_disabled(self):
+        supervisord = DummySupervisor()
+        interface = self.makeOne(supervisord, whitelist='foo,bar')
+
+        self.assertRPCError(TwiddlerFaults.NOT_IN_WHITELIST,
+                            interface.scaleProgram, 'group_name', 'foo', 2)
+
+    def test_scaleProgram_raises_bad_name_when_program_doesnt_exist(self):
+        supervisord = self.makeSupervisor()
+        interface = self.makeOne(supervisord)
+        interface.addGroup('group_name')
+
+        self.assertRPCError(SupervisorFaults.BAD_NAME,
+                            interface.scaleProgram, 'nonexistent', 'foo', 2)
+        self.assertRPCError(SupervisorFaults.BAD_NAME,
+                            interface.scaleProgram, 'group_name', 'foo', 2)
+
+    def test_scaleProgram_raises_incorrect_params_when_it_cant_scale(self):
+        supervisord = self.makeSupervisor()
+        interface = self.makeOne(supervisord)
+        interface.addGroup('group_name')
+        interface.addProgramsToGroup('group_name', [
+            {'program_name': 'foo',
+             'program_options': self.makeScalableOptions()},
+            {'program_name': 'single',
+             'program_options': {'command': '/bin/cat',
+                                 'autostart': 'false'}},
+            {'program_name': 'counted',
+             'program_options': self.makeScalableOptions(
+                command='/bin/cat %(numprocs)s')}])
+        interface.addProgramTemplate('template', {'command': '/bin/cat',
+                                                  'autostart': 'false'})
+        interface.addProgramFromTemplate('group_name', 'template', 'tmpl')
+
+        for program_name, numprocs in [('foo', 0), ('foo', 'x'),
+                                       ('single', 2), ('counted', 3),
+                                       ('tmpl', 2)]:
+            self.assertRPCError(SupervisorFaults.INCORRECT_PARAMETERS,
+                                interface.scaleProgram, 'group_name',
+                                program_name, numprocs)
+
+    def test_scaleProgram_up_parses_only_new_processes(self):
+        supervisord = self.makeSupervisor()
+        interface = self.makeOne(supervisord)
+        interface.addGroup('group_name')
+        interface.addProgramToGroup('group_name', 'foo',
+                                    self.makeScalableOptions(numprocs='2'))
+        generation = interface._generation
+
+        parsed = []
+        makeProcessConfigs = interface._makeProcessConfigs
+        def counting(*args):
+            parsed.append(args)
+            return makeProcessConfigs(*args)
+        interface._makeProcessConfigs = counting
+
+        result = interface.scaleProgram('group_name', 'foo', 4)
+        self.assertEqual('scaleProgram', interface.update_text)
+        self.assertEqual({'added': ['foo_2', 'foo_3'], 'removed': []}, result)
+        self.assertEqual(2, len(parsed))
+        group = supervisord.process_groups['group_name']
+        self.assertEqual(['foo_0', 'foo_1', 'foo_2', 'foo_3'],
+                         sorted(group.processes.keys()))
+        self.assertEqual('/bin/cat 3', group.processes['foo_3'].config.command)
+        self.assertEqual(generation + 1, interface._generation)
+
+        info = interface._programs['group_name']['foo']
+        self.assertEqual('4', info['program_options']['numprocs'])
+        self.assertEqual(['foo_0', 'foo_1', 'foo_2', 'foo_3'],
+                         info['process_names'])
+
+    def test_scaleProgram_down_removes_highest_numbered_processes(self):
+        supervisord = self.makeSupervisor()
+        interface = self.makeOne(supervisord)
+        interface.addGroup('group_name')
+        interface.addProgramToGroup('group_name', 'foo',
+                                    self.makeScalableOptions(numprocs='4',
+                                                             numprocs_start='1'))
+
+        result = interface.scaleProgram('group_name', 'foo', 2)
+        self.assertEqual({'added': [], 'removed': ['foo_3', 'foo_4']}, result)
+        group = supervisord.process_groups['group_name']
+        self.assertEqual(['foo_1', 'foo_2'], sorted(group.processes.keys()))
+        self.assertEqual(['foo_1', 'foo_2'],
+                         [c.name for c in group.config.process_configs])
+
+    def test_scaleProgram_down_stops_running_processes_then_removes_them(self):
+        supervisord = self.makeSupervisor()
+        interface = self.makeOne(supervisord)
+        interface.addGroup('group_name')
+        interface.addProgramToGroup('group_name', 'foo',
+                                    self.makeScalableOptions(numprocs='3'))
+        group = supervisord.process_groups['group_name']
+        stopped = []
+        for name in ('foo_1', 'foo_2'):
+            process = group.processes[name]
+            process.pid = 42
+            process.state = ProcessStates.RUNNING
+            process.stop = lambda name=name: stopped.append(name)
+
+        callback = interface.scaleProgram('group_name', 'foo', 1)
+        self.assertEqual(['foo_1', 'foo_2'], sorted(stopped))
+        from supervisor.http import NOT_DONE_YET
+        self.assertEqual(NOT_DONE_YET, callback())
+        self.assertEqual(3, len(group.processes))
+
+        for name in ('foo_1', 'foo_2'):
+            group.processes[name].pid = 0
+            group.processes[name].state = ProcessStates.STOPPED
+        self.assertEqual({'added': [], 'removed': ['foo_1', 'foo_2']},
+                         callback())
+        self.assertEqual(['foo_0'], list(group.processes.keys()))
+
+        changes = interface.getChangesSince(0)['changes']
+        self.assertEqual('scaleProgram', changes[-1]['method'])
+        self.assertEqual(['group_name:foo_1', 'group_name:foo_2'],
+                         sorted(changes[-1]['removed']))
+
+    def test_scaleProgram_down_removes_processes_without_the_client(self):
+        from supervisor import events
+        supervisord = self.makeSupervisor()
+        interface = self.makeOne(supervisord)
+        interface.addGroup('group_name')
+        interface.addProgramToGroup('group_name', 'foo',
+                                    self.makeScalableOptions(numprocs='3'))
+        group = supervisord.process_groups['group_name']
+        for name in ('foo_1', 'foo_2'):
+            process = group.processes[name]
+            process.pid = 42
+            process.state = ProcessStates.RUNNING
+            process.stop = lambda: None
+
+        # the client goes away without polling the callback
+        interface.scaleProgram('group_name', 'foo', 1)
+
+        # processes are not removed on a state change, which may be sent
+        # while the group is iterating over its processes
+        foo_1 = group.processes['foo_1']
+        foo_1.pid = 0
+        foo_1.state = ProcessStates.STOPPED
+        events.notify(events.ProcessStateStoppedEvent(foo_1,
+                      ProcessStates.STOPPING))
+        self.assertEqual(3, len(group.processes))
+
+        # each process is removed on the next tick after it stops
+        events.notify(events.Tick5Event(0, supervisord))
+        self.assertEqual(['foo_0', 'foo_2'], sorted(group.processes))
+        foo_2 = group.processes['foo_2']
+        foo_2.pid = 0
+        foo_2.state = ProcessStates.STOPPED
+        events.notify(events.Tick5Event(5, supervisord))
+        self.assertEqual(['foo_0'], list(group.processes.keys()))
+        self.assertEqual([], interface._watchers)
+
+        # so the program can be scaled up again
+        result = interface.scaleProgram('group_name', 'foo', 3)
+        self.assertEqual(['foo_1', 'foo_2'], result['added'])
+
+    def test_scaleProgram_to_same_numprocs_changes_nothing(self):
+        supervisord = self.makeSupervisor()
+        interface = self.makeOne(supervisord)
+        interface.addGroup('group_name')
+        interface.addProgramToGroup('group_name', 'foo',
+                                    self.makeScalableOptions(numprocs='2'))
+        generation = interface._generation
+
+        self.assertEqual({'added': [], 'removed': []},
+                         interface.scaleProgram('group_name', 'foo', 2))
+        self.assertEqual(generation, interface._generation)
+
+    def test_scaleProgram_is_replayed_from_journal(self):
+        tempdir = tempfile.mkdtemp()
+        try:
+            journal = os.path.join(tempdir, 'journal')
+            supervisord = self.makeSupervisor()
+            interface = self.makeOne(supervisord, journal=journal)
+            interface.addGroup('group_name')
+            interface.addProgramToGroup('group_name', 'foo',
+                                        self.makeScalableOptions())
+            interface.scaleProgram('group_name', 'foo', 3)
+
+            supervisord = self.makeSupervisor()
+            interface = self.makeOne(supervisord, journal=journal)
+            group = supervisord.process_groups['group_name']
+            self.assertEqual(['foo_0', 'foo_1', 'foo_2'],
+                             sorted(group.processes.keys()))
+
+            # the compacted snapshot adds the program with its new numprocs
+            supervisord = self.makeSupervisor()
+            interface = self.makeOne(supervisord, journal=journal)
+            group = supervisord.process_groups['group_name']
+            self.assertEqual(3, len(group.processes))
+        finally:
+            shutil.rmtree(tempdir)
+
+    # API Method twiddler.addProgramTemplate()
+
+    def test_addProgramTemplate_can_be_disabled(self):
+        supervisord = DummySupervisor()
+        interface = self.makeOne(supervisord, whitelist='foo,bar')
+
+        self.assertRPCError(TwiddlerFaults.NOT_IN_WHITELIST,
+                            interface.addProgramTemplate, 'tmpl', {})
+
+    def test_addProgramTemplate_raises_incorrect_params_when_poptions_is_invalid(self):
+        supervisord = DummySupervisor()
+        supervisord.options = supervisor.options.ServerOptions()
+        interface = self.makeOne(supervisord)
+
+        for bad_poptions in [42, {}, {'command': '/bin/foo', 'numprocs': 2,
+                                      'process_name': 'foo_%(process_num)d'},
+                             {'command': '/bin/foo',
+                              'process_name': '%(nonexistant)s'}]:
+            self.assertRPCError(SupervisorFaults.INCORRECT_PARAMETERS,
+                                interface.addProgramTemplate,
+                                'tmpl', bad_poptions)
+        self.assertEqual([], interface.getProgramTemplateNames())
+
+    def test_addProgramTemplate_raises_incorrect_params_for_program_expansions(self):
+        supervisord = DummySupervisor()
+        supervisord.options = supervisor.options.ServerOptions()
+        interface = self.makeOne(supervisord)
+
+        for bad_poptions in [
+                {'command': '/bin/foo --name=%(program_name)s'},
+                {'command': '/bin/foo', 'directory': '/tmp/%(group_name)s'},
+                {'command': '/bin/foo',
+                 'environment': 'NUM=%(process_num)d'},
+                {'command': '/bin/foo',
+                 'environment': {'NAME': '%(program_name)s'}}]:
+            self.assertRPCError(SupervisorFaults.INCORRECT_PARAMETERS,
+                                interface.addProgramTemplate,
+                                'tmpl', bad_poptions)
+        self.assertEqual([], interface.getProgramTemplateNames())
+
+        poptions = {'command': '/bin/foo --here=%(here)s',
+                    'process_name': 'foo_%(program_name)s_%(process_num)d'}
+        self.assertTrue(interface.addProgramTemplate('tmpl', poptions))
+
+    def test_addProgramTemplate_raises_bad_name_when_template_exists(self):
+        supervisord = DummySupervisor()
+        supervisord.options = supervisor.options.ServerOptions()
+        interface = self.makeOne(supervisord)
+
+        poptions = {'command': '/usr/bin/find /'}
+        self.assertTrue(interface.addProgramTemplate('tmpl', poptions))
+        self.assertEqual('addProgramTemplate', interface.update_text)
+        self.assertRPCError(SupervisorFaults.BAD_NAME,
+                            interface.addProgramTemplate, 'tmpl', poptions)
+
+    # API Method twiddler.removeProgramTemplate()
+
+    def test_removeProgramTemplate_can_be_disabled(self):
+        supervisord = DummySupervisor()
+        interface = self.makeOne(supervisord, whitelist='foo,bar')
+
+        self.assertRPCError(TwiddlerFaults.NOT_IN_WHITELIST,
+                            interface.removeProgramTemplate, 'tmpl')
+
+    def test_removeProgramTemplate_raises_bad_name_when_template_doesnt_exist(self):
+        supervisord = DummySupervisor()
+        interface = self.makeOne(supervisord)
+
+        self.assertRPCError(SupervisorFaults.BAD_NAME,
+                            interface.removeProgramTemplate, 'tmpl')
+
+    def test_removeProgramTemplate_removes_template(self):
+        supervisord = DummySupervisor()
+        supervisord.options = supervisor.options.ServerOptions()
+        interface = self.makeOne(supervisord)
+
+        interface.addProgramTemplate('tmpl', {'command': '/usr/bin/find /'})
+        self.assertEqual(['tmpl'], interface.getProgramTemplateNames())
+        self.assertTrue(interface.removeProgramTemplate('tmpl'))
+        self.assertEqual('removeProgramTemplate', interface.update_text)
+        self.assertEqual([], interface.getProgramTemplateNames())
+
+    # API Method twiddler.getProgramTemplateNames()
+
+    def test_getProgramTemplateNames_can_be_disabled(self):
+        supervisord = DummySupervisor()
+        interface = self.makeOne(supervisord, whitelist='foo,bar')
+
+        self.assertRPCError(TwiddlerFaults.NOT_IN_WHITELIST,
+                            interface.getProgramTemplateNames)
+
+    # API Method twiddler.addProgramFromTemplate()
+
+    def test_addProgramFromTemplate_can_be_disabled(self):
+        supervisord = DummySupervisor()
+        interface = self.makeOne(supervisord, whitelist='foo,bar')
+
+        self.assertRPCError(TwiddlerFaults.NOT_IN_WHITELIST,
+                            interface.addProgramFromTemplate,
+                            'grp', 'tmpl', 'prog')
+
+    def test_addProgramFromTemplate_raises_bad_name_when_template_doesnt_exist(self):
+        pgroup = self.makeEmptyGroup()
+        supervisord = DummySupervisor(process_groups = {'group_name': pgroup})
+        interface = self.makeOne(supervisord)
+
+        self.assertRPCError(SupervisorFaults.BAD_NAME,
+                            interface.addProgramFromTemplate,
+                            'group_name', 'nonexistant_template', 'prog')
+
+    def test_addProgramFromTemplate_raises_incorrect_params_when_overrides_are_bad(self):
+        pgroup = self.makeEmptyGroup()
+        supervisord = DummySupervisor(process_groups = {'group_name': pgroup})
+        supervisord.options = supervisor.options.ServerOptions()
+        interface = self.makeOne(supervisord)
+        interface.addProgramTemplate('tmpl', {'command': '/usr/bin/find /'})
+
+        for bad_overrides in [42, {'command': '/bin/ls'},
+                              {'environment': {'FOO': 42}}]:
+            self.assertRPCError(SupervisorFaults.INCORRECT_PARAMETERS,
+                                interface.addProgramFromTemplate,
+                                'group_name', 'tmpl', 'prog', bad_overrides)
+        self.assertEqual({}, pgroup.processes)
+
+    def test_addProgramFromTemplate_raises_bad_name_when_process_already_exists(self):
+        pgroup = self.makeEmptyGroup()
+        supervisord = DummySupervisor(process_groups = {'group_name': pgroup})
+        supervisord.options = supervisor.options.ServerOptions()
+        interface = self.makeOne(supervisord)
+        interface.addProgramTemplate('tmpl', {'command': '/usr/bin/find /'})
+
+        interface.addProgramFromTemplate('group_name', 'tmpl', 'prog')
+        self.assertRPCError(SupervisorFaults.BAD_NAME,
+                            interface.addProgramFromTemplate,
+                            'group_name', 'tmpl', 'prog')
+
+    def test_addProgramFromTemplate_raises_bad_name_when_program_already_added(self):
+        pgroup = self.makeEmptyGroup()
+        supervisord = DummySupervisor(process_groups = {'group_name': pgroup})
+        supervisord.options = supervisor.options.ServerOptions()
+        interface = self.makeOne(supervisord)
+        interface.addProgramTemplate('tmpl', {'command': '/usr/bin/find /'})
+
+        interface.addProgramToGroup('group_name', 'prog',
+            {'command': '/usr/bin/find /', 'process_name': 'prog_one'})
+        self.assertRPCError(SupervisorFaults.BAD_NAME,
+                            interface.addProgramFromTemplate,
+                            'group_name', 'tmpl', 'prog')
+        self.assertRPCError(SupervisorFaults.BAD_NAME,
+                            interface.addProgramsFromTemplate,
+                            'group_name', 'tmpl',
+                            [{'program_name': 'other'},
+                             {'program_name': 'other'}])
+        self.assertEqual(['prog_one'], sorted(pgroup.processes.keys()))
+
+    def test_addProgramFromTemplate_adds_process_without_parsing(self):
+        pgroup = self.makeEmptyGroup()
+        supervisord = DummySupervisor(process_groups = {'group_name': pgroup})
+        supervisord.options = supervisor.options.ServerOptions()
+        interface = self.makeOne(supervisord)
+
+        poptions = {'command': '/usr/bin/find /',
+                    'process_name': 'worker_%(program_name)s',
+                    'environment': 'FOO=1,BAR=2'}
+        interface.addProgramTemplate('tmpl', poptions)
+
+        def fail(*arg, **kw):
+            self.fail('options were parsed again')
+        interface._makeConfigParser = fail
+
+        overrides = {'environment': {'BAR': '3', 'BAZ': '4'}}
+        result = interface.addProgramFromTemplate('group_name', 'tmpl', 'one',
+                                                  overrides)
+        self.assertTrue(result)
+        self.assertEqual('addProgramFromTemplate', interface.update_text)
+        interface.addProgramFromTemplate('group_name', 'tmpl', 'two')
+
+        one = pgroup.processes['worker_one']
+        self.assertTrue(isinstance(one, supervisor.process.Subprocess))
+        self.assertEqual('/usr/bin/find /', one.config.command)
+        self.assertEqual({'FOO': '1', 'BAR': '3', 'BAZ': '4'},
+                         one.config.environment)
+
+        two = pgroup.processes['worker_two']
+        self.assertEqual({'FOO': '1', 'BAR': '2'}, two.config.environment)
+        self.assertEqual(['worker_one', 'worker_two'],
+            sorted([c.name for c in pgroup.config.process_configs]))
+
+        # template config is not changed
+        template_config = interface._templates['tmpl']['config']
+        self.assertEqual('worker_tmpl', template_config.name)
+        self.assertEqual({'FOO': '1', 'BAR': '2'}, template_config.environment)
+
+    def test_addProgramFromTemplate_program_can_be_removed(self):
+        pgroup = self.makeEmptyGroup()
+        supervisord = DummySupervisor(process_groups = {'group_name': pgroup})
+        supervisord.options = supervisor.options.ServerOptions()
+        interface = self.makeOne(supervisord)
+        interface.addProgramTemplate('tmpl', {'command': '/usr/bin/find /'})
+
+        interface.addProgramFromTemplate('group_name', 'tmpl', 'prog')
+        interface.removeProgramFromGroup('group_name', 'prog')
+        self.assertEqual({}, pgroup.processes)
+        self.assertEqual([], pgroup.config.process_configs)
+
+    # API Method twiddler.addProgramsFromTemplate()
+
+    def test_addProgramsFromTemplate_can_be_disabled(self):
+        supervisord = DummySupervisor()
+        interface = self.makeOne(supervisord, whitelist='foo,bar')
+
+        self.assertRPCError(TwiddlerFaults.NOT_IN_WHITELIST,
+                            interface.addProgramsFromTemplate,
+                            'grp', 'tmpl', [])
+
+    def test_addProgramsFromTemplate_adds_nothing_when_any_program_is_invalid(self):
+        pgroup = self.makeEmptyGroup()
+        supervisord = DummySupervisor(process_groups = {'group_name': pgroup})
+        supervisord.options = supervisor.options.ServerOptions()
+        interface = self.makeOne(supervisord)
+        interface.addProgramTemplate('tmpl', {'command': '/usr/bin/find /'})
+
+        for bad_programs in [42, [42], [{'program_name': 'one'},
+                                         {'program_name': 'bad name'}],
+                             [{'program_name': 'one'},
+                              {'program_name': 'one'}]]:
+            self.assertRaises(supervisor.xmlrpc.RPCError,
+                              interface.addProgramsFromTemplate,
+                              'group_name', 'tmpl', bad_programs)
+        self.assertEqual({}, pgroup.processes)
+        self.assertEqual([], pgroup.config.process_configs)
+
+    def test_addProgramsFromTemplate_adds_all_programs_and_returns_results(self):
+        pgroup = self.makeEmptyGroup()
+        supervisord = DummySupervisor(process_groups = {'group_name': pgroup})
+        supervisord.options = supervisor.options.ServerOptions()
+        interface = self.makeOne(supervisord)
+        interface.addProgramTemplate('tmpl', {'command': '/usr/bin/find /'})
+
+        programs = [{'program_name': 'one'},
+                    {'program_name': 'two',
+                     'overrides': {'environment': {'FOO': '1'}}}]
+        results = interface.addProgramsFromTemplate('group_name', 'tmpl',
+                                                    programs)
+        self.assertEqual('addProgramsFromTemplate', interface.update_text)
+        self.assertEqual([{'program_name': 'one', 'process_names': ['one']},
+                          {'program_name': 'two', 'process_names': ['two']}],
+                         results)
+        self.assertEqual({'FOO': '1'},
+                         pgroup.processes['two'].config.environment)
+
+    # API Method twiddler.getProcessInventory()
+
+    def test_getProcessInventory_can_be_disabled(self):
+        supervisord = DummySupervisor()
+        interface = self.makeOne(supervisord, whitelist='foo,bar')
+
+        self.assertRPCError(TwiddlerFaults.NOT_IN_WHITELIST,
+                            interface.getProcessInventory)
+
+    def test_getProcessInventory_raises_incorrect_params_when_args_are_bad(self):
+        supervisord = DummySupervisor()
+        interface = self.makeOne(supervisord)
+
+        for bad_args in [('*', '*', -1), ('*', '*', 0, 'bad'),
+                         ('*', '*', 0, 0, ['nonexistant_field'])]:
+            self.assertRPCError(SupervisorFaults.INCORRECT_PARAMETERS,
+                                interface.getProcessInventory, *bad_args)
+
+    def test_getProcessInventory_returns_all_fields_by_default(self):
+        pconfig = DummyPConfig(None, 'foo', '/bin/foo', priority=5)
+        process = DummyProcess(pconfig, ProcessStates.RUNNING)
+        process.pid = 42
+        gconfig = DummyPGroupConfig(None, pconfigs=[pconfig])
+        pgroup = DummyProcessGroup(gconfig)
+        pgroup.processes = {'foo': process}
+
+        supervisord = DummySupervisor(process_groups = {'group_name': pgroup})
+        interface = self.makeOne(supervisord)
+
+        inventory = interface.getProcessInventory()
+        self.assertEqual('getProcessInventory', interface.update_text)
+        self.assertEqual({'total': 1, 'processes': [
+            {'group': 'group_name', 'name': 'foo', 'program': '',
+             'state': ProcessStates.RUNNING, 'statename': 'RUNNING',
+             'pid': 42, 'spawnerr': '', 'command': '/bin/foo',
+             'priority': 5, 'autostart': True}]}, inventory)
+
+    def test_getProcessInventory_filters_pages_and_projects(self):
+        pgroups = {}
+        for group_name in ('tenant_a', 'tenant_b', 'other'):
+            pconfigs = []
+            processes = {}
+            for process_name in ('web_0', 'web_1', 'worker_0'):
+                pconfig = DummyPConfig(None, process_name, '/bin/foo')
+                pconfigs.append(pconfig)
+                processes[process_name] = DummyProcess(pconfig)
+            pgroup = DummyProcessGroup(DummyPGroupConfig(None, pconfigs=pconfigs))
+            pgroup.processes = processes
+            pgroups[group_name] = pgroup
+
+        supervisord = DummySupervisor(process_groups = pgroups)
+        interface = self.makeOne(supervisord)
+
+        inventory = interface.getProcessInventory('tenant_*', 'web_*', 1, 2,
+                                                  ['statename'])
+        self.assertEqual(4, inventory['total'])
+        self.assertEqual([
+            {'group': 'tenant_a', 'name': 'web_1', 'program': '',
+             'statename': 'RUNNING'},
+            {'group': 'tenant_b', 'name': 'web_0', 'program': '',
+             'statename': 'RUNNING'}], inventory['processes'])
+
+        inventory = interface.getProcessInventory('tenant_*', 'web_*', 3, 0,
+                                                  ['pid'])
+        self.assertEqual([{'group': 'tenant_b', 'name': 'web_1',
+                           'program': '', 'pid': 0}],
+                         inventory['processes'])
+
+    def test_getProcessInventory_includes_program_names(self):
+        pgroup = self.makeEmptyGroup()
+        supervisord = DummySupervisor(process_groups = {'group_name': pgroup})
+        supervisord.options = supervisor.options.ServerOptions()
+        interface = self.makeOne(supervisord)
+
+        poptions = {'command': '/usr/bin/find /',
+                    'process_name': 'find_%(process_num)d',
+                    'numprocs': 2}
+        interface.addProgramToGroup('group_name', 'find', poptions)
+
+        inventory = interface.getProcessInventory('*', '*', 0, 0, ['command'])
+        self.assertEqual([
+            {'group': 'group_name', 'name': 'find_0', 'program': 'find',
+             'command': '/usr/bin/find /'},
+            {'group': 'group_name', 'name': 'find_1', 'program': 'find',
+             'command': '/usr/bin/find /'}], inventory['processes'])
+
+    # API Method twiddler.getChangesSince()
+
+    def test_getChangesSince_can_be_disabled(self):
+        supervisord = DummySupervisor()
+        interface = self.makeOne(supervisord, whitelist='foo,bar')
+
+        self.assertRPCError(TwiddlerFaults.NOT_IN_WHITELIST,
+                            interface.getChangesSince, 0)
+
+    def test_getChangesSince_raises_incorrect_params_when_args_are_bad(self):
+        supervisord = DummySupervisor()
+        interface = self.makeOne(supervisord)
+
+        for bad_args in [('bad',), (-1,), (0, 42)]:
+            self.assertRPCError(SupervisorFaults.INCORRECT_PARAMETERS,
+                                interface.getChangesSince, *bad_args)
+
+    def test_getChangesSince_returns_no_changes_initially(self):
+        supervisord = DummySupervisor()
+        interface = self.makeOne(supervisord)
+
+        result = interface.getChangesSince(0)
+        self.assertEqual('getChangesSince', interface.update_text)
+        self.assertEqual(0, result['generation'])
+        self.assertFalse(result['resync'])
+        self.assertEqual([], result['changes'])
+        self.assertTrue(result['instance'])
+
+    def test_getChangesSince_returns_only_newer_changes(self):
+        supervisord = self.makeSupervisor()
+        interface = self.makeOne(supervisord)
+
+        interface.addGroup('group_name')
+        poptions = {'command': '/usr/bin/find /', 'autostart': 'false',
+                    'process_name': 'find_%(process_num)d', 'numprocs': 2}
+        interface.addProgramToGroup('group_name', 'find', poptions)
+        interface.replaceProgramInGroup('group_name', 'find', poptions)
+        interface.removeProcessFromGroup('group_name', 'find_1')
+        interface.log('hello')
+
+        result = interface.getChangesSince(0)
+        self.assertEqual(5, result['generation'])
+        self.assertFalse(result['resync'])
+        changes = result['changes']
+        changes[2]['changed'].sort()
+        self.assertEqual([
+            {'generation': 1, 'method': 'addGroup',
+             'added': ['group_name:*'], 'changed': [], 'removed': []},
+            {'generation': 2, 'method': 'addProgramToGroup',
+             'added': ['group_name:find_0', 'group_name:find_1'],
+             'changed': [], 'removed': []},
+            {'generation': 3, 'method': 'replaceProgramInGroup',
+             'added': [], 'removed': [],
+             'changed': ['group_name:find_0', 'group_name:find_1']},
+            {'generation': 4, 'method': 'removeProcessFromGroup',
+             'added': [], 'changed': [], 'removed': ['group_name:find_1']},
+            {'generation': 5, 'method': 'log',
+             'added': [], 'changed': [], 'removed': []},
+            ], changes)
+
+        result = interface.getChangesSince(4, result['instance'])
+        self.assertFalse(result['resync'])
+        self.assertEqual([5], [c['generation'] for c in result['changes']])
+
+        result = interface.getChangesSince(5)
+        self.assertFalse(result['resync'])
+        self.assertEqual([], result['changes'])
+
+    def test_getChangesSince_does_not_change_generation_on_error(self):
+        supervisord = self.makeSupervisor()
+        interface = self.makeOne(supervisord)
+
+        self.assertRPCError(SupervisorFaults.BAD_NAME,
+                            interface.removeGroup, 'nonexistant_group')
+        self.assertEqual(0, interface.getChangesSince(0)['generation'])
+
+    def test_getChangesSince_asks_for_resync_when_changes_were_discarded(self):
+        supervisord = DummySupervisor()
+        interface = self.makeOne(supervisord, changes_buffer_size='2')
+
+        for i in range(3):
+            interface.log('hello')
+
+        result = interface.getChangesSince(0)
+        self.assertEqual(3, result['generation'])
+        self.assertTrue(result['resync'])
+        self.assertEqual([], result['changes'])
+
+        result = interface.getChangesSince(1)
+        self.assertFalse(result['resync'])
+        self.assertEqual([2, 3], [c['generation'] for c in result['changes']])
+
+    def test_getChangesSince_asks_for_resync_when_supervisord_restarted(self):
+        supervisord = DummySupervisor()
+        interface = self.makeOne(supervisord)
+        interface.log('hello')
+
+        result = interface.getChangesSince(42)
+        self.assertTrue(result['resync'])
+
+        result = interface.getChangesSince(0, 'another_instance')
+        self.assertTrue(result['resync'])
+
+    # API Method twiddler.waitForProcessStates()
+
+    def test_waitForProcessStates_can_be_disabled(self):
+        supervisord = DummySupervisor()
+        interface = self.makeOne(supervisord, whitelist='foo,bar')
+
+        self.assertRPCError(TwiddlerFaults.NOT_IN_WHITELIST,
+                            interface.waitForProcessStates, [], ['RUNNING'])
+
+    def test_waitForProcessStates_raises_incorrect_params_when_args_are_bad(self):
+        supervisord = DummySupervisor()
+        interface = self.makeOne(supervisord)
+
+        for bad_args in [('foo', ['RUNNING']), ([], ['NONEXISTANT']),
+                         ([], 'RUNNING'), ([], ['RUNNING'], -1)]:
+            self.assertRPCError(SupervisorFaults.INCORRECT_PARAMETERS,
+                                interface.waitForProcessStates, *bad_args)
+
+    def test_waitForProcessStates_raises_bad_name_when_process_doesnt_exist(self):
+        pgroup = self.makeEmptyGroup()
+        supervisord = DummySupervisor(process_groups = {'group_name': pgroup})
+        interface = self.makeOne(supervisord)
+
+        for bad_name in ['nonexistant_group:foo', 'group_name:nonexistant']:
+            self.assertRPCError(SupervisorFaults.BAD_NAME,
+                                interface.waitForProcessStates,
+                                [bad_name], ['RUNNING'])
+
+    def test_waitForProcessStates_returns_immediately_when_states_reached(self):
+        pconfig = DummyPConfig(None, 'foo', '/bin/foo')
+        pgroup = DummyProcessGroup(DummyPGroupConfig(None, pconfigs=[pconfig]))
+        pgroup.processes = {'foo': DummyProcess(pconfig, ProcessStates.RUNNING)}
+        supervisord = DummySupervisor(process_groups = {'group_name': pgroup})
+        interface = self.makeOne(supervisord)
+
+        result = interface.waitForProcessStates(['group_name:foo'],
+                                                ['RUNNING'])
+        self.assertEqual('waitForProcessStates', interface.update_text)
+        self.assertEqual([{'name': 'group_name:foo',
+                           'state': ProcessStates.RUNNING,
+                           'statename': 'RUNNING',
+                           'reached': True}], result)
+
+    def test_waitForProcessStates_waits_until_all_states_reached(self):
+        pconfigs = [DummyPConfig(None, 'foo', '/bin/foo'),
+                    DummyPConfig(None, 'bar', '/bin/bar')]
+        pgroup = DummyProcessGroup(DummyPGroupConfig(None, pconfigs=pconfigs))
+        pgroup.processes = {
+            'foo': DummyProcess(pconfigs[0], ProcessStates.STARTING),
+            'bar': DummyProcess(pconfigs[1], ProcessStates.STARTING)}
+        supervisord = DummySupervisor(process_groups = {'group_name': pgroup})
+        interface = self.makeOne(supervisord)
+
+        callback = interface.waitForProcessStates(['group_name:*'],
+                                                  ['RUNNING', 'FATAL'])
+        from supervisor.http import NOT_DONE_YET
+        self.assertEqual(NOT_DONE_YET, callback())
+
+        pgroup.processes['foo'].state = ProcessStates.RUNNING
+        self.assertEqual(NOT_DONE_YET, callback())
+
+        # foo was seen running, so it stays reached after it exits
+        pgroup.processes['foo'].state = ProcessStates.EXITED
+        pgroup.processes['bar'].state = ProcessStates.FATAL
+        result = callback()
+        self.assertEqual(['group_name:bar', 'group_name:foo'],
+                         [r['name'] for r in result])
+        self.assertEqual([True, True], [r['reached'] for r in result])
+        self.assertEqual(['FATAL', 'EXITED'],
+                         [r['statename'] for r in result])
+
+    def test_waitForProcessStates_returns_when_timeout_passes(self):
+        pconfig = DummyPConfig(None, 'foo', '/bin/foo')
+        pgroup = DummyProcessGroup(DummyPGroupConfig(None, pconfigs=[pconfig]))
+        pgroup.processes = {'foo': DummyProcess(pconfig, ProcessStates.STARTING)}
+        supervisord = DummySupervisor(process_groups = {'group_name': pgroup})
+        interface = self.makeOne(supervisord)
+
+        result = interface.waitForProcessStates(['group_name:foo'],
+                                                ['RUNNING'], 0)
+        self.assertEqual([{'name': 'group_name:foo',
+                           'state': ProcessStates.STARTING,
+                           'statename': 'STARTING',
+                           'reached': False}], result)
+
+    # API Method twiddler.getMemoryReport()
+
+    def test_getMemoryReport_can_be_disabled(self):
+        supervisord = DummySupervisor()
+        interface = self.makeOne(supervisord, whitelist='foo,bar')
+
+        self.assertRPCError(TwiddlerFaults.NOT_IN_WHITELIST,
+                            interface.getMemoryReport)
+
+    def test_getMemoryReport_reports_shared_values(self):
+        pgroup = self.makeEmptyGroup()
+        supervisord = DummySupervisor(process_groups = {'group_name': pgroup})
+        supervisord.options = supervisor.options.ServerOptions()
+        interface = self.makeOne(supervisord)
+
+        environment = 'KEY="%s",PATH="/bin"' % ('x' * 10000)
+        for name in ('foo', 'bar'):
+            poptions = {'command': '/usr/bin/find /',
+                        'environment': environment,
+                        'autostart': 'false'}
+            interface.addProgramToGroup('group_name', name, poptions)
+
+        report = interface.getMemoryReport()
+        self.assertEqual(2, report['programs'])
+        self.assertEqual(0, report['templates'])
+        self.assertEqual(2, report['process_configs'])
+        self.assertTrue(report['shared_references'] > report['shared_values'])
+        self.assertTrue(report['shared_saved_kb'] >= 1)
+        self.assertTrue(report['peak_rss_kb'] > 0)
+
+    def test_getMemoryReport_forgets_groups_removed_without_twiddler(self):
+        supervisord = self.makeSupervisor()
+        interface = self.makeOne(supervisord)
+        interface.addGroups([{'group_name': 'foo'}, {'group_name': 'bar'}])
+        for group_name in ('foo', 'bar'):
+            interface.addProgramToGroup(group_name, 'cat',
+                {'command': '/bin/cat', 'autostart': 'false'})
+
+        # as supervisorctl remove or update would
+        supervisord.remove_process_group('foo')
+
+        report = interface.getMemoryReport()
+        self.assertEqual(1, report['programs'])
+        self.assertEqual(1, report['process_configs'])
+        self.assertEqual(['bar'], list(interface._programs.keys()))
+        calls = interface._makeSnapshot()
+        self.assertEqual([('addGroups', [[{'group_name': 'bar',
+                                           'priority': 999}]]),
+                          ('addProgramsToGroup', ['bar', [
+                              {'program_name': 'cat',
+                               'program_options': {'command': '/bin/cat',
+                                                   'autostart': 'false'}}]])],
+                         calls)
+
+    def test_addProgramToGroup_shares_equal_option_values(self):
+        pgroup = self.makeEmptyGroup()
+        supervisord = DummySupervisor(process_groups = {'group_name': pgroup})
+        supervisord.options = supervisor.options.ServerOptions()
+        interface = self.makeOne(supervisord)
+
+        poptions = {'command': '/usr/bin/find /',
+                    'environment': 'KEY="value"',
+                    'autostart': 'false'}
+        interface.addProgramToGroup('group_name', 'foo', poptions)
+        interface.addProgramToGroup('group_name', 'bar', poptions)
+
+        foo = pgroup.processes['foo'].config
+        bar = pgroup.processes['bar'].config
+        self.assertTrue(foo.environment is bar.environment)
+        self.assertTrue(foo.command is bar.command)
+
+    def test_removeProgramFromGroup_releases_shared_values(self):
+        pgroup = self.makeEmptyGroup()
+        supervisord = DummySupervisor(process_groups = {'group_name': pgroup})
+        supervisord.options = supervisor.options.ServerOptions()
+        interface = self.makeOne(supervisord)
+
+        poptions = {'command': '/usr/bin/find /', 'autostart': 'false'}
+        interface.addProgramToGroup('group_name', 'foo', poptions)
+        pgroup.processes['foo'].state = ProcessStates.STOPPED
+        interface.removeProgramFromGroup('group_name', 'foo')
+
+        report = interface.getMemoryReport()
+        self.assertEqual(0, report['process_configs'])
+        self.assertEqual(0, report['shared_values'])
+
+    # API Method twiddler.getStats()
+
+    def tearDownStats(self):
+        from supervisor_twiddler import resulthandler
+        resulthandler.timings.enabled = False
+        resulthandler.timings.entries.clear()
+
+    def test_getStats_can_be_disabled(self):
+        supervisord = DummySupervisor()
+        interface = self.makeOne(supervisord, whitelist='foo,bar')
+
+        self.assertRPCError(TwiddlerFaults.NOT_IN_WHITELIST,
+                            interface.getStats)
+
+    def test_getStats_returns_nothing_when_stats_are_off(self):
+        supervisord = DummySupervisor()
+        interface = self.makeOne(supervisord)
+        interface.getAPIVersion()
+
+        stats = interface.getStats()
+        self.assertEqual(False, stats['enabled'])
+        self.assertEqual({}, stats['methods'])
+        self.assertEqual('', interface.getPrometheusStats())
+
+    def test_getStats_reports_and_prunes_stdin_byte_counters(self):
+        from supervisor_twiddler import resulthandler
+        from supervisor.tests.base import DummyEvent
+        pgroup = self.makeEmptyGroup()
+        supervisord = DummySupervisor(process_groups = {'group_name': pgroup})
+        supervisord.options = supervisor.options.ServerOptions()
+        interface = self.makeOne(supervisord)
+        interface.addProgramToGroup('group_name', 'stdin_foo',
+            {'command': '/bin/cat', 'autostart': 'false'})
+        interface.addProgramToGroup('group_name', 'stdin_bar',
+            {'command': '/bin/cat', 'autostart': 'false'})
+
+        handler = resulthandler.make_stdin_write_handler()
+        try:
+            for name in ('stdin_foo', 'stdin_bar', 'stdin_gone'):
+                process = DummyProcess(DummyPConfig(None, name, '/bin/cat'))
+                process.pid = 0
+                event = DummyEvent()
+                event.process = process
+                handler(event, 'STDIN:foo')
+
+            stats = interface.getStats()['stdin_bytes']
+            self.assertEqual(['stdin_bar', 'stdin_foo'], sorted(stats))
+            self.assertEqual(3, stats['stdin_foo']['dropped_bytes'])
+            self.assertFalse('stdin_gone' in handler.stats)
+            self.assertTrue('twiddler_stdin_bytes_total{process="stdin_foo",'
+                            'result="dropped"} 3' in
+                            interface.getPrometheusStats())
+
+            pgroup.processes['stdin_foo'].state = ProcessStates.STOPPED
+            interface.removeProgramFromGroup('group_name', 'stdin_foo')
+            self.assertEqual(['stdin_bar'], list(handler.stats.keys()))
+        finally:
+            resulthandler.forget_byte_stats(list(handler.stats.keys()))
+
+    def test_getStats_counts_calls_and_faults_when_stats_are_on(self):
+        supervisord = self.makeSupervisor()
+        interface = self.makeOne(supervisord, stats='true')
+        try:
+            interface.getAPIVersion()
+            interface.getAPIVersion()
+            self.assertRPCError(SupervisorFaults.BAD_NAME,
+                                interface.removeGroup, 'nonexistent')
+            stats = interface.getStats()
+        finally:
+            self.tearDownStats()
+
+        self.assertEqual(True, stats['enabled'])
+        self.assertEqual(2, stats['methods']['getAPIVersion']['calls'])
+        self.assertEqual(0, stats['methods']['getAPIVersion']['errors'])
+        removes = stats['methods']['removeGroup']
+        self.assertEqual(1, removes['errors'])
+        self.assertEqual({str(SupervisorFaults.BAD_NAME): 1}, removes['faults'])
+        self.assertEqual(len(stats['bucket_bounds_ms']) + 1,
+                         len(removes['histogram']))
+
+    def test_getStats_includes_stdin_handler_results_when_stats_are_on(self):
+        from supervisor.tests.base import DummyEvent
+        from supervisor_twiddler import resulthandler
+        supervisord = self.makeSupervisor()
+        interface = self.makeOne(supervisord, stats='true')
+        try:
+            resulthandler.stdin_write_handler(DummyEvent(), b'OK')
+            stats = interface.getStats()
+            text = interface.getPrometheusStats()
+        finally:
+            self.tearDownStats()
+
+        self.assertEqual(1, stats['handler_results']['OK']['calls'])
+        self.assertTrue(
+            'twiddler_handler_result_calls_total{result="OK"} 1' in text)
+        self.assertTrue(
+            'twiddler_method_calls_total{method="getStats"} 1' in text)
+
+    def test_stats_keep_method_docs_for_introspection(self):
+        supervisord = self.makeSupervisor()
+        interface = self.makeOne(supervisord, stats='true')
+        self.tearDownStats()
+        self.assertEqual(self.getTargetClass().addGroup.__doc__,
+                         interface.addGroup.__doc__)
+
+    # API Method twiddler.log()
+
+    def test_log_can_be_disabled(self):
+        supervisord = DummySupervisor()
+        interface = self.makeOne(supervisord, whitelist='foo,bar')
+
+        self.assertRPCError(TwiddlerFaults.NOT_IN_WHITELIST,
+                            interface.log, 'message')
+
+    def test_log_write_message_when_level_is_string(self):
+        supervisord = DummySupervisor()
+        interface = self.makeOne(supervisord)
+
+        result = interface.log('hello', 'info')
+        self.assertTrue(result)
+        result = interface.log('there', 'INFO')
+        self.assertTrue(result)
+        self.assertEqual('log', interface.update_text)
+
+        logger = supervisord.options.logger
+        self.assertEqual(['hello', 'there'], logger.data)
+
+    def test_log_write_message_when_level_is_integer(self):
+        supervisord = DummySupervisor()
+        interface = self.makeOne(supervisord)
+
+        from supervisor.loggers import LevelsByName
+        result = interface.log('hello', LevelsByName.INFO)
+        self.assertTrue(result)
+
+        logger = supervisord.options.logger
+        self.assertEqual(['hello'], logger.data)
+
+    def test_log_raises_incorrect_parameters_when_level_is_bad(self):
+        supervisord = DummySupervisor()
+        interface = self.makeOne(supervisord)
+
+        for bad_level in ['bad_level', 9999, None]:
+            self.assertRPCError(SupervisorFaults.INCORRECT_PARAMETERS,
+                                interface.log, 'hello', bad_level)
+
+    # Helpers Methods
+
+    def getTargetClass(self):
+        from supervisor_twiddler.rpcinterface import TwiddlerNamespaceRPCInterface
+        return TwiddlerNamespaceRPCInterface
+
+    def makeOne(self, *arg, **kw):
+        return self.getTargetClass()(*arg, **kw)
+
+    def makeSupervisor(self):
+        from supervisor.supervisord import Supervisor
+        options = supervisor.options.ServerOptions()
+        options.logger = DummyLogger()
+        return Supervisor(options)
+
+    def makeScalableOptions(self, **options):
+        scalable = {'command': '/bin/cat %(process_num)s',
+                    'process_name': '%(program_name)s_%(process_num)s',
+                    'autostart': 'false'}
+        scalable.update(options)
+        return scalable
+
+    def makeWithChildLogDir(self, **config):
+        tempdir = tempfile.mkdtemp()
+        supervisord = self.makeSupervisor()
+        supervisord.options.childlogdir = tempdir
+        supervisord.options.identifier = 'test'
+        interface = self.makeOne(supervisord, **config)
+        interface.addGroup('group_name')
+        return supervisord, interface, tempdir
+
+    def makeEmptyGroup(self):
+        gconfig = DummyPGroupConfig(None, pconfigs=[])
+        pgroup = DummyProcessGroup(gconfig)
+        pgroup.processes = {}
+        return pgroup
 
     def attrDictWithoutUnders(self, obj):
         """ Returns the __dict__ for an object with __unders__ removed """
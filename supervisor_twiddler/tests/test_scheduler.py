@@ -0,0 +1,250 @@
+import sys
+import unittest
+
+from supervisor import events
+from supervisor.states import ProcessStates
+from supervisor.tests.base import DummyOptions, DummyPConfig, DummyProcess
+from supervisor.tests.base import DummyPGroupConfig, DummyProcessGroup
+from supervisor.tests.base import DummySupervisor
+
+class TestTokenBucket(unittest.TestCase):
+    def test_take_allows_burst_then_refuses(self):
+        clock = DummyClock()
+        bucket = self.makeOne(2, clock=clock)
+        self.assertTrue(bucket.take())
+        self.assertTrue(bucket.take())
+        self.assertFalse(bucket.take())
+
+    def test_take_refills_at_rate(self):
+        clock = DummyClock()
+        bucket = self.makeOne(2, clock=clock)
+        bucket.take()
+        bucket.take()
+        clock.now += 0.5
+        self.assertTrue(bucket.take())
+        self.assertFalse(bucket.take())
+
+    def test_take_never_refills_beyond_burst(self):
+        clock = DummyClock()
+        bucket = self.makeOne(1, burst=3, clock=clock)
+        clock.now += 100
+        for i in range(3):
+            self.assertTrue(bucket.take())
+        self.assertFalse(bucket.take())
+
+    def test_take_allows_fractional_rates(self):
+        clock = DummyClock()
+        bucket = self.makeOne(0.5, clock=clock)
+        self.assertTrue(bucket.take())
+        clock.now += 1
+        self.assertFalse(bucket.take())
+        clock.now += 1
+        self.assertTrue(bucket.take())
+
+    def test_take_survives_clock_rollback(self):
+        clock = DummyClock()
+        bucket = self.makeOne(1, clock=clock)
+        bucket.take()
+        clock.now -= 100
+        self.assertFalse(bucket.take())
+        clock.now += 1
+        self.assertTrue(bucket.take())
+
+    def makeOne(self, *arg, **kw):
+        from supervisor_twiddler.scheduler import TokenBucket
+        return TokenBucket(*arg, **kw)
+
+class TestSpawnScheduler(unittest.TestCase):
+    def tearDown(self):
+        events.clear()
+
+    def test_add_ignores_processes_without_autostart(self):
+        supervisord, group = self.makeSupervisor('foo')
+        group.processes['foo'].config.autostart = False
+        scheduler = self.makeOne(supervisord, concurrency=1)
+        scheduler.add('group', [group.processes['foo']])
+        self.assertEqual({'pending': 0, 'starting': 0}, scheduler.status())
+        self.assertEqual([], events.callbacks)
+
+    def test_add_releases_up_to_concurrency(self):
+        supervisord, group = self.makeSupervisor('a', 'b', 'c')
+        scheduler = self.makeOne(supervisord, concurrency=2)
+        scheduler.add('group', self.processes(group, 'a', 'b', 'c'))
+        self.assertEqual(self.autostarts(group, 'a', 'b', 'c'),
+                         [True, True, False])
+        self.assertEqual({'pending': 1, 'starting': 2}, scheduler.status())
+
+    def test_pump_releases_more_when_processes_finish_starting(self):
+        supervisord, group = self.makeSupervisor('a', 'b', 'c')
+        scheduler = self.makeOne(supervisord, concurrency=1)
+        scheduler.add('group', self.processes(group, 'a', 'b', 'c'))
+
+        group.processes['a'].state = ProcessStates.STARTING
+        group.processes['a'].laststart = 1
+        scheduler.pump()
+        self.assertEqual(self.autostarts(group, 'a', 'b', 'c'),
+                         [True, False, False])
+
+        group.processes['a'].state = ProcessStates.RUNNING
+        scheduler.pump()
+        self.assertEqual(self.autostarts(group, 'a', 'b', 'c'),
+                         [True, True, False])
+
+    def test_pump_is_called_by_process_state_events(self):
+        supervisord, group = self.makeSupervisor('a', 'b')
+        scheduler = self.makeOne(supervisord, concurrency=1)
+        scheduler.add('group', self.processes(group, 'a', 'b'))
+
+        group.processes['a'].state = ProcessStates.RUNNING
+        group.processes['a'].laststart = 1
+        event = events.ProcessStateRunningEvent(group.processes['a'],
+                                                ProcessStates.STARTING)
+        events.notify(event)
+        self.assertEqual(self.autostarts(group, 'a', 'b'), [True, True])
+
+    def test_pump_limits_processes_starting_in_each_group(self):
+        supervisord, group = self.makeSupervisor('a', 'b')
+        other = self.makeGroup('other', 'c')
+        supervisord.process_groups['other'] = other
+        scheduler = self.makeOne(supervisord, group_concurrency=1)
+        scheduler.add('group', self.processes(group, 'a', 'b'))
+        scheduler.add('other', self.processes(other, 'c'))
+        self.assertEqual(self.autostarts(group, 'a', 'b'), [True, False])
+        self.assertEqual(self.autostarts(other, 'c'), [True])
+
+    def test_pump_limits_rate(self):
+        clock = DummyClock()
+        supervisord, group = self.makeSupervisor('a', 'b', 'c')
+        scheduler = self.makeOne(supervisord, rate=1, clock=clock)
+        scheduler.add('group', self.processes(group, 'a', 'b', 'c'))
+        self.assertEqual(self.autostarts(group, 'a', 'b', 'c'),
+                         [True, False, False])
+        clock.now += 1
+        scheduler.pump()
+        self.assertEqual(self.autostarts(group, 'a', 'b', 'c'),
+                         [True, True, False])
+
+    def test_pump_forgets_processes_that_were_removed(self):
+        supervisord, group = self.makeSupervisor('a', 'b', 'c')
+        scheduler = self.makeOne(supervisord, concurrency=1)
+        scheduler.add('group', self.processes(group, 'a', 'b', 'c'))
+        del group.processes['a']
+        del group.processes['b']
+        scheduler.pump()
+        self.assertEqual(self.autostarts(group, 'c'), [True])
+        self.assertEqual({'pending': 0, 'starting': 1}, scheduler.status())
+
+    def test_add_subscribes_only_once(self):
+        supervisord, group = self.makeSupervisor('a', 'b')
+        scheduler = self.makeOne(supervisord, concurrency=1)
+        scheduler.add('group', self.processes(group, 'a'))
+        scheduler.add('group', self.processes(group, 'b'))
+        self.assertEqual(2, len(events.callbacks))
+
+    def test_replace_keeps_queued_process_queued(self):
+        supervisord, group = self.makeSupervisor('a', 'b')
+        scheduler = self.makeOne(supervisord, concurrency=1)
+        scheduler.add('group', self.processes(group, 'a', 'b'))
+
+        process = group.processes['b']
+        new_config = DummyPConfig(DummyOptions(), 'b', '/bin/b2',
+                                  autostart=True)
+        scheduler.replace('group', process, new_config)
+        process.config = new_config
+        scheduler.pump()
+        self.assertFalse(new_config.autostart)
+        self.assertTrue(scheduler.autostart(process))
+        self.assertEqual({'pending': 1, 'starting': 1}, scheduler.status())
+
+        group.processes['a'].state = ProcessStates.RUNNING
+        group.processes['a'].laststart = 1
+        scheduler.pump()
+        self.assertTrue(new_config.autostart)
+        self.assertEqual({'pending': 0, 'starting': 1}, scheduler.status())
+
+    def test_replace_queues_released_process_again(self):
+        supervisord, group = self.makeSupervisor('a', 'b')
+        scheduler = self.makeOne(supervisord, concurrency=1)
+        scheduler.add('group', self.processes(group, 'a', 'b'))
+
+        process = group.processes['a'] # released, not yet spawned
+        new_config = DummyPConfig(DummyOptions(), 'a', '/bin/a2',
+                                  autostart=True)
+        scheduler.replace('group', process, new_config)
+        process.config = new_config
+        scheduler.pump()
+        self.assertEqual(self.autostarts(group, 'a', 'b'), [False, True])
+        self.assertTrue(scheduler.autostart(process))
+        self.assertEqual({'pending': 1, 'starting': 1}, scheduler.status())
+
+    def test_replace_without_autostart_dequeues_process(self):
+        supervisord, group = self.makeSupervisor('a', 'b', 'c')
+        scheduler = self.makeOne(supervisord, concurrency=1)
+        scheduler.add('group', self.processes(group, 'a', 'b', 'c'))
+
+        process = group.processes['b']
+        new_config = DummyPConfig(DummyOptions(), 'b', '/bin/b',
+                                  autostart=False)
+        scheduler.replace('group', process, new_config)
+        process.config = new_config
+        self.assertFalse(scheduler.autostart(process))
+
+        group.processes['a'].state = ProcessStates.RUNNING
+        group.processes['a'].laststart = 1
+        scheduler.pump()
+        self.assertEqual(self.autostarts(group, 'b', 'c'), [False, True])
+        self.assertEqual({'pending': 0, 'starting': 1}, scheduler.status())
+
+    def test_replace_does_not_queue_process_that_was_started(self):
+        supervisord, group = self.makeSupervisor('a')
+        group.processes['a'].config.autostart = False
+        group.processes['a'].laststart = 1
+        scheduler = self.makeOne(supervisord, concurrency=1)
+
+        process = group.processes['a']
+        new_config = DummyPConfig(DummyOptions(), 'a', '/bin/a',
+                                  autostart=True)
+        scheduler.replace('group', process, new_config)
+        self.assertTrue(new_config.autostart)
+        self.assertEqual({'pending': 0, 'starting': 0}, scheduler.status())
+
+    def makeOne(self, *arg, **kw):
+        from supervisor_twiddler.scheduler import SpawnScheduler
+        return SpawnScheduler(*arg, **kw)
+
+    def makeGroup(self, group_name, *process_names):
+        options = DummyOptions()
+        gconfig = DummyPGroupConfig(options, group_name)
+        group = DummyProcessGroup(gconfig)
+        group.processes = {}
+        for name in process_names:
+            pconfig = DummyPConfig(options, name, '/bin/' + name,
+                                   autostart=True)
+            process = DummyProcess(pconfig, ProcessStates.STOPPED)
+            process.laststart = 0
+            group.processes[name] = process
+        return group
+
+    def makeSupervisor(self, *process_names):
+        group = self.makeGroup('group', *process_names)
+        supervisord = DummySupervisor(process_groups={'group': group})
+        return supervisord, group
+
+    def processes(self, group, *names):
+        return [group.processes[n] for n in names]
+
+    def autostarts(self, group, *names):
+        return [group.processes[n].config.autostart for n in names]
+
+class DummyClock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+def test_suite():
+    return unittest.findTestCases(sys.modules[__name__])
+
+if __name__ == '__main__':
+    unittest.main(defaultTest='test_suite')
@@ -0,0 +1,136 @@
+import sys
+import unittest
+
+class TestSharedValues(unittest.TestCase):
+    def test_share_replaces_equal_values_with_pooled_values(self):
+        pool = self.makeOne()
+        first = DummyConfig(''.join(['/bin/', 'cat']),
+                            {'PATH': '/bin', 'KEY': 'x' * 100})
+        second = DummyConfig(''.join(['/bin/', 'cat']),
+                             {'KEY': 'x' * 100, 'PATH': '/bin'})
+        self.assertFalse(second.command is first.command)
+        pool.share(first)
+        pool.share(second)
+        self.assertTrue(second.environment is first.environment)
+        self.assertTrue(second.command is first.command)
+
+    def test_share_does_not_replace_different_values(self):
+        pool = self.makeOne()
+        first = DummyConfig('/bin/cat', {'PATH': '/bin'})
+        second = DummyConfig('/bin/cat', {'PATH': '/usr/bin'})
+        pool.share(first)
+        pool.share(second)
+        self.assertEqual({'PATH': '/usr/bin'}, second.environment)
+
+    def test_share_ignores_values_that_can_not_be_shared(self):
+        pool = self.makeOne()
+        config = DummyConfig(None, None)
+        config.directory = 42
+        pool.share(config)
+        self.assertEqual(0, pool.report()['values'])
+
+    def test_share_counts_a_config_only_once(self):
+        pool = self.makeOne()
+        config = DummyConfig('/bin/cat', {'PATH': '/bin'})
+        pool.share(config)
+        pool.share(config)
+        self.assertEqual(4, pool.report()['references'])
+
+    def test_release_drops_values_no_longer_used(self):
+        pool = self.makeOne()
+        first = DummyConfig('/bin/cat', {'PATH': '/bin'})
+        second = DummyConfig('/bin/cat', {'PATH': '/bin'})
+        pool.share(first)
+        pool.share(second)
+        pool.release(first)
+        self.assertEqual(4, pool.report()['values']) # command, env, PATH, /bin
+        pool.release(second)
+        self.assertEqual(0, pool.report()['values'])
+        self.assertEqual(0, pool.report()['configs'])
+
+    def test_release_ignores_unknown_configs(self):
+        pool = self.makeOne()
+        pool.release(DummyConfig('/bin/cat', {}))
+        self.assertEqual(0, pool.report()['configs'])
+
+    def test_prune_releases_configs_not_given(self):
+        pool = self.makeOne()
+        kept = DummyConfig('/bin/cat', {'PATH': '/bin'})
+        stale = DummyConfig('/bin/ls', {'PATH': '/bin'})
+        pool.share(kept)
+        pool.share(stale)
+        self.assertEqual(1, pool.prune([kept]))
+        self.assertTrue(kept in pool)
+        self.assertFalse(stale in pool)
+        self.assertEqual(1, pool.report()['configs'])
+        self.assertEqual(4, pool.report()['values'])
+
+    def test_report_estimates_bytes_saved(self):
+        pool = self.makeOne()
+        environment = {'KEY': 'x' * 10000}
+        for i in range(3):
+            pool.share(DummyConfig('/bin/cat', dict(environment)))
+        report = pool.report()
+        self.assertEqual(3, report['configs'])
+        self.assertEqual(4, report['values'])
+        self.assertEqual(8, report['references'])
+        self.assertTrue(report['saved_bytes'] > 15000)
+
+    def test_report_subtracts_overhead_of_pool(self):
+        pool = self.makeOne()
+        pool.share(DummyConfig('/bin/cat', {'PATH': '/bin'}))
+        self.assertTrue(pool.report()['saved_bytes'] < 0)
+
+    def test_share_pools_strings_of_different_environments(self):
+        pool = self.makeOne()
+        first = DummyConfig('/bin/cat', {'KEY': ''.join(['x'] * 100),
+                                         'NUM': '1'})
+        second = DummyConfig('/bin/cat', {'KEY': ''.join(['x'] * 100),
+                                          'NUM': '2'})
+        self.assertFalse(first.environment['KEY'] is
+                         second.environment['KEY'])
+        pool.share(first)
+        pool.share(second)
+        self.assertFalse(first.environment is second.environment)
+        self.assertTrue(first.environment['KEY'] is
+                        second.environment['KEY'])
+        self.assertEqual({'KEY': 'x' * 100, 'NUM': '2'}, second.environment)
+
+        pool.release(first)
+        pool.release(second)
+        self.assertEqual(0, pool.report()['values'])
+
+    def test_share_finds_equal_dicts_with_colliding_hashes(self):
+        from supervisor_twiddler import sharing
+        pool = self.makeOne()
+        first = DummyConfig('/bin/cat', {'A': '1'})
+        second = DummyConfig('/bin/cat', {'B': '2'})
+        third = DummyConfig('/bin/cat', {'B': '2'})
+        original = sharing._hash_dict
+        sharing._hash_dict = lambda value: (len(value), 0)
+        try:
+            pool.share(first)
+            pool.share(second)
+            pool.share(third)
+            self.assertEqual({'A': '1'}, first.environment)
+            self.assertTrue(second.environment is third.environment)
+            for config in (first, second, third):
+                pool.release(config)
+        finally:
+            sharing._hash_dict = original
+        self.assertEqual(0, pool.report()['values'])
+
+    def makeOne(self):
+        from supervisor_twiddler.sharing import SharedValues
+        return SharedValues()
+
+class DummyConfig:
+    def __init__(self, command, environment):
+        self.command = command
+        self.environment = environment
+
+def test_suite():
+    return unittest.findTestCases(sys.modules[__name__])
+
+if __name__ == '__main__':
+    unittest.main(defaultTest='test_suite')
@@ -0,0 +1,94 @@
+import sys
+import unittest
+
+from supervisor.xmlrpc import RPCError
+
+class TestStats(unittest.TestCase):
+    def test_record_counts_calls_and_errors(self):
+        stats = self.makeOne()
+        stats.record('foo', 0.002)
+        stats.record('foo', 0.004, '10')
+        stats.record('foo', 0.001, '10')
+        report = stats.report()['foo']
+        self.assertEqual(3, report['calls'])
+        self.assertEqual(2, report['errors'])
+        self.assertEqual({'10': 2}, report['faults'])
+        self.assertAlmostEqual(7.0, report['total_ms'])
+        self.assertAlmostEqual(4.0, report['max_ms'])
+
+    def test_report_histogram_is_cumulative(self):
+        from supervisor_twiddler.stats import BUCKET_BOUNDS
+        stats = self.makeOne()
+        stats.record('foo', 0.00005)
+        stats.record('foo', 0.001)
+        stats.record('foo', 100)
+        histogram = stats.report()['foo']['histogram']
+        self.assertEqual(len(BUCKET_BOUNDS) + 1, len(histogram))
+        self.assertEqual(1, histogram[0])
+        self.assertEqual(2, histogram[2])
+        self.assertEqual(2, histogram[-2])
+        self.assertEqual(3, histogram[-1])
+
+    def test_wrap_records_successful_calls(self):
+        stats = self.makeOne()
+        def foo(a, b=2):
+            """ docs """
+            return a + b
+        wrapped = stats.wrap('foo', foo)
+        self.assertEqual(4, wrapped(1, b=3))
+        self.assertEqual(' docs ', wrapped.__doc__)
+        self.assertEqual(1, stats.report()['foo']['calls'])
+        self.assertEqual(0, stats.report()['foo']['errors'])
+
+    def test_wrap_records_rpc_errors_by_fault_code(self):
+        stats = self.makeOne()
+        def foo():
+            raise RPCError(10)
+        wrapped = stats.wrap('foo', foo)
+        self.assertRaises(RPCError, wrapped)
+        self.assertEqual({'10': 1}, stats.report()['foo']['faults'])
+
+    def test_wrap_records_other_errors_by_class_name(self):
+        stats = self.makeOne()
+        def foo():
+            raise TypeError()
+        wrapped = stats.wrap('foo', foo)
+        self.assertRaises(TypeError, wrapped)
+        self.assertEqual({'TypeError': 1}, stats.report()['foo']['faults'])
+
+    def test_prometheus_formats_counters_and_histograms(self):
+        stats = self.makeOne()
+        stats.record('foo', 0.002, '10')
+        text = stats.prometheus('twiddler_method', 'method')
+        lines = text.splitlines()
+        self.assertTrue('# TYPE twiddler_method_calls_total counter' in lines)
+        self.assertTrue('twiddler_method_calls_total{method="foo"} 1' in lines)
+        self.assertTrue(
+            'twiddler_method_errors_total{method="foo",error="10"} 1' in lines)
+        self.assertTrue('# TYPE twiddler_method_duration_seconds histogram'
+                        in lines)
+        self.assertTrue('twiddler_method_duration_seconds_bucket'
+                        '{method="foo",le="0.001"} 0' in lines)
+        self.assertTrue('twiddler_method_duration_seconds_bucket'
+                        '{method="foo",le="0.005"} 1' in lines)
+        self.assertTrue('twiddler_method_duration_seconds_bucket'
+                        '{method="foo",le="+Inf"} 1' in lines)
+        self.assertTrue('twiddler_method_duration_seconds_count'
+                        '{method="foo"} 1' in lines)
+        self.assertTrue(text.endswith('\n'))
+
+    def test_prometheus_escapes_label_values(self):
+        stats = self.makeOne()
+        stats.record('a"b\\c', 0.002)
+        text = stats.prometheus('x', 'name')
+        self.assertTrue('x_calls_total{name="a\\"b\\\\c"} 1' in text)
+
+    def makeOne(self, *arg, **kw):
+        from supervisor_twiddler.stats import Stats
+        return Stats(*arg, **kw)
+
+def test_suite():
+    return unittest.findTestCases(sys.modules[__name__])
+
+if __name__ == '__main__':
+    unittest.main(defaultTest='test_suite')